@@ -51,8 +51,8 @@ db.createCollection("trainings", {
           description: "User ID must be a string and is required"
         },
         date: {
-          bsonType: "string",
-          description: "Date must be a string and is required"
+          bsonType: ["string", "date"],
+          description: "Date must be a string or a date and is required"
         },
         type: {
           bsonType: "string",
@@ -69,12 +69,25 @@ db.createCollection("trainings", {
 });
 
 db.createCollection("friends");
+db.createCollection("training_rollups");
+db.createCollection("leaderboard_archive");
 
-// Stwórz indeksy dla lepszej wydajności
+// Stwórz indeksy dla lepszej wydajności (deklaracja źródłowa: src/indexes.py - aplikacja
+// tworzy brakujące indeksy przy starcie i przed importem)
 db.users.createIndex({ "username": 1 }, { unique: true });
 db.users.createIndex({ "email": 1 }, { unique: true });
-db.trainings.createIndex({ "user_id": 1, "date": -1 });
+// _id na końcu: stabilna paginacja keyset historii (kilka treningów tego samego dnia)
+db.trainings.createIndex({ "user_id": 1, "date": -1, "_id": -1 });
 db.trainings.createIndex({ "type": 1 });
-db.friends.createIndex({ "user_id": 1 });
+// Ostatni trening każdego typu (menu opcja 11), okno po typie - _id jak w sortowaniu $lookup
+db.trainings.createIndex({ "user_id": 1, "type": 1, "date": -1, "_id": -1 });
+// Eksport tygodni i retencja time-series - zakres dat w kolejności dat
+db.trainings.createIndex({ "date": 1, "_id": 1 });
+db.friends.createIndex({ "user_id": 1 }, { unique: true });
+db.training_rollups.createIndex({ "user_id": 1, "period": 1, "period_key": 1, "type": 1 }, { unique: true });
+db.leaderboard_archive.createIndex({ "period": 1, "period_key": 1, "metric": 1, "type": 1 }, { unique: true });
+// Usunięcie konta: pozycje użytkownika w archiwum rankingów i znaczniki policzonych treningów
+db.leaderboard_archive.createIndex({ "entries.user_id": 1 });
+db.training_stats_applied.createIndex({ "user_id": 1 });
 
 print("MongoDB initialization completed for Training Diary!");
\ No newline at end of file
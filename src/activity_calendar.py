@@ -0,0 +1,116 @@
+import struct
+from datetime import date, datetime, timedelta
+
+# Kalendarz aktywności: bitmapa w Redis, bit N = dzień ACTIVITY_EPOCH + N dni.
+# Bitmapa jest zamieniana na liczbę całkowitą Pythona, więc serie i liczniki
+# liczone są operacjami na słowach maszynowych (O(dni/64)), a nie dzień po dniu.
+ACTIVITY_EPOCH = date(2000, 1, 1)
+
+# Redis numeruje bity od najstarszego bitu bajtu - odwracamy kolejność w każdym bajcie
+_REVERSE_BITS = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+_FULL_WORD = (1 << 64) - 1
+
+def activity_key(user_id):
+    return f"user:{user_id}:activity"
+
+def to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def day_number(value):
+    """Numer dnia (offset bitu) dla daty 'RRRR-MM-DD'; -1 dla dat sprzed ACTIVITY_EPOCH"""
+    days = (to_date(value) - ACTIVITY_EPOCH).days
+    return days if days >= 0 else -1
+
+def day_from_number(number):
+    return ACTIVITY_EPOCH + timedelta(days=number)
+
+def bitmap_to_int(data):
+    """Bajty bitmapy z Redis -> int, w którym bit N odpowiada dniu N"""
+    if not data:
+        return 0
+    return int.from_bytes(data.translate(_REVERSE_BITS), "little")
+
+def int_to_bitmap(bits):
+    """Odwrotność bitmap_to_int - bajty gotowe do SET w Redis"""
+    if not bits:
+        return b""
+    length = (bits.bit_length() + 7) // 8
+    return bits.to_bytes(length, "little").translate(_REVERSE_BITS)
+
+def count_days(bits, first_day, last_day):
+    """Liczba dni treningowych w zakresie [first_day, last_day]"""
+    if last_day < first_day or last_day < 0:
+        return 0
+    first_day = max(first_day, 0)
+    window = (bits >> first_day) & ((1 << (last_day - first_day + 1)) - 1)
+    return bin(window).count("1")
+
+def run_ending_at(bits, day):
+    """Długość ciągu kolejnych dni treningowych kończącego się w dniu `day`"""
+    if day < 0 or not (bits >> day) & 1:
+        return 0
+    mask = (1 << (day + 1)) - 1
+    gaps = ~bits & mask
+    return day - (gaps.bit_length() - 1)
+
+def _word_longest_run(word):
+    """Najdłuższy ciąg jedynek w jednym słowie 64-bitowym (najwyżej 64 przesunięcia)"""
+    length = 0
+    while word:
+        word &= word >> 1
+        length += 1
+    return length
+
+def longest_run(bits):
+    """Najdłuższy ciąg jedynek - jedno przejście po 64-bitowych słowach bitmapy. Ciąg przechodzący
+    przez granice słów to jedynki na górze słowa, pełne słowa i jedynki na dole kolejnego słowa."""
+    best = current = 0
+    data = bits.to_bytes((bits.bit_length() + 63) // 64 * 8, "little")
+    for (word,) in struct.iter_unpack("<Q", data):
+        if word == _FULL_WORD:
+            current += 64
+            continue
+        # Jedynki od najmłodszego bitu domykają ciąg z poprzednich słów
+        best = max(best, current + (~word & (word + 1)).bit_length() - 1, _word_longest_run(word))
+        # Jedynki od najstarszego bitu zaczynają ciąg, który może trwać w kolejnych słowach
+        current = 64 - (~word & _FULL_WORD).bit_length()
+    return max(best, current)
+
+def current_streak(bits, today=None):
+    """Aktualna seria: ciąg kończący się dziś lub wczoraj (inaczej seria jest przerwana)"""
+    today_number = day_number(today or date.today())
+    return run_ending_at(bits, today_number) or run_ending_at(bits, today_number - 1)
+
+def streak_summary(bits, today=None):
+    return {
+        "current": current_streak(bits, today),
+        "best": longest_run(bits)
+    }
+
+def training_days(bits, year):
+    """Lista dat treningowych w danym roku (dane do heatmapy)"""
+    first = day_number(date(year, 1, 1))
+    last = day_number(date(year, 12, 31))
+    if last < 0:
+        return []
+    first = max(first, 0)
+    window = (bits >> first) & ((1 << (last - first + 1)) - 1)
+    days = []
+    while window:
+        low = window & -window
+        days.append(day_from_number(first + low.bit_length() - 1))
+        window ^= low
+    return days
+
+def monthly_counts(bits, year):
+    """Liczba dni treningowych w każdym miesiącu roku: {1: n, ..., 12: n}"""
+    counts = {}
+    for month in range(1, 13):
+        first = date(year, month, 1)
+        next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        counts[month] = count_days(bits, day_number(first), day_number(next_month) - 1)
+    return counts
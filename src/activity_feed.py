@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import activity_calendar
+import diary_queries
+
+# Aktywność znajomych ("co ostatnio trenowali moi znajomi") - fan-out przy zapisie.
+# add_training dopisuje krótki wpis na początek listy feed:{id} każdego znajomego autora
+# (LPUSH + LTRIM, jeden skrypt Lua), więc odczyt strony to jeden LRANGE, niezależnie od
+# liczby znajomych. Każdy użytkownik ma też własną listę ostatnich treningów feed:out:{id}.
+#
+# Użytkownicy z liczbą znajomych powyżej FEED_FANOUT_LIMIT trafiają do zbioru feed:popular
+# i ich treningi nie są rozsyłane (zbyt wiele zapisów na jeden trening) - czytelnik dokleja
+# przy odczycie ich listy feed:out (fan-out przy odczycie), w tym samym skrypcie Lua.
+#
+# Wpis: "<ms:13>|<id treningu>|<user_id>|<json>" - stała szerokość czasu sprawia, że porządek
+# tekstowy wpisów jest porządkiem czasowym (scalanie list w Lua bez dekodowania JSON).
+# Feed można w całości odbudować z MongoDB (rebuild_redis_state.py).
+#
+# Tylko pojedynczy węzeł Redis: skrypty fan-outu, odczytu strony i usuwania składają klucze feedów
+# znajomych z prefiksu (ARGV) i listy znajomych odczytanej w skrypcie - nie da się ich przekazać
+# w KEYS bez dodatkowego round tripu i utraty atomowości. W Redis Cluster feedy różnych
+# użytkowników są w różnych slotach, więc takie skrypty nie mogą tam działać.
+
+FEED_PREFIX = "feed:"
+OUTBOX_PREFIX = "feed:out:"
+POPULAR_KEY = "feed:popular"
+FEED_LENGTH = int(os.environ.get("FEED_LENGTH", 100))
+FEED_FANOUT_LIMIT = int(os.environ.get("FEED_FANOUT_LIMIT", 500))
+
+def feed_key(user_id):
+    return f"{FEED_PREFIX}{user_id}"
+
+def outbox_key(user_id):
+    return f"{OUTBOX_PREFIX}{user_id}"
+
+# === WPISY ===
+def make_entry(training, timestamp_ms=None):
+    """Krótki wpis feedu dla treningu (typ, data i główne metryki)"""
+    metrics = training.get("metrics") or {}
+    payload = {
+        "t": training.get("type"),
+        "d": activity_calendar.to_date(training["date"]).isoformat(),
+        "min": metrics.get("duration_min"),
+        "kcal": metrics.get("calories_burned"),
+        "km": metrics.get("distance_km"),
+    }
+    payload = {k: v for k, v in payload.items() if v is not None}
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    return (f"{timestamp_ms:013d}|{training['_id']}|{training['user_id']}|"
+            f"{json.dumps(payload, ensure_ascii=False, separators=(',', ':'))}")
+
+def rebuilt_timestamp(training, position=0):
+    """Czas wpisu odbudowanego z MongoDB: południe dnia treningu (UTC), kolejne treningi
+    tego samego dnia o milisekundę wcześniej - porządek jak w historii"""
+    day = activity_calendar.to_date(training["date"])
+    noon = datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc)
+    return int(noon.timestamp() * 1000) - position
+
+def parse_entry(entry):
+    timestamp, training_id, user_id, payload = entry.split("|", 3)
+    data = json.loads(payload)
+    return {
+        "training_id": training_id,
+        "user_id": user_id,
+        "type": data.get("t"),
+        "date": data.get("d"),
+        "duration_min": data.get("min"),
+        "calories_burned": data.get("kcal"),
+        "distance_km": data.get("km"),
+        "logged_at": datetime.fromtimestamp(int(timestamp) / 1000),
+    }
+
+# === SKRYPTY LUA ===
+# Scalanie list wpisów: malejąco po czasie, bez powtórzeń treningu, najwyżej `limit` wpisów
+_MERGE_FUNCTION = """
+local function merge(lists, limit)
+    local entries = {}
+    for _, list in ipairs(lists) do
+        for _, entry in ipairs(list) do
+            entries[#entries + 1] = entry
+        end
+    end
+    table.sort(entries, function(a, b) return a > b end)
+    local seen, unique = {}, {}
+    for _, entry in ipairs(entries) do
+        local id = string.match(entry, '^%d+|([^|]*)|')
+        if not seen[id] and #unique < limit then
+            seen[id] = true
+            unique[#unique + 1] = entry
+        end
+    end
+    return unique
+end
+"""
+
+# KEYS: zbiór znajomych autora, feed:out autora, feed:popular
+# ARGV: wpis, długość list, limit fan-outu, prefiks feedów, user_id autora
+# Zwraca liczbę feedów, do których trafił wpis (ujemną, gdy autor jest "popularny")
+FEED_FANOUT_SCRIPT = """
+local length = tonumber(ARGV[2])
+redis.call('LPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], 0, length - 1)
+local count = redis.call('SCARD', KEYS[1])
+if count > tonumber(ARGV[3]) then
+    redis.call('SADD', KEYS[3], ARGV[5])
+    return -count
+end
+local friends = redis.call('SMEMBERS', KEYS[1])
+for _, friend in ipairs(friends) do
+    local key = ARGV[4] .. friend
+    redis.call('LPUSH', key, ARGV[1])
+    redis.call('LTRIM', key, 0, length - 1)
+end
+return #friends
+"""
+FEED_FANOUT_SHA = hashlib.sha1(FEED_FANOUT_SCRIPT.encode("utf-8")).hexdigest()
+
+# KEYS: feed czytelnika, zbiór jego znajomych, feed:popular, hash nazw użytkowników
+# ARGV: offset, limit, prefiks feed:out
+# Bez popularnych znajomych: jeden LRANGE strony. Z popularnymi: początek feedu i ich list
+# feed:out scalone w skrypcie. Zwraca płaską listę [wpis, nazwa autora, ...].
+FEED_PAGE_SCRIPT = _MERGE_FUNCTION + """
+local offset = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local popular = redis.call('SINTER', KEYS[2], KEYS[3])
+local entries
+if #popular == 0 then
+    entries = redis.call('LRANGE', KEYS[1], offset, offset + limit - 1)
+else
+    local lists = {redis.call('LRANGE', KEYS[1], 0, offset + limit - 1)}
+    for _, user_id in ipairs(popular) do
+        lists[#lists + 1] = redis.call('LRANGE', ARGV[3] .. user_id, 0, offset + limit - 1)
+    end
+    local merged = merge(lists, offset + limit)
+    entries = {}
+    for i = offset + 1, #merged do
+        entries[#entries + 1] = merged[i]
+    end
+end
+local result = {}
+for _, entry in ipairs(entries) do
+    result[#result + 1] = entry
+    result[#result + 1] = redis.call('HGET', KEYS[4], string.match(entry, '^%d+|[^|]*|([^|]*)|')) or ''
+end
+return result
+"""
+
+# KEYS: feed docelowy, listy źródłowe (feed:out znajomych)
+# ARGV: długość feedu, "1" = zastąp feed (odbudowa), "0" = scal z istniejącym (nowy znajomy)
+FEED_MERGE_SCRIPT = _MERGE_FUNCTION + """
+local length = tonumber(ARGV[1])
+local lists = {}
+if ARGV[2] ~= '1' then
+    lists[1] = redis.call('LRANGE', KEYS[1], 0, length - 1)
+end
+for i = 2, #KEYS do
+    lists[#lists + 1] = redis.call('LRANGE', KEYS[i], 0, length - 1)
+end
+local merged = merge(lists, length)
+redis.call('DEL', KEYS[1])
+if #merged > 0 then
+    redis.call('RPUSH', KEYS[1], unpack(merged))
+end
+return #merged
+"""
+FEED_MERGE_SHA = hashlib.sha1(FEED_MERGE_SCRIPT.encode("utf-8")).hexdigest()
+
+# KEYS: zbiór znajomych autora, feed:out autora
+# ARGV: prefiks feedów, user_id autora, id treningów (brak = wszystkie wpisy autora)
+# Usuwa wpisy autora z jego listy feed:out i z feedów znajomych (usuwanie danych).
+# Zwraca liczbę usuniętych wpisów.
+FEED_PURGE_SCRIPT = """
+local ids = {}
+for i = 3, #ARGV do
+    ids[ARGV[i]] = true
+end
+local all = #ARGV < 3
+local lists = {KEYS[2]}
+for _, friend in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    lists[#lists + 1] = ARGV[1] .. friend
+end
+local removed = 0
+for _, key in ipairs(lists) do
+    for _, entry in ipairs(redis.call('LRANGE', key, 0, -1)) do
+        local id, author = string.match(entry, '^%d+|([^|]*)|([^|]*)|')
+        if author == ARGV[2] and (all or ids[id]) then
+            removed = removed + redis.call('LREM', key, 0, entry)
+        end
+    end
+end
+return removed
+"""
+FEED_PURGE_SHA = hashlib.sha1(FEED_PURGE_SCRIPT.encode("utf-8")).hexdigest()
+
+# === WYWOŁANIA ===
+def fan_out_call(training, timestamp_ms=None):
+    user_id = str(training["user_id"])
+    keys = [diary_queries.friends_key(user_id), outbox_key(user_id), POPULAR_KEY]
+    args = [make_entry(training, timestamp_ms), FEED_LENGTH, FEED_FANOUT_LIMIT, FEED_PREFIX, user_id]
+    return keys, args
+
+def queue_fan_out(pipe, trainings):
+    """Fan-out wielu treningów w pipeline: SCRIPT LOAD na początku, więc EVALSHA nie trafi
+    na brak skryptu - całość w jednym round tripie. Treningi paczki dostają kolejne
+    milisekundy w porządku dat, więc najnowszy trening jest na początku feedu."""
+    pipe.script_load(FEED_FANOUT_SCRIPT)
+    now = int(time.time() * 1000)
+    ordered = sorted(trainings, key=lambda t: (activity_calendar.to_date(t["date"]), str(t["_id"])))
+    for i, training in enumerate(ordered):
+        keys, args = fan_out_call(training, now - len(ordered) + 1 + i)
+        pipe.evalsha(FEED_FANOUT_SHA, len(keys), *keys, *args)
+
+def queue_rebuild_feed(pipe, user_id, friend_ids, popular):
+    """Zastąp feed użytkownika scaleniem list feed:out jego znajomych (bez popularnych).
+    Pipeline musi wcześniej załadować FEED_MERGE_SCRIPT (SCRIPT LOAD)."""
+    keys = [feed_key(user_id)] + [outbox_key(f) for f in friend_ids if str(f) not in popular]
+    pipe.evalsha(FEED_MERGE_SHA, len(keys), *keys, FEED_LENGTH, "1")
+
+def feed_page_call(user_id, offset=0, limit=20):
+    user_id = str(user_id)
+    keys = [feed_key(user_id), diary_queries.friends_key(user_id), POPULAR_KEY, diary_queries.USERNAMES_KEY]
+    return keys, [offset, limit, OUTBOX_PREFIX]
+
+def backfill_calls(user_id, friend_id, popular=()):
+    """Scalenie ostatnich treningów nowego znajomego z feedem (w obie strony); autorzy
+    z `popular` (członkowie feed:popular) są pomijani - ich treningi są doklejane przy odczycie"""
+    popular = {str(p) for p in popular}
+    return [
+        ([feed_key(reader), outbox_key(author)], [FEED_LENGTH, "0"])
+        for reader, author in ((str(user_id), str(friend_id)), (str(friend_id), str(user_id)))
+        if author not in popular
+    ]
+
+def purge_call(user_id, training_ids=()):
+    """Usunięcie wpisów autora z feedów; bez `training_ids` - wszystkich (usunięcie konta)"""
+    user_id = str(user_id)
+    keys = [diary_queries.friends_key(user_id), outbox_key(user_id)]
+    return keys, [FEED_PREFIX, user_id, *(str(t) for t in training_ids)]
+
+def split_feed_raw(raw):
+    """Płaska lista [wpis, nazwa, ...] -> wpisy i nazwy znalezione w hashu"""
+    items = [parse_entry(raw[i]) for i in range(0, len(raw), 2)]
+    cached = {item["user_id"]: raw[i * 2 + 1] for i, item in enumerate(items)}
+    return items, cached
+
+def feed_page(items, names, offset, limit):
+    for item in items:
+        item["username"] = names.get(item["user_id"], item["user_id"])
+    return {"items": items, "offset": offset, "next": offset + limit if len(items) == limit else None}
@@ -0,0 +1,80 @@
+import argparse
+import statistics
+import time
+
+import cardio_intensity
+from training_diary import trainings_col
+
+# Porównanie trzech ścieżek liczenia intensywności cardio:
+#  - legacy:  $function z JavaScriptem (poprzednia implementacja)
+#  - native:  $switch liczony przy każdym odczycie
+#  - stored:  odczyt zapisanego pola intensity_description (projekcja)
+
+LEGACY_FUNCTION_BODY = """
+function(type, metrics) {
+    if (!metrics || !type) return null;
+    if (type === 'bieganie' && metrics.distance_km && metrics.duration_min) {
+        const kmph = (metrics.distance_km / (metrics.duration_min / 60));
+        if (kmph < 7) return 'niskie tempo';
+        else if (kmph < 11) return 'umiarkowane tempo';
+        else return 'wysokie tempo';
+    }
+    if (type === 'rower' && metrics.avg_speed_kmh) {
+        if (metrics.avg_speed_kmh < 15) return 'wolna jazda';
+        else if (metrics.avg_speed_kmh < 25) return 'umiarkowane tempo';
+        else return 'szybka jazda';
+    }
+    if (type === 'pływanie' && metrics.laps && metrics.pool_length_m && metrics.duration_min) {
+        const mpm = (metrics.laps * metrics.pool_length_m) / metrics.duration_min;
+        if (mpm < 15) return 'spokojne tempo';
+        else if (mpm < 30) return 'średnie tempo';
+        else return 'intensywne pływanie';
+    }
+    return 'brak danych';
+}
+"""
+
+def build_pipelines(match):
+    return {
+        "legacy": [
+            {"$match": match},
+            {"$addFields": {"intensity_description": {
+                "$function": {"body": LEGACY_FUNCTION_BODY, "args": ["$type", "$metrics"], "lang": "js"}
+            }}}
+        ],
+        "native": [
+            {"$match": match},
+            {"$project": {"type": 1, "date": 1, "intensity_description": cardio_intensity.intensity_expression()}}
+        ],
+        "stored": [
+            {"$match": match},
+            {"$project": {"type": 1, "date": 1, "intensity_description": 1}}
+        ],
+    }
+
+def run(user_id=None, repeats=20):
+    match = {"type": {"$in": cardio_intensity.CARDIO_TYPES}}
+    if user_id:
+        match["user_id"] = user_id
+    results = {}
+    for name, pipeline in build_pipelines(match).items():
+        timings = []
+        try:
+            for _ in range(repeats):
+                started = time.perf_counter()
+                count = sum(1 for _ in trainings_col.aggregate(pipeline))
+                timings.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            # Np. klaster z wyłączonym JavaScriptem po stronie serwera
+            print(f"{name:>7}: niedostępne ({e})")
+            continue
+        results[name] = {"docs": count, "median_ms": statistics.median(timings), "max_ms": max(timings)}
+        print(f"{name:>7}: {count} dok. | mediana {results[name]['median_ms']:.1f} ms | max {results[name]['max_ms']:.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark: $function (JS) vs natywne $switch vs zapisane pole")
+    parser.add_argument("--user", default=None, help="ograniczenie do jednego użytkownika")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    run(args.user, args.repeats)
@@ -0,0 +1,62 @@
+import argparse
+import statistics
+import time
+
+import passwords
+from training_diary import (users_col, register_user, login, authenticate, logout, revoke_sessions,
+                            verify_credentials)
+
+# Koszt uwierzytelnienia: pełne logowanie (MongoDB + scrypt + utworzenie sesji)
+# w porównaniu z weryfikacją tokenu przy każdym wywołaniu (jeden round trip do Redis)
+# i z odczytem profilu z MongoDB, który sesja zastępuje.
+
+BENCH_USER = "benchmark_session_user"
+BENCH_EMAIL = "benchmark_session_user@example.com"
+BENCH_PASSWORD = "benchmark-password"
+
+def measure(name, func, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    result = {
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "per_second": 1000 / statistics.mean(timings)
+    }
+    print(f"{name:>22}: mediana {result['median_ms']:.3f} ms | p95 {result['p95_ms']:.3f} ms | "
+          f"{result['per_second']:.0f} /s")
+    return result
+
+def run(login_repeats=20, auth_repeats=2000):
+    register_user(BENCH_USER, BENCH_EMAIL, BENCH_PASSWORD, 30, "other")
+    session = login(BENCH_EMAIL, BENCH_PASSWORD)
+    if not session["token"]:
+        print("Redis niedostępny - sesje nie działają")
+        return None
+    stored_hash = users_col.find_one({"_id": session["user_id"]})["password_hash"]
+    results = {}
+    try:
+        results["scrypt"] = measure("weryfikacja hasła", lambda: passwords.verify_password(BENCH_PASSWORD, stored_hash),
+                                    login_repeats)
+        results["credentials"] = measure("MongoDB + hasło", lambda: verify_credentials(BENCH_EMAIL, BENCH_PASSWORD),
+                                         login_repeats)
+        results["login"] = measure("login (nowa sesja)", lambda: logout(login(BENCH_EMAIL, BENCH_PASSWORD)["token"]),
+                                   login_repeats)
+        results["authenticate"] = measure("token (Redis)", lambda: authenticate(session["token"]), auth_repeats)
+        results["mongo_profile"] = measure("profil z MongoDB",
+                                           lambda: users_col.find_one({"_id": session["user_id"]}, {"username": 1}),
+                                           auth_repeats)
+    finally:
+        revoke_sessions(session["user_id"])
+        users_col.delete_one({"_id": session["user_id"]})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark: koszt logowania i uwierzytelnienia tokenem sesji")
+    parser.add_argument("--login-repeats", type=int, default=20)
+    parser.add_argument("--auth-repeats", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.login_repeats, args.auth_repeats)
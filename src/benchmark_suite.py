@@ -0,0 +1,451 @@
+import argparse
+import asyncio
+import contextlib
+import glob
+import importlib.util
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Benchmark gorących ścieżek dziennika na danych z generatora.
+# Dane trafiają do osobnej bazy (domyślnie training_diary_bench) i osobnej bazy Redis
+# (domyślnie 15), więc benchmark nie rusza danych aplikacji. Wyniki (percentyle opóźnień
+# i przepustowość per operacja) są zapisywane jako JSON i można je porównać między przebiegami.
+# Mierzone są korutyny diary_service.py, z których korzysta menu (--path service), albo te same
+# operacje przez synchroniczne opakowania training_diary.py (--path sync: diary_service.run).
+#
+#   python benchmark_suite.py --scale 10 10k                    # seed + pomiar
+#   python benchmark_suite.py --scale 10k --skip-seed --concurrent --threads 16
+#   python benchmark_suite.py --scale 10k --skip-seed --path sync
+#   python benchmark_suite.py --compare wyniki_a.json wyniki_b.json
+
+# Liczba treningów = users * days (activity_rate 1.0)
+SCALES = {
+    "10": {"users": 1, "days": 10},
+    "10k": {"users": 100, "days": 100},
+    "1M": {"users": 2000, "days": 500},
+}
+DEFAULT_DATABASE = "training_diary_bench"
+DEFAULT_REDIS_DB = 15
+GENERATOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "document generation script.py")
+
+# === KONFIGURACJA ===
+def configure(database, redis_db, in_process=False):
+    """Ustaw bazę benchmarku przed pierwszym połączeniem (connections czyta konfigurację leniwie)"""
+    import connections
+    if database == "training_diary":
+        raise SystemExit("Benchmark czyści swoją bazę - użyj innej niż training_diary")
+    os.environ["MONGODB_DATABASE"] = database
+    redis_url = connections.load_settings()["redis_url"].rsplit("/", 1)[0]
+    os.environ["REDIS_CONNECTION_STRING"] = f"{redis_url}/{redis_db}"
+    connections.reset()
+    if in_process:
+        install_in_process_stand_ins()
+
+def install_in_process_stand_ins():
+    """mongomock + fakeredis zamiast serwerów (bez transakcji, $merge i części operatorów -
+    operacje, których nie obsługują, są raportowane jako błędy). Klienci asynchroniczni
+    diary_service.py dostają nakładki na te same dane."""
+    import connections
+    import fakeredis
+    import fakeredis.aioredis
+    import mongomock
+    import diary_service
+
+    class InProcessSession:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def start_transaction(self):
+            return contextlib.nullcontext()
+
+        def commit_transaction(self):
+            pass
+
+        def with_transaction(self, callback):
+            return callback(self)
+
+    class InProcessClient(mongomock.MongoClient):
+        def start_session(self, **kwargs):
+            return InProcessSession()
+
+    class AsyncSession:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def start_transaction(self):
+            return self
+
+        async def with_transaction(self, callback):
+            return await callback(self)
+
+    class AsyncCursor:
+        def __init__(self, cursor):
+            self.cursor = cursor
+
+        def sort(self, *args, **kwargs):
+            self.cursor = self.cursor.sort(*args, **kwargs)
+            return self
+
+        def limit(self, count):
+            self.cursor = self.cursor.limit(count)
+            return self
+
+        def batch_size(self, size):
+            return self
+
+        async def to_list(self, length=None):
+            return list(self.cursor)
+
+        async def __aiter__(self):
+            for doc in self.cursor:
+                yield doc
+
+    class AsyncCollection:
+        def __init__(self, collection):
+            self.collection = collection
+            self.name = collection.name
+
+        def find(self, *args, session=None, **kwargs):
+            return AsyncCursor(self.collection.find(*args, **kwargs))
+
+        async def aggregate(self, pipeline, session=None, **kwargs):
+            return AsyncCursor(self.collection.aggregate(pipeline, **kwargs))
+
+        def __getattr__(self, name):
+            method = getattr(self.collection, name)
+
+            async def call(*args, session=None, **kwargs):
+                return method(*args, **kwargs)
+            return call
+
+    class AsyncClient:
+        def __init__(self, client):
+            self.client = client
+
+        def __getitem__(self, name):
+            database = self.client[name]
+            return type("AsyncDatabase", (), {"__getitem__": lambda _, c: AsyncCollection(database[c])})()
+
+        def start_session(self, **kwargs):
+            return AsyncSession()
+
+    mongomock.ignore_feature("session")
+    server = fakeredis.FakeServer()
+    connections._clients["mongo"] = InProcessClient()
+    connections._clients["redis"] = fakeredis.FakeRedis(server=server, decode_responses=True)
+    connections._clients["async_mongo"] = AsyncClient(connections._clients["mongo"])
+    connections._clients["async_redis"] = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    diary_service._trainings_layout = "collection"
+
+def load_generator():
+    spec = importlib.util.spec_from_file_location("document_generation_script", GENERATOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# === DANE ===
+def seed(scale, workdir, data_seed=0):
+    """Wyczyść bazę benchmarku, wygeneruj dane w danej skali i zaimportuj je (z Redis i rollupami)"""
+    import connections
+    import import_of_documents
+    import indexes
+    import rebuild_redis_state
+    import training_diary
+
+    params = SCALES[scale]
+    out_dir = os.path.join(workdir, scale)
+    started = time.perf_counter()
+    # Generator jako osobny proces - korzysta z multiprocessing, a jego plik nie jest importowalnym modułem
+    subprocess.run([sys.executable, GENERATOR_PATH, "--users", str(params["users"]), "--days", str(params["days"]),
+                    "--seed", str(data_seed), "--out", out_dir], check=True)
+
+    db = connections.get_database()
+    for name in indexes.INDEXES:
+        db[name].drop()
+    indexes.ensure_indexes(db, quiet=True)
+    redis_client = connections.get_redis()
+    if redis_client:
+        redis_client.flushdb()
+
+    def files(prefix):
+        return sorted(glob.glob(os.path.join(out_dir, f"{prefix}-*.ndjson")))
+
+    import_of_documents.run_import(files("users"), files("trainings"), files("friends"),
+                                   checkpoint_path=os.path.join(out_dir, "import_checkpoint.json"))
+    try:
+        training_diary.rebuild_rollups()
+    except Exception as e:
+        print(f"Rollupy niedostępne: {e}")
+    if redis_client:
+        rebuild_redis_state.rebuild_all()
+    print(f"Dane {scale} gotowe w {time.perf_counter() - started:.1f} s")
+
+def user_ids(scale, data_seed=0):
+    generator = load_generator()
+    return [generator.user_id_for(data_seed, i) for i in range(SCALES[scale]["users"])]
+
+# === OPERACJE ===
+def sample_training(rng):
+    training_type = rng.choice(["bieganie", "rower", "yoga", "siłownia"])
+    metrics = {"duration_min": rng.randint(20, 90), "calories_burned": rng.randint(100, 800)}
+    if training_type == "bieganie":
+        metrics["distance_km"] = round(rng.uniform(3, 15), 2)
+    elif training_type == "rower":
+        metrics["avg_speed_kmh"] = round(rng.uniform(12, 32), 1)
+    return {"type": training_type, "date": datetime.now().strftime("%Y-%m-%d"), "metrics": metrics}
+
+def operations():
+    """Operacje menu (main_menu) w wersji bez wejścia z klawiatury - korutyny diary_service.py:
+    nazwa -> funkcja(user_id, rng) zwracająca korutynę"""
+    import diary_service as ds
+    return {
+        "add_training": lambda uid, rng: ds.add_training(uid, sample_training(rng)),
+        "get_training_history_page": lambda uid, rng: ds.get_training_history_page(uid),
+        "get_user_rollup_summary": lambda uid, rng: ds.get_user_rollup_summary(uid),
+        "list_friends": lambda uid, rng: ds.list_friends(uid),
+        "get_cardio_intensity_description": lambda uid, rng: ds.get_cardio_intensity_description(uid),
+        "get_training_durations_with_previous": lambda uid, rng: ds.get_training_durations_with_previous(uid),
+        "get_latest_duration_per_type": lambda uid, rng: ds.get_latest_duration_per_type(uid),
+        "get_user_streak": lambda uid, rng: ds.get_user_streak(uid),
+        "get_calories_leaderboard": lambda uid, rng: ds.get_calories_leaderboard(),
+        "get_training_reminder": lambda uid, rng: ds.get_training_reminder(uid),
+        "get_friends_calories_leaderboard": lambda uid, rng: ds.get_friends_calories_leaderboard(uid),
+    }
+
+def sync_operations():
+    """Te same operacje tak, jak wywołują je synchroniczne opakowania training_diary.py (diary_service.run)"""
+    import diary_service
+
+    def sync(operation):
+        return lambda uid, rng: diary_service.run(operation(uid, rng))
+    return {name: sync(operation) for name, operation in operations().items()}
+
+def summarize(timings, elapsed=None):
+    """Percentyle opóźnień (ms) i przepustowość (operacje/s)"""
+    ordered = sorted(timings)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    total_s = elapsed if elapsed is not None else sum(ordered) / 1000
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.mean(ordered),
+        "p50_ms": pct(50),
+        "p90_ms": pct(90),
+        "p99_ms": pct(99),
+        "max_ms": ordered[-1],
+        "ops_per_s": len(ordered) / total_s if total_s else 0.0,
+    }
+
+def run_operations(ids, iterations, rng):
+    results = {}
+    for name, operation in sync_operations().items():
+        timings = []
+        try:
+            for _ in range(iterations):
+                uid = rng.choice(ids)
+                started = time.perf_counter()
+                operation(uid, rng)
+                timings.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        results[name] = summarize(timings)
+    return results
+
+async def run_operations_async(ids, iterations, rng):
+    results = {}
+    for name, operation in operations().items():
+        timings = []
+        try:
+            for _ in range(iterations):
+                uid = rng.choice(ids)
+                started = time.perf_counter()
+                await operation(uid, rng)
+                timings.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        results[name] = summarize(timings)
+    return results
+
+def concurrent_results(timings, errors, elapsed):
+    results = {name: summarize(values, elapsed) for name, values in timings.items() if values}
+    results["_total"] = summarize([ms for values in timings.values() for ms in values], elapsed)
+    for name, error in errors.items():
+        results.setdefault(name, {})["error"] = error
+    return results
+
+def run_concurrent(ids, simulated_users, ops_per_user, threads, data_seed=0):
+    """Wielu symulowanych użytkowników wykonuje losowe operacje menu w puli wątków"""
+    ops = sync_operations()
+    names = list(ops)
+    timings = {name: [] for name in names}
+    errors = {}
+    lock = threading.Lock()
+
+    def session(index):
+        rng = random.Random(f"user:{data_seed}:{index}")
+        uid = ids[index % len(ids)]
+        local = []
+        for _ in range(ops_per_user):
+            name = rng.choice(names)
+            started = time.perf_counter()
+            try:
+                ops[name](uid, rng)
+            except Exception as e:
+                with lock:
+                    errors[name] = f"{type(e).__name__}: {e}"
+                continue
+            local.append((name, (time.perf_counter() - started) * 1000))
+        with lock:
+            for name, ms in local:
+                timings[name].append(ms)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(session, range(simulated_users)))
+    return concurrent_results(timings, errors, time.perf_counter() - started)
+
+async def run_concurrent_async(ids, simulated_users, ops_per_user, concurrency, data_seed=0):
+    """Wielu symulowanych użytkowników jako zadania asyncio w jednej pętli; najwyżej `concurrency` naraz"""
+    ops = operations()
+    names = list(ops)
+    timings = {name: [] for name in names}
+    errors = {}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(index):
+        rng = random.Random(f"user:{data_seed}:{index}")
+        uid = ids[index % len(ids)]
+        async with limit:
+            for _ in range(ops_per_user):
+                name = rng.choice(names)
+                started = time.perf_counter()
+                try:
+                    await ops[name](uid, rng)
+                except Exception as e:
+                    errors[name] = f"{type(e).__name__}: {e}"
+                    continue
+                timings[name].append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(index) for index in range(simulated_users)))
+    return concurrent_results(timings, errors, time.perf_counter() - started)
+
+# === WYNIKI ===
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(results, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{results['scale']}-{results['mode']}-"
+                                 f"{results['path']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    return path
+
+def print_results(results):
+    print(f"\n=== {results['scale']} | {results['mode']} | {results['path']} ===")
+    for name, stats in results["operations"].items():
+        if "p50_ms" not in stats:
+            print(f"{name:>38}: {stats.get('error')}")
+            continue
+        print(f"{name:>38}: p50 {stats['p50_ms']:.2f} ms | p90 {stats['p90_ms']:.2f} ms | "
+              f"p99 {stats['p99_ms']:.2f} ms | {stats['ops_per_s']:.0f} op/s")
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')} ({new['scale']}, {new['mode']}, {new.get('path', 'sync')})")
+    if old.get("path", "sync") != new.get("path", "sync"):
+        print(f"Uwaga: różne ścieżki pomiaru ({old.get('path', 'sync')} i {new.get('path', 'sync')})")
+    for name, stats in new["operations"].items():
+        before = old["operations"].get(name, {})
+        if "p50_ms" not in stats or "p50_ms" not in before:
+            continue
+        change = (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100 if before["p50_ms"] else 0.0
+        print(f"{name:>38}: p50 {before['p50_ms']:.2f} -> {stats['p50_ms']:.2f} ms ({change:+.0f}%) | "
+              f"p99 {before['p99_ms']:.2f} -> {stats['p99_ms']:.2f} ms")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark operacji dziennika treningowego")
+    parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=["10"], help="skale danych (treningi)")
+    parser.add_argument("--skip-seed", action="store_true", help="użyj danych z poprzedniego przebiegu")
+    parser.add_argument("--iterations", type=int, default=200, help="powtórzenia każdej operacji")
+    parser.add_argument("--path", choices=["service", "sync"], default="service",
+                        help="korutyny diary_service (jak menu) albo synchroniczne opakowania training_diary")
+    parser.add_argument("--concurrent", action="store_true", help="tryb wielu użytkowników naraz")
+    parser.add_argument("--threads", type=int, default=16,
+                        help="wątki (--path sync) albo równoległe sesje w pętli zdarzeń (--path service)")
+    parser.add_argument("--simulated-users", type=int, default=100)
+    parser.add_argument("--ops-per-user", type=int, default=20)
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="baza MongoDB benchmarku (czyszczona!)")
+    parser.add_argument("--redis-db", type=int, default=DEFAULT_REDIS_DB, help="numer bazy Redis benchmarku")
+    parser.add_argument("--in-process", action="store_true", help="mongomock + fakeredis zamiast serwerów")
+    parser.add_argument("--workdir", default="benchmark_data", help="katalog na wygenerowane dane")
+    parser.add_argument("--out", default="benchmark_results", help="katalog wyników JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cache", action="store_true", help="mierz zapytania bez cache analiz (user_cache.py)")
+    parser.add_argument("--compare", nargs=2, metavar=("STARY", "NOWY"), help="porównaj dwa pliki wyników")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        raise SystemExit(0)
+
+    configure(args.database, args.redis_db, args.in_process)
+    import diary_service
+    if args.no_cache:
+        import user_cache
+        user_cache.ENABLED = False
+    for scale in args.scale:
+        if not args.skip_seed:
+            seed(scale, args.workdir, args.seed)
+        ids = user_ids(scale, args.seed)
+        if args.path == "sync":
+            if args.concurrent:
+                measured = run_concurrent(ids, args.simulated_users, args.ops_per_user, args.threads, args.seed)
+            else:
+                measured = run_operations(ids, args.iterations, random.Random(args.seed))
+        elif args.concurrent:
+            measured = diary_service.run(run_concurrent_async(ids, args.simulated_users, args.ops_per_user,
+                                                              args.threads, args.seed))
+        else:
+            measured = diary_service.run(run_operations_async(ids, args.iterations, random.Random(args.seed)))
+        results = {
+            "scale": scale,
+            "trainings": SCALES[scale]["users"] * SCALES[scale]["days"],
+            "mode": "concurrent" if args.concurrent else "sequential",
+            "path": args.path,
+            "threads": args.threads if args.concurrent else 1,
+            "cache": not args.no_cache,
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "operations": measured,
+        }
+        print_results(results)
+        print(f"Zapisano: {save_results(results, args.out)}")
@@ -0,0 +1,63 @@
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+import training_dates
+from training_diary import db
+
+# Porównanie układów kolekcji treningów: rozmiar na dysku (dane + indeksy)
+# i czas zapytania o zakres dat jednego użytkownika.
+# Typowe użycie - przed i po migracji (migrate_training_dates.py):
+#   python benchmark_training_dates.py --collections trainings trainings_ts
+
+def storage_stats(name):
+    stats = db.command("collStats", name)
+    return {
+        "docs": stats.get("count", 0),
+        "storage_mb": stats.get("storageSize", 0) / 1024 / 1024,
+        "index_mb": stats.get("totalIndexSize", 0) / 1024 / 1024
+    }
+
+def sample_user_ids(name, count):
+    return [doc["_id"] for doc in db[name].aggregate([
+        {"$sample": {"size": count * 10}},
+        {"$group": {"_id": "$user_id"}},
+        {"$limit": count}
+    ])]
+
+def range_query_timings(name, user_ids, days, repeats):
+    date_to = date.today()
+    date_from = date_to - timedelta(days=days)
+    condition = training_dates.range_condition(date_from, date_to)
+    timings = []
+    for _ in range(repeats):
+        for user_id in user_ids:
+            started = time.perf_counter()
+            list(db[name].find({"user_id": user_id, **condition}, {"date": 1, "type": 1, "metrics": 1}))
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def run(collections, users=20, days=90, repeats=5):
+    results = {}
+    user_ids = sample_user_ids(collections[0], users)
+    for name in collections:
+        stats = storage_stats(name)
+        timings = range_query_timings(name, user_ids, days, repeats)
+        stats["median_ms"] = statistics.median(timings) if timings else 0
+        stats["p95_ms"] = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else stats["median_ms"]
+        results[name] = stats
+        print(f"{name:>20}: {stats['docs']} dok. | dane {stats['storage_mb']:.1f} MB | "
+              f"indeksy {stats['index_mb']:.1f} MB | zakres {days} dni: mediana {stats['median_ms']:.1f} ms, "
+              f"p95 {stats['p95_ms']:.1f} ms")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark: rozmiar i zapytania zakresowe dla układów kolekcji treningów")
+    parser.add_argument("--collections", nargs="+", default=["trainings"],
+                        help="kolekcje do porównania (np. trainings trainings_ts)")
+    parser.add_argument("--users", type=int, default=20, help="liczba losowych użytkowników w zapytaniach")
+    parser.add_argument("--days", type=int, default=90, help="długość zakresu dat")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    run(args.collections, args.users, args.days, args.repeats)
@@ -0,0 +1,80 @@
+# Klasyfikacja intensywności treningów cardio.
+# Progi są zdefiniowane raz i służą do zbudowania zarówno funkcji Pythona
+# (zapis w add_training), jak i natywnego wyrażenia agregacji ($switch) -
+# bez JavaScriptu po stronie serwera ($function).
+
+CARDIO_TYPES = ["bieganie", "rower", "pływanie"]
+NO_DATA = "brak danych"
+
+# typ -> (wymagane pola metryk, [(próg, opis), ...], opis powyżej ostatniego progu)
+INTENSITY_THRESHOLDS = {
+    "bieganie": (["distance_km", "duration_min"],
+                 [(7, "niskie tempo"), (11, "umiarkowane tempo")], "wysokie tempo"),
+    "rower": (["avg_speed_kmh"],
+              [(15, "wolna jazda"), (25, "umiarkowane tempo")], "szybka jazda"),
+    "pływanie": (["laps", "pool_length_m", "duration_min"],
+                 [(15, "spokojne tempo"), (30, "średnie tempo")], "intensywne pływanie"),
+}
+
+def _speed(training_type, metrics):
+    """km/h dla biegu i roweru, metry na minutę dla pływania"""
+    if training_type == "bieganie":
+        return metrics["distance_km"] / (metrics["duration_min"] / 60)
+    if training_type == "rower":
+        return metrics["avg_speed_kmh"]
+    return metrics["laps"] * metrics["pool_length_m"] / metrics["duration_min"]
+
+def classify_intensity(training_type, metrics):
+    """Opis intensywności dla treningu cardio; None dla pozostałych typów"""
+    if training_type not in INTENSITY_THRESHOLDS or metrics is None:
+        return None
+    required, thresholds, top = INTENSITY_THRESHOLDS[training_type]
+    if not all(metrics.get(field) for field in required):
+        return NO_DATA
+    speed = _speed(training_type, metrics)
+    for limit, description in thresholds:
+        if speed < limit:
+            return description
+    return top
+
+def _speed_expression(training_type):
+    if training_type == "bieganie":
+        return {"$divide": ["$metrics.distance_km", {"$divide": ["$metrics.duration_min", 60]}]}
+    if training_type == "rower":
+        return "$metrics.avg_speed_kmh"
+    return {"$divide": [{"$multiply": ["$metrics.laps", "$metrics.pool_length_m"]}, "$metrics.duration_min"]}
+
+def intensity_expression():
+    """Natywne wyrażenie agregacji ($switch) równoważne classify_intensity"""
+    branches = []
+    for training_type, (required, thresholds, top) in INTENSITY_THRESHOLDS.items():
+        speed = _speed_expression(training_type)
+        branches.append({
+            "case": {"$and": [{"$eq": ["$type", training_type]}] +
+                             [{"$gt": [f"$metrics.{field}", 0]} for field in required]},
+            "then": {"$let": {
+                "vars": {"speed": speed},
+                "in": {"$switch": {
+                    "branches": [{"case": {"$lt": ["$$speed", limit]}, "then": description}
+                                 for limit, description in thresholds],
+                    "default": top
+                }}
+            }}
+        })
+    return {"$switch": {
+        "branches": branches,
+        "default": {"$cond": [
+            {"$and": [{"$in": ["$type", CARDIO_TYPES]}, {"$eq": [{"$type": "$metrics"}, "object"]}]},
+            NO_DATA,
+            None
+        ]}
+    }}
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Uzupełnienie intensity_description w istniejących treningach")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from training_diary import backfill_cardio_intensity
+    backfill_cardio_intensity(args.batch_size)
@@ -0,0 +1,237 @@
+import argparse
+import os
+import threading
+import time
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+import redis
+from redis.exceptions import RedisError
+
+# Wspólna warstwa połączeń dla training_diary.py, import_of_documents.py i deletion_of_data.py.
+# Klienci MongoDB i Redis powstają leniwie - przy pierwszym użyciu, a nie przy imporcie
+# modułu - więc import nie łączy się z siecią. Adresy, pule połączeń i timeouty są czytane
+# ze zmiennych środowiskowych (nazwy jak w setup/env_template.sh; plik .env w katalogu
+# projektu jest wczytywany, jeśli istnieje).
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_env_file(path=None):
+    """Wczytaj KLUCZ=WARTOŚĆ z pliku .env; zmienne ustawione w środowisku mają pierwszeństwo"""
+    path = path or os.environ.get("ENV_FILE", os.path.join(PROJECT_DIR, ".env"))
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            if key.startswith("export "):
+                key = key[len("export "):].strip()
+            os.environ.setdefault(key, value.strip().strip('"').strip("'"))
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def load_settings():
+    load_env_file()
+    return {
+        "mongo_uri": os.environ.get("MONGODB_CONNECTION_STRING", "mongodb://localhost:27017/?replicaSet=rs0"),
+        "mongo_database": os.environ.get("MONGODB_DATABASE", "training_diary"),
+        "mongo_max_pool_size": _env_int("MONGODB_MAX_POOL_SIZE", 100),
+        "mongo_min_pool_size": _env_int("MONGODB_MIN_POOL_SIZE", 0),
+        "mongo_server_selection_timeout_ms": _env_int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "mongo_connect_timeout_ms": _env_int("MONGODB_CONNECT_TIMEOUT_MS", 5000),
+        "mongo_socket_timeout_ms": _env_int("MONGODB_SOCKET_TIMEOUT_MS", 0) or None,
+        "redis_url": os.environ.get("REDIS_CONNECTION_STRING", "redis://:redis123@localhost:6379/0"),
+        "redis_max_connections": _env_int("REDIS_MAX_CONNECTIONS", 50),
+        "redis_socket_timeout": _env_float("REDIS_SOCKET_TIMEOUT", 5.0),
+        "redis_socket_connect_timeout": _env_float("REDIS_SOCKET_CONNECT_TIMEOUT", 2.0),
+        "redis_health_check_interval": _env_int("REDIS_HEALTH_CHECK_INTERVAL", 30),
+    }
+
+_settings = None
+_clients = {}
+_lock = threading.Lock()
+# Czas tworzenia klientów i pierwszego pingu (ms) - do pomiaru startu aplikacji
+timings = {}
+
+def settings():
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+def _get_or_create(name, factory):
+    client = _clients.get(name, _lock)
+    if client is not _lock:
+        return client
+    with _lock:
+        if name not in _clients:
+            started = time.perf_counter()
+            _clients[name] = factory()
+            timings[name] = (time.perf_counter() - started) * 1000
+        return _clients[name]
+
+def mongo_options():
+    s = settings()
+    return {
+        "maxPoolSize": s["mongo_max_pool_size"],
+        "minPoolSize": s["mongo_min_pool_size"],
+        "serverSelectionTimeoutMS": s["mongo_server_selection_timeout_ms"],
+        "connectTimeoutMS": s["mongo_connect_timeout_ms"],
+        "socketTimeoutMS": s["mongo_socket_timeout_ms"],
+    }
+
+def redis_pool_options():
+    s = settings()
+    return {
+        "max_connections": s["redis_max_connections"],
+        "socket_timeout": s["redis_socket_timeout"],
+        "socket_connect_timeout": s["redis_socket_connect_timeout"],
+        "health_check_interval": s["redis_health_check_interval"],
+        "decode_responses": True,
+    }
+
+# === KLIENCI SYNCHRONICZNI ===
+def get_mongo_client():
+    # connect=False: pula i monitorowanie serwera startują przy pierwszej operacji
+    return _get_or_create("mongo", lambda: MongoClient(settings()["mongo_uri"], connect=False, **mongo_options()))
+
+def get_database():
+    return get_mongo_client()[settings()["mongo_database"]]
+
+def get_redis():
+    """Klient Redis albo None, gdy Redis jest niedostępny (sprawdzane raz, przy pierwszym użyciu)"""
+    def create():
+        pool = redis.ConnectionPool.from_url(settings()["redis_url"], **redis_pool_options())
+        client = redis.Redis(connection_pool=pool)
+        try:
+            started = time.perf_counter()
+            client.ping()
+            timings["redis_ping"] = (time.perf_counter() - started) * 1000
+        except (RedisError, OSError):
+            print("Błąd połączenia z Redis")
+            pool.disconnect()
+            return None
+        return client
+    return _get_or_create("redis", create)
+
+# === KLIENCI ASYNCHRONICZNI (diary_service.py) ===
+def get_async_mongo_client():
+    def create():
+        from pymongo import AsyncMongoClient
+        return AsyncMongoClient(settings()["mongo_uri"], **mongo_options())
+    return _get_or_create("async_mongo", create)
+
+def get_async_database():
+    return get_async_mongo_client()[settings()["mongo_database"]]
+
+def get_async_redis():
+    def create():
+        import redis.asyncio as aioredis
+        pool = aioredis.ConnectionPool.from_url(settings()["redis_url"], **redis_pool_options())
+        return aioredis.Redis(connection_pool=pool)
+    return _get_or_create("async_redis", create)
+
+class Lazy:
+    """Zastępca obiektu tworzonego przy pierwszym użyciu (klient, baza, kolekcja).
+    Moduły trzymają go w zmiennej globalnej, tak jak wcześniej gotowego klienta.
+    Wartość logiczna to "czy obiekt jest dostępny" - dla Redis False, gdy brak połączenia."""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+
+    def _target(self):
+        return self._factory()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __getitem__(self, key):
+        return self._target()[key]
+
+    def __bool__(self):
+        return self._target() is not None
+
+    def __repr__(self):
+        return f"Lazy({self._factory.__name__})"
+
+def collection(name):
+    return Lazy(lambda: get_database()[name])
+
+def async_collection(name):
+    return Lazy(lambda: get_async_database()[name])
+
+def reset():
+    """Zamknij i zapomnij klientów synchronicznych (np. po zmianie konfiguracji)"""
+    global _settings
+    with _lock:
+        for name in ("mongo", "redis"):
+            client = _clients.pop(name, None)
+            if client is not None:
+                client.close()
+        _settings = None
+        timings.clear()
+
+# === HEALTH CHECK ===
+def check_mongo():
+    started = time.perf_counter()
+    try:
+        get_mongo_client().admin.command("ping")
+        return {"ok": True, "latency_ms": (time.perf_counter() - started) * 1000}
+    except PyMongoError as e:
+        return {"ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "error": str(e)}
+
+def check_redis():
+    started = time.perf_counter()
+    client = get_redis()
+    if client is None:
+        return {"ok": False, "latency_ms": 0.0, "error": "brak połączenia"}
+    try:
+        client.ping()
+        return {"ok": True, "latency_ms": (time.perf_counter() - started) * 1000}
+    except (RedisError, OSError) as e:
+        return {"ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "error": str(e)}
+
+def health_check():
+    return {"mongo": check_mongo(), "redis": check_redis()}
+
+def measure_startup(modules=("training_diary",)):
+    """Czas importu modułów aplikacji (bez sieci) i pierwszego połączenia z bazami"""
+    import importlib
+    result = {}
+    for module in modules:
+        started = time.perf_counter()
+        importlib.import_module(module)
+        result[f"import {module}"] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    health = health_check()
+    result["first connection"] = (time.perf_counter() - started) * 1000
+    return result, health
+
+if __name__ == "__main__":
+    # Moduły aplikacji importują `connections` - używamy tej samej instancji co one, a nie __main__
+    import connections
+    parser = argparse.ArgumentParser(description="Konfiguracja i stan połączeń MongoDB / Redis")
+    parser.add_argument("--startup", action="store_true", help="zmierz czas importu aplikacji i pierwszego połączenia")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup, health = connections.measure_startup(("training_diary", "import_of_documents"))
+        for name, ms in startup.items():
+            print(f"{name}: {ms:.1f} ms")
+    else:
+        health = connections.health_check()
+    for name, status in health.items():
+        state = "OK" if status["ok"] else f"BŁĄD ({status.get('error')})"
+        print(f"{name}: {state} | {status['latency_ms']:.1f} ms")
+    for name, ms in connections.timings.items():
+        print(f"utworzenie {name}: {ms:.1f} ms")
@@ -1,13 +1,335 @@
-from pymongo import MongoClient
-
-# Połączenie z MongoDB
-client = MongoClient("mongodb://localhost:27017/?replicaSet=rs0")
-db = client["training_diary"]
-
-# Usunięcie wszystkich dokumentów z kolekcji users
-db.users.delete_many({})
-print("Usunięto użytkowników.")
-db.trainings.delete_many({})
-print("Usunięto treningi.")
-db.friends.delete_many({})
-print("Usunięto znajomych.")
\ No newline at end of file
+from datetime import date, timedelta
+import argparse
+import time
+
+from bson import ObjectId
+
+import activity_calendar
+import activity_feed
+import diary_queries
+import indexes
+import leaderboards
+import training_dates
+import training_rollups
+import user_cache
+from training_diary import (
+    client, db, redis_client, users_col, trainings_col, friends_col, rollups_col, leaderboard_archive_col,
+    stats_applied_col, pending_deletes_col,
+    run_lua, revoke_sessions, invalidate_all_caches, trainings_layout, USERNAMES_KEY
+)
+
+# Usuwanie danych w trzech trybach:
+#   --user ID [ID ...]               - usunięcie kont (treningi, rollupy, znajomi, klucze w Redis)
+#   --older-than-years N / --date-*  - retencja: treningi z zakresu dat, z korektą users.stats i rollupów
+#   bez argumentów                   - wyczyszczenie całej bazy i stanu aplikacji w Redis
+#
+# MongoDB: paczki po `_id` (kolejna zaczyna się za ostatnim _id poprzedniej) z limitem tempa,
+# zamiast jednego delete_many, które obciąża replica set i oplog na długie minuty.
+# Retencja w kolekcji time-series (bez indeksu _id) idzie paczkami w kolejności pola czasu `date`.
+# Redis: klucze wyszukiwane przez SCAN (nie KEYS - nie blokuje serwera) i usuwane przez UNLINK
+# w pipeline (zwalnianie pamięci w tle).
+
+DEFAULT_BATCH_SIZE = 1000
+PROGRESS_EVERY = 50000
+SCAN_COUNT = 1000
+# Klucze aplikacji w Redis usuwane przy czyszczeniu całej bazy
+REDIS_PATTERNS = ["user:*", "leaderboard:*", "reminder:*", "feed:*", "session:*", "cache:*", "rebuild:*", "tmp:*"]
+# Pola treningu potrzebne do korekty statystyk, rollupów, rankingów i bitmap
+TRAINING_FIELDS = {"user_id": 1, "date": 1, "type": 1, "metrics.duration_min": 1, "metrics.calories_burned": 1,
+                   "metrics.distance_km": 1, "metrics.distance_m": 1}
+# Od tej wersji kolekcje time-series przyjmują usuwanie z dowolnym filtrem (wcześniej tylko po metaField)
+TIMESERIES_ANY_FILTER_DELETE = (7, 0)
+
+# === POSTĘP I LIMIT TEMPA ===
+class Progress:
+    """Licznik usuniętych dokumentów; przy max_rate > 0 usypia tak, by nie przekroczyć max_rate dok/s"""
+
+    def __init__(self, name, max_rate=0):
+        self.name = name
+        self.max_rate = max_rate
+        self.done = 0
+        self.next_report = PROGRESS_EVERY
+        self.started = time.perf_counter()
+
+    def update(self, count):
+        self.done += count
+        elapsed = time.perf_counter() - self.started
+        if self.max_rate:
+            ahead = self.done / self.max_rate - elapsed
+            if ahead > 0:
+                time.sleep(ahead)
+        if self.done >= self.next_report:
+            print(f"[{self.name}] Usunięto {self.done} dokumentów ({self.rate():.0f} dok/s)")
+            self.next_report = self.done + PROGRESS_EVERY
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed else 0
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"[{self.name}] Zakończono: {self.done} dokumentów w {elapsed:.1f} s ({self.rate():.0f} dok/s)")
+        return self.done
+
+def iter_match_batches(collection, match, batch_size):
+    """Listy _id pierwszych pasujących dokumentów, bez sortowania - zapytanie idzie indeksem pola
+    z `match` (np. user_id). Każda paczka jest usuwana przed pobraniem następnej."""
+    while True:
+        ids = [doc["_id"] for doc in collection.find(match, {"_id": 1}).limit(batch_size)]
+        if not ids:
+            return
+        yield ids
+
+def delete_batches(collection, match, batch_size=DEFAULT_BATCH_SIZE, max_rate=0):
+    """Usuń pasujące dokumenty paczkami; zwraca liczbę usuniętych. Dokumenty jednego użytkownika
+    przez indeks pola z `match` (sortowanie po _id oznaczałoby SORT w pamięci albo skan całego
+    indeksu _id), cała kolekcja - paczkami po _id."""
+    progress = Progress(collection.name, max_rate)
+    if match:
+        batches = iter_match_batches(collection, match, batch_size)
+    else:
+        batches = diary_queries.iter_id_batches(collection, match, batch_size)
+    for ids in batches:
+        progress.update(collection.delete_many({"_id": {"$in": ids}}).deleted_count)
+    return progress.finish()
+
+def delete_by_meta(collection, match):
+    """Kolekcja time-series: jedno delete_many z filtrem tylko po metaField (user_id) -
+    MongoDB usuwa całe kubełki, więc paczki po _id nie są potrzebne (ani dozwolone przed 7.0)"""
+    progress = Progress(collection.name)
+    progress.update(collection.delete_many(match).deleted_count)
+    return progress.finish()
+
+def require_timeseries_deletes():
+    """Retencja filtruje po dacie i _id, czego MongoDB < 7.0 nie obsługuje w kolekcjach time-series"""
+    version = client.server_info()["versionArray"]
+    if tuple(version[:2]) < TIMESERIES_ANY_FILTER_DELETE:
+        raise RuntimeError(
+            f"Retencja treningów w kolekcji time-series wymaga MongoDB 7.0 lub nowszego "
+            f"(serwer: {'.'.join(map(str, version[:3]))} usuwa tylko po metaField user_id). "
+            f"Na starszym serwerze ustaw wygasanie dokumentów: "
+            f"db.runCommand({{collMod: '{trainings_col.name}', expireAfterSeconds: <sekundy>}})"
+        )
+
+# === REDIS ===
+def unlink_matching(patterns, chunk_size=SCAN_COUNT):
+    """SCAN każdego wzorca i UNLINK znalezionych kluczy w pipeline (po chunk_size kluczy); zwraca liczbę"""
+    removed = 0
+    pipe = redis_client.pipeline(transaction=False)
+    queued = 0
+    for pattern in patterns:
+        for key in redis_client.scan_iter(match=pattern, count=SCAN_COUNT):
+            pipe.unlink(key)
+            queued += 1
+            if queued >= chunk_size:
+                removed += sum(pipe.execute())
+                queued = 0
+    if queued:
+        removed += sum(pipe.execute())
+    return removed
+
+def remove_leaderboard_members(user_ids, chunk_size=SCAN_COUNT):
+    """Usuń użytkowników ze wszystkich rankingów w Redis (SCAN leaderboard:* + ZREM w pipeline)"""
+    members = [str(user_id) for user_id in user_ids]
+    pipe = redis_client.pipeline(transaction=False)
+    queued = 0
+    for key in redis_client.scan_iter(match="leaderboard:*", count=SCAN_COUNT):
+        pipe.zrem(key, *members)
+        queued += 1
+        if queued >= chunk_size:
+            pipe.execute()
+            queued = 0
+    if queued:
+        pipe.execute()
+
+def cleanup_user_redis(user_id, friend_ids):
+    """Stan usuniętego konta w Redis: wpisy w feedach znajomych, członkostwo w ich zbiorach
+    znajomych, nazwa, przypomnienie, feedy i wszystkie klucze user:{id}:* i cache:user:{id}:*"""
+    user_id_str = str(user_id)
+    # Skrypt korzysta ze zbioru znajomych użytkownika - przed usunięciem kluczy user:{id}:*
+    keys, args = activity_feed.purge_call(user_id_str)
+    run_lua(activity_feed.FEED_PURGE_SCRIPT, keys, args)
+    pipe = redis_client.pipeline(transaction=False)
+    for friend_id in friend_ids:
+        pipe.srem(diary_queries.friends_key(friend_id), user_id_str)
+    pipe.srem(activity_feed.POPULAR_KEY, user_id_str)
+    pipe.hdel(USERNAMES_KEY, user_id_str)
+    pipe.unlink(diary_queries.reminder_key(user_id_str), activity_feed.feed_key(user_id_str),
+                activity_feed.outbox_key(user_id_str))
+    pipe.execute()
+    unlink_matching([f"user:{user_id_str}:*", user_cache.user_pattern(user_id_str)])
+
+def queue_training_cleanup(pipe, trainings):
+    """Efekty usuniętych treningów w Redis: rankingi (ZINCRBY ujemny), bity dni, wersja cache
+    i wpisy w feedach. Treningi z zakresu dat są usuwane w całości, więc ich dni są już puste."""
+    leaderboards.queue_leaderboard_updates(pipe, trainings, sign=-1)
+    by_user = {}
+    for training in trainings:
+        by_user.setdefault(str(training["user_id"]), []).append(training)
+    pipe.script_load(activity_feed.FEED_PURGE_SCRIPT)
+    for user_id, user_trainings in by_user.items():
+        activity_key = activity_calendar.activity_key(user_id)
+        for day in sorted({activity_calendar.day_number(t["date"]) for t in user_trainings} - {-1}):
+            pipe.setbit(activity_key, day, 0)
+        pipe.incr(user_cache.version_key(user_id))
+        keys, args = activity_feed.purge_call(user_id, [t["_id"] for t in user_trainings])
+        pipe.evalsha(activity_feed.FEED_PURGE_SHA, len(keys), *keys, *args)
+
+# === TRYBY ===
+def parse_user_id(user_id):
+    """ID z rejestracji to ObjectId, a z importu - stringi UUID"""
+    return ObjectId(user_id) if isinstance(user_id, str) and ObjectId.is_valid(user_id) else user_id
+
+def delete_accounts(user_ids, batch_size=DEFAULT_BATCH_SIZE, max_rate=0):
+    """Usuń konta: sesje, treningi i rollupy (paczkami), listy znajomych, pozycje w archiwum
+    rankingów, dokument użytkownika i jego stan w Redis. Znajomości są obustronne, więc
+    użytkownik jest usuwany z list osób z własnej listy znajomych."""
+    user_ids = [parse_user_id(user_id) for user_id in user_ids]
+    timeseries = trainings_layout() == "timeseries"
+    for user_id in user_ids:
+        user_id_str = str(user_id)
+        print(f"Usuwanie konta {user_id_str}...")
+        # Najpierw sesje - użytkownik nie doda treningu w trakcie usuwania
+        revoke_sessions(user_id_str)
+        if timeseries:
+            delete_by_meta(trainings_col, {"user_id": user_id})
+        else:
+            delete_batches(trainings_col, {"user_id": user_id}, batch_size, max_rate)
+        stats_applied_col.delete_many({"user_id": user_id})
+        delete_batches(rollups_col, {"user_id": user_id}, batch_size, max_rate)
+        friend_ids = (friends_col.find_one({"user_id": user_id}, {"friends": 1}) or {}).get("friends", [])
+        if friend_ids:
+            friends_col.update_many({"user_id": {"$in": friend_ids}}, {"$pull": {"friends": user_id}})
+        friends_col.delete_one({"user_id": user_id})
+        leaderboard_archive_col.update_many(
+            {"entries.user_id": user_id_str},
+            {"$pull": {"entries": {"user_id": user_id_str}}, "$inc": {"total": -1}}
+        )
+        users_col.delete_one({"_id": user_id})
+        if redis_client:
+            cleanup_user_redis(user_id, friend_ids)
+    if redis_client and user_ids:
+        remove_leaderboard_members(user_ids)
+    return len(user_ids)
+
+def delete_trainings_in_range(date_from=None, date_to=None, batch_size=DEFAULT_BATCH_SIZE, max_rate=0):
+    """Retencja: usuń treningi z zakresu dat (włącznie) paczkami. Każda paczka w jednej transakcji
+    cofa users.stats i rollupy usuniętych treningów (puste rollupy są usuwane) i zapisuje je
+    w training_deletes_pending; potem jednym pipeline - rankingi, bity dni, cache i wpisy w feedach
+    w Redis - i usuwa znaczniki. Paczka przerwana po transakcji jest dokańczana przy kolejnym
+    uruchomieniu, więc statystyki nie zostają zawyżone ani cofnięte drugi raz."""
+    match = training_dates.range_condition(date_from, date_to)
+    if match is None:
+        raise ValueError("Podaj co najmniej jedną granicę zakresu dat")
+    timeseries = trainings_layout() == "timeseries"
+    if timeseries:
+        require_timeseries_deletes()
+    progress = Progress(trainings_col.name, max_rate)
+    leftover = list(pending_deletes_col.find())
+    if leftover:
+        print(f"[{trainings_col.name}] Dokańczanie przerwanej paczki: {len(leftover)} treningów")
+        progress.update(finish_deletes(leftover, timeseries))
+    if timeseries:
+        # Kolekcja time-series nie ma indeksu _id - paczki w kolejności pola czasu
+        batches = diary_queries.iter_date_batches(trainings_col, match, batch_size, TRAINING_FIELDS)
+    else:
+        # Jeden przebieg indeksu _id - indeks (date, _id) nie zwróci stringów i dat BSON w kolejności _id
+        batches = diary_queries.iter_id_batches(trainings_col, match, batch_size, hint=[("_id", 1)])
+    for batch in batches:
+        deleted = []
+
+        def write(session):
+            nonlocal deleted
+            if timeseries:
+                # Do kolekcji time-series nie można pisać w transakcji - treningi usuwa finish_deletes
+                deleted = batch
+            else:
+                # Odczyt w transakcji - korekta obejmuje dokładnie usunięte dokumenty
+                deleted = list(trainings_col.find({"_id": {"$in": batch}}, TRAINING_FIELDS, session=session))
+                trainings_col.delete_many({"_id": {"$in": [doc["_id"] for doc in deleted]}}, session=session)
+            if deleted:
+                pending_deletes_col.insert_many(deleted, session=session)
+                users_col.bulk_write(diary_queries.user_stats_ops(deleted, sign=-1), ordered=False, session=session)
+                rollups_col.bulk_write(training_rollups.aggregated_rollup_ops(deleted, sign=-1),
+                                       ordered=False, session=session)
+                user_ids = list({doc["user_id"] for doc in deleted})
+                rollups_col.delete_many({"user_id": {"$in": user_ids}, "count": {"$lte": 0}}, session=session)
+
+        with client.start_session() as session:
+            session.with_transaction(write)
+        progress.update(finish_deletes(deleted, timeseries))
+    return progress.finish()
+
+def finish_deletes(deleted, timeseries):
+    """Kroki po transakcji korekty (powtarzalne): usunięcie treningów time-series, efekty w Redis,
+    usunięcie znaczników; zwraca liczbę treningów"""
+    if not deleted:
+        return 0
+    if timeseries:
+        trainings_col.delete_many(diary_queries.trainings_batch_filter(deleted))
+    if redis_client:
+        pipe = redis_client.pipeline(transaction=False)
+        queue_training_cleanup(pipe, deleted)
+        pipe.execute()
+    pending_deletes_col.delete_many({"_id": {"$in": [doc["_id"] for doc in deleted]}})
+    return len(deleted)
+
+def delete_everything(batch_size=DEFAULT_BATCH_SIZE, max_rate=0):
+    """Wyczyść wszystkie kolekcje aplikacji (paczkami) i jej klucze w Redis"""
+    if trainings_layout() == "timeseries":
+        delete_by_meta(trainings_col, {})
+    else:
+        delete_batches(trainings_col, {}, batch_size, max_rate)
+    for collection in (rollups_col, friends_col, leaderboard_archive_col, stats_applied_col, pending_deletes_col,
+                       users_col):
+        delete_batches(collection, {}, batch_size, max_rate)
+    if redis_client:
+        removed = unlink_matching(REDIS_PATTERNS + [USERNAMES_KEY])
+        print(f"[redis] Usunięto {removed} kluczy")
+
+def years_ago(years, today=None):
+    """Pierwszy dzień, który zostaje przy retencji `years` lat (29 lutego -> 28 lutego)"""
+    today = today or date.today()
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:
+        return today.replace(year=today.year - years, day=28)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Usuwanie danych paczkami: konta, retencja treningów albo cała baza")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--user", nargs="+", default=None, help="usuń konta użytkowników (user_id)")
+    mode.add_argument("--older-than-years", type=int, default=None,
+                      help="usuń treningi starsze niż N lat (retencja)")
+    mode.add_argument("--date-to", default=None, help="usuń treningi do daty RRRR-MM-DD (włącznie)")
+    parser.add_argument("--date-from", default=None, help="początek zakresu dat RRRR-MM-DD (włącznie, z --date-to)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="dokumentów na jedno usunięcie")
+    parser.add_argument("--max-rate", type=int, default=0, help="najwyżej tyle dokumentów/s (0 = bez limitu)")
+    args = parser.parse_args(argv)
+    if args.date_from and not args.date_to:
+        parser.error("--date-from wymaga --date-to")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.user:
+        count = delete_accounts(args.user, args.batch_size, args.max_rate)
+        print(f"Usunięto konta: {count}.")
+    elif args.older_than_years is not None or args.date_to:
+        if args.older_than_years is not None:
+            date_from, date_to = None, years_ago(args.older_than_years) - timedelta(days=1)
+        else:
+            date_from, date_to = args.date_from, args.date_to
+        try:
+            deleted = delete_trainings_in_range(date_from, date_to, args.batch_size, args.max_rate)
+        except RuntimeError as e:
+            raise SystemExit(str(e))
+        print(f"Usunięto treningi: {deleted}.")
+    else:
+        delete_everything(args.batch_size, args.max_rate)
+        print("Usunięto użytkowników, treningi i znajomych.")
+    # Wyniki analiz w cache mogą obejmować usunięte treningi
+    invalidate_all_caches()
+
+    # Kolekcje bez dokumentów zachowują indeksy - sprawdzamy, czy są zgodne z deklaracją
+    indexes.ensure_indexes(db)
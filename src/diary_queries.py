@@ -0,0 +1,621 @@
+from datetime import datetime
+import os
+import secrets
+
+from bson import ObjectId
+from pymongo import UpdateOne
+import hashlib
+
+import activity_calendar
+import cardio_intensity
+import leaderboards
+import training_dates
+import training_rollups
+import user_cache
+
+# Wspólne elementy operacji dziennika - bez wejścia/wyjścia:
+# klucze Redis, skrypty Lua, budowa zapytań i interpretacja wyników.
+# Używa ich zarówno synchroniczny training_diary.py, jak i asynchroniczny diary_service.py.
+
+USERNAMES_KEY = "users:usernames"  # hash: user_id -> username
+REMINDER_TTL = 86400  # 24 godziny
+REMINDER_MESSAGE = "Czas na trening!"
+
+# === KLUCZE ===
+def get_week_key(day=None):
+    """Generuj klucz dla aktualnego (lub podanego) tygodnia (format: 2025-W23, rok ISO)"""
+    return training_rollups.iso_week_key(day or datetime.now())
+
+def calories_key(week_key=None):
+    return f"leaderboard:calories:{week_key or get_week_key()}"
+
+def reminder_key(user_id):
+    return f"reminder:{user_id}:tomorrow"
+
+def friends_key(user_id):
+    return f"user:{user_id}:friends"
+
+# === UŻYTKOWNICY ===
+def new_user_document(username, email, password_hash, age, gender):
+    return {
+        "username": username,
+        "email": email,
+        "password_hash": password_hash,
+        "age": age,
+        "gender": gender,
+        "stats": {
+            "total_trainings": 0,
+            "total_calories": 0,
+            "total_minutes": 0
+        }
+    }
+
+def username_lookup_ids(user_ids):
+    """ID z rejestracji to ObjectId, a z importu - stringi UUID; szukamy obu wariantów"""
+    return list(user_ids) + [ObjectId(uid) for uid in user_ids if ObjectId.is_valid(uid)]
+
+# === SESJE ===
+# Po zalogowaniu dane profilu trafiają do hasha session:{token} z przesuwanym TTL,
+# a token do zbioru user:{id}:sessions (unieważnienie wszystkich sesji po zmianie hasła).
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 1800))
+SESSION_PREFIX = "session:"
+
+def session_key(token):
+    return f"{SESSION_PREFIX}{token}"
+
+def user_sessions_key(user_id):
+    return f"user:{user_id}:sessions"
+
+def new_session_token():
+    return secrets.token_urlsafe(32)
+
+def session_mapping(user):
+    """Pola hasha sesji; typ ID zapisujemy, bo konta z rejestracji mają ObjectId, a z importu UUID"""
+    return {
+        "user_id": str(user["_id"]),
+        "id_type": "oid" if isinstance(user["_id"], ObjectId) else "str",
+        "username": user["username"]
+    }
+
+def parse_session(data):
+    if not data:
+        return None
+    user_id = ObjectId(data["user_id"]) if data.get("id_type") == "oid" else data["user_id"]
+    return {"user_id": user_id, "username": data["username"]}
+
+# KEYS: hash sesji, zbiór sesji użytkownika; ARGV: TTL, token, pola hasha (klucz, wartość, ...)
+# Przy okazji usuwa ze zbioru tokeny sesji, które już wygasły
+CREATE_SESSION_SCRIPT = """
+for _, token in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    if redis.call('EXISTS', ARGV[3] .. token) == 0 then
+        redis.call('SREM', KEYS[2], token)
+    end
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: zbiór sesji użytkownika; ARGV: prefiks kluczy sesji. Zwraca liczbę unieważnionych sesji
+REVOKE_SESSIONS_SCRIPT = """
+local tokens = redis.call('SMEMBERS', KEYS[1])
+for _, token in ipairs(tokens) do
+    redis.call('UNLINK', ARGV[1] .. token)
+end
+redis.call('DEL', KEYS[1])
+return #tokens
+"""
+
+# KEYS: hash sesji; ARGV: token
+LOGOUT_SCRIPT = """
+local user_id = redis.call('HGET', KEYS[1], 'user_id')
+redis.call('DEL', KEYS[1])
+if user_id then
+    redis.call('SREM', 'user:' .. user_id .. ':sessions', ARGV[1])
+end
+return user_id and 1 or 0
+"""
+
+def create_session_call(user, token):
+    fields = []
+    for field, value in session_mapping(user).items():
+        fields += [field, value]
+    keys = [session_key(token), user_sessions_key(user["_id"])]
+    return keys, [SESSION_TTL, token, SESSION_PREFIX] + fields
+
+# === TRENINGI ===
+def prepare_training(user_id, training, native_dates):
+    """Uzupełnij trening przed zapisem: user_id, format daty i intensywność cardio"""
+    training["user_id"] = user_id
+    training["date"] = training_dates.to_storage(training["date"], native_dates)
+    # Intensywność cardio liczona raz przy zapisie - odczyt to tylko projekcja
+    intensity = cardio_intensity.classify_intensity(training.get("type"), training.get("metrics"))
+    if intensity is not None:
+        training["intensity_description"] = intensity
+    return training
+
+def user_stats_increment(training, sign=1):
+    """$inc users.stats dla treningu; sign=-1 cofa trening (usuwanie danych)"""
+    metrics = training.get("metrics") or {}
+    return {"$inc": {
+        "stats.total_trainings": sign,
+        "stats.total_calories": (metrics.get("calories_burned", 0) or 0) * sign,
+        "stats.total_minutes": (metrics.get("duration_min", 0) or 0) * sign
+    }}
+
+# === ZAPIS WIELU TRENINGÓW (SYNCHRONIZACJA URZĄDZEŃ) ===
+TRAINING_TYPES = ["siłownia", "bieganie", "pływanie", "rower", "yoga", "kalistenika", "trening funkcjonalny"]
+
+def training_errors(training):
+    """Lista błędów jednego treningu z paczki (pusta, gdy trening jest poprawny)"""
+    if not isinstance(training, dict):
+        return ["trening musi być słownikiem"]
+    errors = []
+    if training.get("type") not in TRAINING_TYPES:
+        errors.append(f"nieznany typ treningu {training.get('type')!r}")
+    try:
+        activity_calendar.to_date(training.get("date"))
+    except (TypeError, ValueError, AttributeError):
+        errors.append(f"niepoprawna data {training.get('date')!r}")
+    metrics = training.get("metrics")
+    if not isinstance(metrics, dict):
+        errors.append("brak metryk")
+    else:
+        for field in ("duration_min", "calories_burned"):
+            value = metrics.get(field, 0)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                errors.append(f"{field} musi być liczbą nieujemną")
+    dedup_key = training.get("dedup_key")
+    if not isinstance(dedup_key, str) or not dedup_key:
+        errors.append("brak dedup_key")
+    return errors
+
+def validate_bulk(trainings_by_user):
+    """Sprawdź całą paczkę przed zapisem; ValueError ze wszystkimi błędami"""
+    errors = []
+    for user_id, trainings in trainings_by_user.items():
+        seen = set()
+        for i, training in enumerate(trainings):
+            problems = training_errors(training)
+            if not problems and training["dedup_key"] in seen:
+                problems = [f"powtórzony dedup_key {training['dedup_key']!r}"]
+            if not problems:
+                seen.add(training["dedup_key"])
+            errors += [f"{user_id}[{i}]: {problem}" for problem in problems]
+    if errors:
+        raise ValueError("Niepoprawne treningi: " + "; ".join(errors))
+
+def dedup_training_id(user_id, dedup_key):
+    """Stałe _id treningu z klucza klienta - ponowienie synchronizacji nie tworzy duplikatów"""
+    digest = hashlib.md5(f"{user_id}:{dedup_key}".encode("utf-8")).digest()
+    return ObjectId(digest[:12])
+
+def prepare_bulk(trainings_by_user, native_dates):
+    docs = []
+    for user_id, trainings in trainings_by_user.items():
+        for training in trainings:
+            doc = prepare_training(user_id, dict(training), native_dates)
+            doc["_id"] = dedup_training_id(user_id, training["dedup_key"])
+            docs.append(doc)
+    return docs
+
+# Znaczniki (zwykła kolekcja) treningów, których statystyki policzono w transakcji, a których dalsze
+# kroki mogą jeszcze nie być wykonane. Do kolekcji time-series nie można pisać w transakcji - treningi
+# (add_training i paczki) zapisujemy po niej. Paczki zostawiają znacznik także do wykonania efektów
+# w Redis: ponowienie paczki nie liczy statystyk treningów ze znacznikiem, ale odtwarza ich efekty.
+STATS_APPLIED_COLLECTION = "training_stats_applied"
+
+def stats_applied_markers(trainings):
+    return [{"_id": t["_id"], "user_id": t["user_id"], "stats_applied": True} for t in trainings]
+
+def pending_stats(docs, stored_ids, applied_ids):
+    """Treningi paczki time-series, których statystyk jeszcze nie policzono: niezapisane i bez znacznika"""
+    return [doc for doc in docs if doc["_id"] not in stored_ids and doc["_id"] not in applied_ids]
+
+# Retencja: treningi, których statystyki i rollupy już cofnięto, a które (lub ich efekty w Redis)
+# mogą jeszcze nie być usunięte - znacznik to dokument z polami treningu potrzebnymi do korekty
+PENDING_DELETES_COLLECTION = "training_deletes_pending"
+
+def pending_effects(docs, new_docs, applied_ids):
+    """Treningi paczki do efektów w Redis: nowe oraz te, które mają znacznik z przerwanej próby"""
+    new_ids = {doc["_id"] for doc in new_docs}
+    return [doc for doc in docs if doc["_id"] in new_ids or doc["_id"] in applied_ids]
+
+def user_stats_ops(trainings, sign=1):
+    """Jedna operacja $inc users.stats na użytkownika dla całej paczki; sign=-1 cofa treningi"""
+    sums = {}
+    for training in trainings:
+        increment = user_stats_increment(training, sign)["$inc"]
+        user_sums = sums.setdefault(training["user_id"], dict.fromkeys(increment, 0))
+        for field, value in increment.items():
+            user_sums[field] += value
+    return [UpdateOne({"_id": user_id}, {"$inc": increment}) for user_id, increment in sums.items()]
+
+def queue_bulk_side_effects(pipe, trainings):
+    """Dodaj do pipeline efekty paczki w Redis (bitmapy, rankingi, przypomnienia, wersja cache) - jedna operacja
+    na dzień/użytkownika i ranking/użytkownika. Pipeline musi być bez MULTI: bitmapa jest
+    odczytywana bez dekodowania."""
+    by_user = {}
+    for training in trainings:
+        by_user.setdefault(training["user_id"], []).append(training)
+    users = []
+    for user_id, user_trainings in by_user.items():
+        activity_key = activity_calendar.activity_key(str(user_id))
+        days = sorted({activity_calendar.day_number(t["date"]) for t in user_trainings} - {-1})
+        for day in days:
+            pipe.setbit(activity_key, day, 1)
+        users.append((user_id, days))
+    # Wszystkie okresy, miary i typy - pozycję odczytujemy już po aktualizacji
+    leaderboard_commands = leaderboards.queue_leaderboard_updates(pipe, trainings)
+    leaderboard_key = calories_key()
+    for user_id, _ in users:
+        user_id_str = str(user_id)
+        pipe.set(reminder_key(user_id_str), REMINDER_MESSAGE, ex=REMINDER_TTL)
+        # Nowa wersja cache analiz użytkownika - stare wyniki przestają być czytane
+        pipe.incr(user_cache.version_key(user_id_str))
+        pipe.execute_command("GET", activity_calendar.activity_key(user_id_str), NEVER_DECODE=True)
+        pipe.zrevrank(leaderboard_key, user_id_str)
+        pipe.zscore(leaderboard_key, user_id_str)
+    return users, leaderboard_commands
+
+def parse_bulk_side_effects(plan, results):
+    users, leaderboard_commands = plan
+    effects = {}
+    i = 0
+    previous = {}
+    for user_id, days in users:
+        previous[user_id] = results[i:i + len(days)]
+        i += len(days)
+    i += leaderboard_commands
+    for user_id, days in users:
+        previous_bits = previous[user_id]
+        bitmap, rank, score = results[i + 2:i + 5]  # po SET i INCR
+        i += 5
+        bits = activity_calendar.bitmap_to_int(bitmap)
+        streaks = activity_calendar.streak_summary(bits)
+        new_days = sum(1 << day for day, previous in zip(days, previous_bits) if not previous)
+        best_before = activity_calendar.longest_run(bits & ~new_days) if new_days else streaks["best"]
+        effects[user_id] = {
+            "streak": streaks["current"],
+            "best": streaks["best"],
+            "new_record": streaks["best"] > best_before,
+            "position": rank + 1 if rank is not None else None,
+            "calories": int(float(score or 0))
+        }
+    return effects
+
+def bulk_summary(trainings_by_user, docs, new_docs, effects):
+    """Wynik zapisu paczki per użytkownik: ile dodano, ile było już zapisanych i efekty w Redis"""
+    inserted = {}
+    for doc in new_docs:
+        inserted[doc["user_id"]] = inserted.get(doc["user_id"], 0) + 1
+    return {
+        user_id: {
+            "inserted": inserted.get(user_id, 0),
+            "duplicates": len(trainings) - inserted.get(user_id, 0),
+            "effects": (effects or {}).get(user_id)
+        }
+        for user_id, trainings in trainings_by_user.items()
+    }
+
+HISTORY_FIELDS = ["date", "type", "metrics.duration_min", "metrics.calories_burned", "metrics.distance_km"]
+
+def history_query(user_id, after=None, types=None, date_from=None, date_to=None):
+    query = {"user_id": user_id}
+    if types:
+        query["type"] = {"$in": list(types)}
+
+    # Warunki działają dla dat zapisanych jako string i jako data BSON
+    conditions = []
+    date_range = training_dates.range_condition(date_from, date_to)
+    if date_range:
+        conditions.append(date_range)
+    if after:
+        conditions.append(training_dates.keyset_after_condition(*after))
+    if conditions:
+        query["$and"] = conditions
+    return query
+
+def history_projection(fields=None):
+    projection = {field: 1 for field in (fields or HISTORY_FIELDS)}
+    projection["date"] = 1
+    return projection
+
+HISTORY_SORT = [("date", -1), ("_id", -1)]
+# Eksport i retencja time-series - kolejność indeksu (date, _id) z indexes.py
+DATE_SORT = [("date", 1), ("_id", 1)]
+
+def history_page(items, limit):
+    """Zapytanie pobiera limit + 1 dokumentów - nadmiarowy oznacza, że jest następna strona"""
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_after = (items[-1]["date"], items[-1]["_id"]) if has_more else None
+    return {"items": items, "next": next_after}
+
+# === PACZKI PO _id (ZADANIA WSADOWE) ===
+# Typy BSON dla $type - po wyczerpaniu jednego typu _id skanowanie przechodzi do kolejnego
+_BSON_TYPES = {ObjectId: "objectId", str: "string", int: "number", float: "number", datetime: "date"}
+
+def iter_id_batches(collection, match, batch_size, hint=None):
+    """Listy _id dokumentów pasujących do `match`, w porządku indeksu _id. Kolejna paczka zaczyna
+    się za ostatnim _id poprzedniej, więc zapytanie nie przechodzi ponownie po usuniętych dokumentach.
+    Porównania MongoDB nie przekraczają typu BSON (konta z rejestracji mają ObjectId, z importu
+    stringi UUID) - po wyczerpaniu jednego typu skanowanie zaczyna się od początku bez niego.
+    `hint` wymusza indeks, np. skan _id zamiast indeksu pola z `match` i sortowania w pamięci."""
+    done_types, last = [], None
+    while True:
+        conditions = [match] if match else []
+        if last is not None:
+            conditions.append({"_id": {"$gt": last}})
+        if done_types:
+            conditions.append({"$nor": [{"_id": {"$type": bson_type}} for bson_type in done_types]})
+        query = {"$and": conditions} if conditions else {}
+        cursor = collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)
+        ids = [doc["_id"] for doc in (cursor.hint(hint) if hint else cursor)]
+        if ids:
+            yield ids
+            last = ids[-1]
+            continue
+        bson_type = _BSON_TYPES.get(type(last))
+        if last is None or bson_type is None or bson_type in done_types:
+            return
+        done_types.append(bson_type)
+        last = None
+
+def iter_date_batches(collection, match, batch_size, projection=None):
+    """Dokumenty pasujące do `match` paczkami w kolejności (date, _id) - dla kolekcji time-series,
+    w której _id nie ma indeksu, a zakres pola czasu zawęża kubełki. Kolejna paczka zaczyna się
+    za ostatnim (date, _id) poprzedniej. Pole date ma tu jeden typ BSON (data)."""
+    last = None
+    while True:
+        query = match
+        if last is not None:
+            after = {"$or": [{"date": {"$gt": last["date"]}}, {"date": last["date"], "_id": {"$gt": last["_id"]}}]}
+            query = {"$and": [match, after]}
+        docs = list(collection.find(query, projection).sort(DATE_SORT).limit(batch_size))
+        if not docs:
+            return
+        yield docs
+        last = docs[-1]
+
+def trainings_batch_filter(trainings):
+    """Filtr dokładnie tych treningów, zawężony po user_id i zakresie dat (indeks i kubełki time-series)"""
+    dates = [t["date"] for t in trainings]
+    return {
+        "user_id": {"$in": list({t["user_id"] for t in trainings})},
+        "date": {"$gte": min(dates), "$lte": max(dates)},
+        "_id": {"$in": [t["_id"] for t in trainings]},
+    }
+
+def intensity_backfill_query():
+    """Treningi cardio bez zapisanej intensywności (backfill_cardio_intensity)"""
+    return {"type": {"$in": cardio_intensity.CARDIO_TYPES}, "intensity_description": {"$exists": False}}
+
+# === ANALIZY TRENINGÓW (AGREGACJE) ===
+# Sortowania zgodne z indeksami z indexes.py - indexes.py --check sprawdza plany tych pipeline'ów
+def cardio_intensity_pipeline(user_id):
+    """Intensywność treningów cardio: zapisana wartość, a dla starszych dokumentów natywne $switch"""
+    return [
+        {"$match": {"user_id": user_id, "type": {"$in": cardio_intensity.CARDIO_TYPES}}},
+        {"$project": {
+            "type": 1,
+            "date": 1,
+            "intensity_description": {"$ifNull": [
+                "$intensity_description", cardio_intensity.intensity_expression()
+            ]}
+        }}
+    ]
+
+def durations_with_previous_pipeline(user_id):
+    """Czas treningu i czas poprzedniego treningu tego samego typu (od najnowszych w każdym typie).
+    Partycja po typie i malejąca data to porządek indeksu (user_id, type, date) - bez sortowania w pamięci."""
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$setWindowFields": {
+            "partitionBy": "$type",
+            "sortBy": {"date": -1},
+            "output": {
+                "previous_duration": {
+                    "$shift": {
+                        "output": "$metrics.duration_min",
+                        "by": 1
+                    }
+                }
+            }
+        }}
+    ]
+
+def latest_duration_per_type_pipeline(user_id, collection_name):
+    """Ostatni trening każdego typu i czas poprzedniego - cała redukcja w bazie.
+    Typy: DISTINCT_SCAN po indeksie (user_id, type, date), potem $lookup z limitem 2 na typ,
+    więc koszt zależy od liczby typów, a nie od długości historii."""
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"user_id": 1, "type": 1, "date": -1}},
+        {"$group": {"_id": "$type", "date": {"$first": "$date"}}},
+        {"$lookup": {
+            "from": collection_name,
+            "let": {"training_type": "$_id"},
+            "pipeline": latest_of_type_pipeline(user_id, "$$training_type"),
+            "as": "last_two"
+        }},
+        {"$project": {
+            "_id": 0,
+            "type": "$_id",
+            "date": {"$arrayElemAt": ["$last_two.date", 0]},
+            "current_duration": {"$ifNull": [{"$arrayElemAt": ["$last_two.duration", 0]}, 0]},
+            "previous_duration": {"$cond": [
+                {"$gt": [{"$size": "$last_two"}, 1]},
+                {"$arrayElemAt": ["$last_two.duration", 1]},
+                None
+            ]}
+        }},
+        {"$set": {"delta": {"$cond": [
+            {"$eq": ["$previous_duration", None]},
+            None,
+            {"$subtract": ["$current_duration", "$previous_duration"]}
+        ]}}},
+        {"$sort": {"type": 1}}
+    ]
+
+def latest_of_type_pipeline(user_id, training_type, limit=2):
+    """Dwa ostatnie treningi typu (wewnętrzny pipeline $lookup; typ to "$$training_type" albo wartość)"""
+    if isinstance(training_type, str) and training_type.startswith("$$"):
+        match = {"user_id": user_id, "$expr": {"$eq": ["$type", training_type]}}
+    else:
+        match = {"user_id": user_id, "type": training_type}
+    return [
+        {"$match": match},
+        {"$sort": {"date": -1, "_id": -1}},
+        {"$limit": limit},
+        # null zamiast brakującego pola - pozycje w tablicy last_two muszą się zgadzać
+        {"$project": {"_id": 0, "date": 1, "duration": {"$ifNull": ["$metrics.duration_min", None]}}}
+    ]
+
+def last_trainings_pipeline(user_id, count=4):
+    return [
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"date": -1, "_id": -1}},
+        {"$limit": count}
+    ]
+
+# === EFEKTY TRENINGU W REDIS (JEDEN ROUND TRIP) ===
+# KEYS: bitmapa aktywności, bieżący ranking tygodniowy kalorii, przypomnienie, wersja cache
+#       użytkownika, rankingi treningu
+# ARGV: numer dnia treningu, user_id, TTL przypomnienia, treść przypomnienia,
+#       potem para (przyrost, expire_at) dla każdego rankingu z KEYS[5..] (expire_at 0 = bez wygasania)
+# Zwraca: poprzednią wartość bitu dnia, pozycję i wynik w bieżącym tygodniu oraz bitmapę (serie liczy Python)
+TRAINING_SIDE_EFFECTS_SCRIPT = """
+local previous_bit = 1
+if tonumber(ARGV[1]) >= 0 then
+    previous_bit = redis.call('SETBIT', KEYS[1], ARGV[1], 1)
+end
+
+redis.call('INCR', KEYS[4])
+for i = 5, #KEYS do
+    local n = 5 + (i - 5) * 2
+    redis.call('ZINCRBY', KEYS[i], ARGV[n], ARGV[2])
+    if tonumber(ARGV[n + 1]) > 0 then
+        redis.call('EXPIREAT', KEYS[i], ARGV[n + 1])
+    end
+end
+local rank = redis.call('ZREVRANK', KEYS[2], ARGV[2]) or -1
+local score = redis.call('ZSCORE', KEYS[2], ARGV[2]) or '0'
+
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SETEX', KEYS[3], ARGV[3], ARGV[4])
+end
+return {previous_bit, rank, score, redis.call('GET', KEYS[1]) or ''}
+"""
+
+def side_effects_call(user_id, training, ranked=True, reminder=True):
+    """Klucze i argumenty TRAINING_SIDE_EFFECTS_SCRIPT oraz numer dnia treningu.
+    ranked=False pomija rankingi (np. przeliczenie samej serii)."""
+    user_id_str = str(user_id)
+    day = activity_calendar.day_number(training["date"])
+    keys = [activity_calendar.activity_key(user_id_str), calories_key(), reminder_key(user_id_str),
+            user_cache.version_key(user_id_str)]
+    args = [day, user_id_str, REMINDER_TTL if reminder else 0, REMINDER_MESSAGE]
+    if ranked:
+        for key, value, expires in leaderboards.training_increments(training):
+            keys.append(key)
+            args += [value, expires or 0]
+    return keys, args, day
+
+def parse_side_effects(result, day):
+    previous_bit, rank, score, bitmap = result
+    # Trening wstecz wypełnia lukę w bitmapie, więc serie są poprawne niezależnie od kolejności
+    bits = activity_calendar.bitmap_to_int(bitmap)
+    streaks = activity_calendar.streak_summary(bits)
+    best_before = streaks["best"]
+    if not previous_bit:
+        best_before = activity_calendar.longest_run(bits & ~(1 << day))
+    return {
+        "streak": streaks["current"],
+        "best": streaks["best"],
+        "new_record": streaks["best"] > best_before,
+        "position": rank + 1 if rank >= 0 else None,
+        "calories": int(float(score))
+    }
+
+def streak_overview(bits, today=None):
+    """Serie i liczba dni treningowych w bieżącym miesiącu z jednej bitmapy"""
+    today = today or datetime.now()
+    summary = activity_calendar.streak_summary(bits)
+    summary["month_days"] = activity_calendar.monthly_counts(bits, today.year)[today.month]
+    return summary
+
+def format_reminder(message, ttl):
+    if not message:
+        return None
+    return f"{message} (zostało {ttl // 3600} godzin)"
+
+# === RANKINGI ===
+# Strona rankingu razem z nazwami z hasha - jeden round trip do Redis
+LEADERBOARD_PAGE_SCRIPT = """
+local entries = redis.call('ZREVRANGE', KEYS[1], ARGV[1], ARGV[2], 'WITHSCORES')
+local result = {}
+for i = 1, #entries, 2 do
+    result[#result + 1] = entries[i]
+    result[#result + 1] = entries[i + 1]
+    result[#result + 1] = redis.call('HGET', KEYS[2], entries[i]) or ''
+end
+return result
+"""
+
+# Przecięcie rankingu tygodniowego ze zbiorem znajomych (+ sam użytkownik) - jeden round trip
+FRIENDS_LEADERBOARD_SCRIPT = """
+redis.call('ZINTERSTORE', KEYS[4], 2, KEYS[1], KEYS[2], 'WEIGHTS', 1, 0)
+local own = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if own then
+    redis.call('ZADD', KEYS[4], own, ARGV[1])
+end
+local entries = redis.call('ZREVRANGE', KEYS[4], 0, tonumber(ARGV[2]) - 1, 'WITHSCORES')
+local rank = redis.call('ZREVRANK', KEYS[4], ARGV[1])
+local total = redis.call('ZCARD', KEYS[4])
+redis.call('DEL', KEYS[4])
+local result = {rank or -1, total}
+for i = 1, #entries, 2 do
+    result[#result + 1] = entries[i]
+    result[#result + 1] = entries[i + 1]
+    result[#result + 1] = redis.call('HGET', KEYS[3], entries[i]) or ''
+end
+return result
+"""
+
+def friends_leaderboard_call(user_id, limit=10):
+    user_id_str = str(user_id)
+    keys = [calories_key(), friends_key(user_id_str), USERNAMES_KEY, f"tmp:leaderboard:friends:{user_id_str}"]
+    return keys, [user_id_str, limit]
+
+def split_leaderboard_raw(raw):
+    """Płaska lista [id, wynik, nazwa, ...] ze skryptu Lua -> wiersze i nazwy znalezione w hashu"""
+    rows = [raw[i:i + 3] for i in range(0, len(raw), 3)]
+    return rows, {uid: name for uid, _, name in rows}
+
+def leaderboard_rows(rows, names, offset=0):
+    return [
+        {
+            "position": offset + i,
+            "user_id": uid,
+            "username": names[uid],
+            "score": float(score),
+            "calories": int(float(score))
+        }
+        for i, (uid, score, _) in enumerate(rows, 1)
+    ]
+
+def friends_leaderboard_result(raw, rows_with_names):
+    rank, total = raw[0], raw[1]
+    return {
+        "position": rank + 1 if rank >= 0 else None,
+        "total": total,
+        "leaderboard": rows_with_names
+    }
+
+def calories_position(position, score):
+    return {
+        "position": (position + 1) if position is not None else None,
+        "calories": int(score) if score else 0
+    }
@@ -0,0 +1,580 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from redis.exceptions import NoScriptError, RedisError
+
+import activity_calendar
+import activity_feed
+import connections
+import diary_queries
+import leaderboards
+import passwords
+import training_rollups
+import user_cache
+from diary_queries import (USERNAMES_KEY, TRAINING_SIDE_EFFECTS_SCRIPT, LEADERBOARD_PAGE_SCRIPT,
+                           FRIENDS_LEADERBOARD_SCRIPT, friends_key)
+
+# Asynchroniczna warstwa usług dziennika - jedyna implementacja operacji użytkownika (konta i sesje,
+# treningi, znajomi, feed, serie, rankingi, analizy z cache) na asynchronicznych klientach MongoDB
+# (AsyncMongoClient) i Redis (redis.asyncio). Jeden proces może obsługiwać wielu użytkowników naraz,
+# a niezależne wywołania Mongo/Redis jednej operacji idą równolegle (asyncio.gather).
+# Funkcje zwracają dane - wyświetlanie zostaje w CLI (training_diary.py). training_diary.py udostępnia
+# te same operacje synchronicznie (opakowania przez run()), a na klientach synchronicznych zostawia
+# tylko narzędzia wsadowe (przebudowy, backfill, archiwizacja, import, usuwanie danych).
+
+# === DB SETUP ===
+# Klienci tworzeni przy pierwszym użyciu - już wewnątrz pętli zdarzeń, z którą są związani
+client = connections.Lazy(connections.get_async_mongo_client)
+db = connections.Lazy(connections.get_async_database)
+users_col = connections.async_collection("users")
+trainings_col = connections.async_collection(os.environ.get("TRAININGS_COLLECTION", "trainings"))
+# 1 = nowe treningi zapisują datę jako datę BSON zamiast stringa "RRRR-MM-DD"
+NATIVE_DATES = os.environ.get("TRAININGS_NATIVE_DATES", "0") == "1"
+friends_col = connections.async_collection("friends")
+rollups_col = connections.async_collection(training_rollups.ROLLUPS_COLLECTION)
+leaderboard_archive_col = connections.async_collection(leaderboards.ARCHIVE_COLLECTION)
+stats_applied_col = connections.async_collection(diary_queries.STATS_APPLIED_COLLECTION)
+
+redis_client = connections.Lazy(connections.get_async_redis)
+
+async def check_redis():
+    """Sprawdź Redis raz przy starcie; bez niego działają tylko operacje MongoDB"""
+    global redis_client
+    try:
+        await redis_client.ping()
+    except (RedisError, OSError):
+        redis_client = None
+    return redis_client is not None
+
+# === PĘTLA ZDARZEŃ DLA KODU SYNCHRONICZNEGO ===
+# Klienci asynchroniczni są związani z pętlą zdarzeń, w której powstali - wszystkie wywołania
+# z kodu synchronicznego idą do jednej trwałej pętli w wątku w tle
+_loop = None
+_loop_lock = threading.Lock()
+
+def _event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="diary-service", daemon=True).start()
+            # Redis sprawdzany raz, jak klient synchroniczny w connections.get_redis
+            asyncio.run_coroutine_threadsafe(check_redis(), loop).result()
+            _loop = loop
+    return _loop
+
+def run(coro):
+    """Wykonaj korutynę serwisu z kodu synchronicznego (CLI, funkcje training_diary.py) i zwróć wynik.
+    Można wywoływać z wielu wątków naraz (np. pula wątków importu) - korutyny idą równolegle w jednej pętli."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+    coro.close()
+    raise RuntimeError("run() wywołane wewnątrz pętli zdarzeń - użyj await")
+
+# === SKRYPTY LUA ===
+_lua_scripts = {}
+
+async def run_lua(source, keys=(), args=(), raw=False):
+    script = _lua_scripts.get(source)
+    if script is None:
+        script = _lua_scripts[source] = redis_client.register_script(source)
+    if not raw:
+        return await script(keys=list(keys), args=list(args))
+    try:
+        return await redis_client.execute_command("EVALSHA", script.sha, len(keys), *keys, *args, NEVER_DECODE=True)
+    except NoScriptError:
+        return await redis_client.execute_command("EVAL", source, len(keys), *keys, *args, NEVER_DECODE=True)
+
+# === CACHE ANALIZ UŻYTKOWNIKA ===
+async def cached(name, user_id, compute):
+    """Wynik `await compute()` z cache w Redis (user_cache.py) pod bieżącą wersją danych użytkownika.
+    Przy chybieniu liczy go jeden klient (blokada), pozostali czekają na jego wpis."""
+    if not user_cache.ENABLED or not redis_client:
+        return await compute()
+    keys, args = user_cache.lookup_call(name, user_id)
+    stamp, value, locked = await run_lua(user_cache.CACHE_LOOKUP_SCRIPT, keys, args)
+    if value:
+        return user_cache.loads(value)
+    key = user_cache.entry_key(user_id, stamp, name)
+    lock_key = f"{key}:lock"
+    if not locked:
+        deadline = time.monotonic() + user_cache.LOCK_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(user_cache.WAIT_INTERVAL)
+            value, computing = await redis_client.pipeline(transaction=False).get(key).exists(lock_key).execute()
+            if value:
+                return user_cache.loads(value)
+            if not computing:
+                break  # liczący klient przerwał bez zapisu - liczymy sami
+    pipe = redis_client.pipeline(transaction=False)
+    try:
+        result = await compute()
+        pipe.set(key, user_cache.dumps(result), ex=user_cache.CACHE_TTL)
+    finally:
+        if locked:
+            pipe.delete(lock_key)
+        await pipe.execute()
+    return result
+
+async def invalidate_user_cache(user_id):
+    """Unieważnij wszystkie wyniki użytkownika (add_training robi to w skrypcie efektów)"""
+    if redis_client:
+        await redis_client.incr(user_cache.version_key(user_id))
+
+async def invalidate_all_caches():
+    """Unieważnij wyniki wszystkich użytkowników - po zmianach danych poza add_training"""
+    if redis_client:
+        await redis_client.incr(user_cache.GENERATION_KEY)
+
+async def get_cache_stats():
+    """Trafienia, chybienia i czekania na wynik liczony przez innego klienta, per rodzaj wyniku"""
+    if not redis_client:
+        return {}
+    return user_cache.parse_stats(await redis_client.hgetall(user_cache.STATS_KEY))
+
+# === UŻYTKOWNICY ===
+async def cache_username(user_id, username):
+    if redis_client:
+        await redis_client.hset(USERNAMES_KEY, str(user_id), username)
+
+async def resolve_usernames(user_ids, cached=None):
+    names = dict(cached or {})
+    missing = [uid for uid in user_ids if not names.get(uid)]
+    if missing:
+        cursor = users_col.find({"_id": {"$in": diary_queries.username_lookup_ids(missing)}}, {"username": 1})
+        found = {str(u["_id"]): u["username"] async for u in cursor}
+        if found and redis_client:
+            await redis_client.hset(USERNAMES_KEY, mapping=found)
+        names.update(found)
+    return {uid: names.get(uid) or "Nieznany" for uid in user_ids}
+
+async def register_user(username, email, password, age, gender):
+    if await users_col.find_one({"username": username}, {"_id": 1}):
+        return False
+    # scrypt kosztuje CPU - liczymy go poza pętlą zdarzeń
+    password_hash = await asyncio.to_thread(passwords.hash_password, password)
+    result = await users_col.insert_one(diary_queries.new_user_document(username, email, password_hash, age, gender))
+    await cache_username(result.inserted_id, username)
+    return True
+
+async def verify_credentials(email, password):
+    user = await users_col.find_one({"email": email}, {"username": 1, "password_hash": 1})
+    if not user or not await asyncio.to_thread(passwords.verify_password, password, user.get("password_hash")):
+        return None
+    if passwords.needs_rehash(user["password_hash"]):
+        password_hash = await asyncio.to_thread(passwords.hash_password, password)
+        await users_col.update_one({"_id": user["_id"]}, {"$set": {"password_hash": password_hash}})
+    return user
+
+async def login_user(email, password):
+    user = await verify_credentials(email, password)
+    return user["_id"] if user else None
+
+# === SESJE ===
+async def create_session(user):
+    if not redis_client:
+        return None
+    token = diary_queries.new_session_token()
+    keys, args = diary_queries.create_session_call(user, token)
+    await run_lua(diary_queries.CREATE_SESSION_SCRIPT, keys, args)
+    return token
+
+async def login(email, password):
+    """Sesja po jednej weryfikacji hasła: {"token", "user_id", "username"} albo None"""
+    user = await verify_credentials(email, password)
+    if not user:
+        return None
+    return {"token": await create_session(user), "user_id": user["_id"], "username": user["username"]}
+
+async def authenticate(token):
+    """Dane sesji (user_id, username) z jednego round tripu do Redis; przesuwa TTL sesji"""
+    if not redis_client or not token:
+        return None
+    key = diary_queries.session_key(token)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(key)
+    pipe.expire(key, diary_queries.SESSION_TTL)
+    data, _ = await pipe.execute()
+    return diary_queries.parse_session(data)
+
+async def logout(token):
+    if redis_client and token:
+        await run_lua(diary_queries.LOGOUT_SCRIPT, [diary_queries.session_key(token)], [token])
+
+async def revoke_sessions(user_id):
+    if not redis_client:
+        return 0
+    return await run_lua(diary_queries.REVOKE_SESSIONS_SCRIPT, [diary_queries.user_sessions_key(user_id)],
+                         [diary_queries.SESSION_PREFIX])
+
+async def change_password(user_id, old_password, new_password):
+    """Zmień hasło i unieważnij wszystkie sesje użytkownika"""
+    user = await users_col.find_one({"_id": user_id}, {"password_hash": 1})
+    if not user or not await asyncio.to_thread(passwords.verify_password, old_password, user.get("password_hash")):
+        return False
+    password_hash = await asyncio.to_thread(passwords.hash_password, new_password)
+    await users_col.update_one({"_id": user_id}, {"$set": {"password_hash": password_hash}})
+    await revoke_sessions(user_id)
+    return True
+
+# === TRENINGI ===
+_trainings_layout = None
+
+async def trainings_layout():
+    global _trainings_layout
+    if _trainings_layout is None:
+        cursor = await db.list_collections(filter={"name": trainings_col.name})
+        info = await anext(cursor, None)
+        _trainings_layout = info.get("type", "collection") if info else "collection"
+    return _trainings_layout
+
+async def add_training(user_id, training):
+    """Zapisz trening (transakcja: trening, users.stats, rollupy), potem efekty w Redis.
+    Zwraca serię i pozycję w rankingu albo None, gdy Redis jest niedostępny."""
+    timeseries = await trainings_layout() == "timeseries"
+    # Kolekcja time-series wymaga daty BSON w polu czasu
+    diary_queries.prepare_training(user_id, training, NATIVE_DATES or timeseries)
+    rollup_ops = training_rollups.rollup_update_ops(training)
+    if timeseries:
+        # Znacznik i zapisywany po transakcji trening mają to samo _id
+        training.setdefault("_id", ObjectId())
+    # Operacje jednej sesji nie mogą iść równolegle - w transakcji wykonujemy je po kolei
+    async with client.start_session() as session:
+        async with await session.start_transaction():
+            if timeseries:
+                # Do kolekcji time-series nie można pisać w transakcji - w niej tylko znacznik statystyk
+                await stats_applied_col.insert_many(diary_queries.stats_applied_markers([training]), session=session)
+            else:
+                await trainings_col.insert_one(training, session=session)
+            await users_col.update_one({"_id": user_id}, diary_queries.user_stats_increment(training), session=session)
+            # Rollupy tydzień/miesiąc/całość - jeden bulk_write w tej samej transakcji
+            await rollups_col.bulk_write(rollup_ops, ordered=False, session=session)
+    if timeseries:
+        await insert_counted_training(training)
+    # Streak, rankingi i przypomnienie (jeden atomowy skrypt Redis) oraz wpis w feedach znajomych
+    effects, _ = await asyncio.gather(
+        apply_training_side_effects(user_id, training),
+        fan_out_training(training)
+    )
+    return effects
+
+async def insert_counted_training(training):
+    """Zapis treningu time-series po transakcji, która policzyła jego statystyki i rollupy. Gdy zapis
+    się nie uda (a treningu nie ma w kolekcji), druga transakcja cofa statystyki - ponowienie przez
+    użytkownika nie zostawia kopii ani podwójnych statystyk. Znacznik jest usuwany na końcu."""
+    try:
+        await trainings_col.insert_one(training)
+    except Exception:
+        # Błąd sieci mógł przyjść po zapisie - szukamy po indeksie (user_id, date, _id)
+        stored = await trainings_col.find_one(
+            {"user_id": training["user_id"], "date": training["date"], "_id": training["_id"]}, {"_id": 1})
+        if not stored:
+            async with client.start_session() as session:
+                async with await session.start_transaction():
+                    await users_col.update_one({"_id": training["user_id"]},
+                                               diary_queries.user_stats_increment(training, sign=-1), session=session)
+                    await rollups_col.bulk_write(training_rollups.rollup_update_ops(training, sign=-1),
+                                                 ordered=False, session=session)
+                    await rollups_col.delete_many({"user_id": training["user_id"], "count": {"$lte": 0}},
+                                                  session=session)
+                    await stats_applied_col.delete_one({"_id": training["_id"]}, session=session)
+            raise
+    await stats_applied_col.delete_one({"_id": training["_id"]})
+
+async def add_trainings_bulk_multi(trainings_by_user):
+    """Zapisz paczki treningów wielu użytkowników: {user_id: [trening, ...]}.
+    Każdy trening ma `dedup_key` od klienta - ponowienie po błędzie pomija już zapisane treningi,
+    więc kalorie i statystyki nie są liczone podwójnie. Jedna transakcja (insert_many, jedno $inc
+    users.stats na użytkownika, zagregowane rollupy, znaczniki) i jeden pipeline Redis na całą paczkę.
+    Znacznik treningu znika dopiero po pipeline - ponowienie odtwarza efekty w Redis treningów,
+    które mają jeszcze znacznik (proces przerwany po zatwierdzeniu transakcji)."""
+    diary_queries.validate_bulk(trainings_by_user)
+    timeseries = await trainings_layout() == "timeseries"
+    docs = diary_queries.prepare_bulk(trainings_by_user, NATIVE_DATES or timeseries)
+    ids = [doc["_id"] for doc in docs]
+
+    async def existing_ids(collection, session=None, query=None):
+        cursor = collection.find(query or {"_id": {"$in": ids}}, {"_id": 1}, session=session)
+        return {d["_id"] async for d in cursor}
+
+    new_docs = []
+    pending = []
+    unsaved = []
+    if timeseries:
+        # Kolekcja time-series: zapis po transakcji (i bez unikalnego _id - sprawdzamy przed zapisem)
+        # (bez indeksu _id - filtr po user_id i zakresie dat zawęża kubełki)
+        stored = await existing_ids(trainings_col, query=diary_queries.trainings_batch_filter(docs))
+        unsaved = [doc for doc in docs if doc["_id"] not in stored]
+
+    async def write(session):
+        nonlocal new_docs, pending
+        applied = await existing_ids(stats_applied_col, session)
+        if timeseries:
+            # Statystyki tylko dla treningów bez znacznika - ponowienie po błędzie zapisu treningów
+            # (już po tej transakcji) nie liczy ich drugi raz
+            new_docs = diary_queries.pending_stats(docs, stored, applied)
+        else:
+            existing = await existing_ids(trainings_col, session)
+            new_docs = [doc for doc in docs if doc["_id"] not in existing]
+            if new_docs:
+                await trainings_col.insert_many(new_docs, session=session)
+        if new_docs:
+            await stats_applied_col.insert_many(diary_queries.stats_applied_markers(new_docs), session=session)
+            await users_col.bulk_write(diary_queries.user_stats_ops(new_docs), ordered=False, session=session)
+            await rollups_col.bulk_write(training_rollups.aggregated_rollup_ops(new_docs), ordered=False,
+                                         session=session)
+        pending = diary_queries.pending_effects(docs, new_docs, applied)
+
+    async with client.start_session() as session:
+        # with_transaction ponawia całość przy błędach przejściowych (np. konflikt zapisu)
+        await session.with_transaction(write)
+    if unsaved:
+        await trainings_col.insert_many(unsaved)
+
+    effects = None
+    if pending and redis_client:
+        pipe = redis_client.pipeline(transaction=False)
+        plan = diary_queries.queue_bulk_side_effects(pipe, pending)
+        activity_feed.queue_fan_out(pipe, pending)
+        effects = diary_queries.parse_bulk_side_effects(plan, await pipe.execute())
+    if pending:
+        # Treningi zapisane, efekty w Redis wykonane - znaczniki nie są już potrzebne
+        await stats_applied_col.delete_many({"_id": {"$in": [doc["_id"] for doc in pending]}})
+    return diary_queries.bulk_summary(trainings_by_user, docs, new_docs, effects)
+
+async def add_trainings_bulk(user_id, trainings):
+    return (await add_trainings_bulk_multi({user_id: trainings}))[user_id]
+
+async def apply_training_side_effects(user_id, training, ranked=True, reminder=True):
+    if not redis_client:
+        return None
+    keys, args, day = diary_queries.side_effects_call(user_id, training, ranked, reminder)
+    return diary_queries.parse_side_effects(await run_lua(TRAINING_SIDE_EFFECTS_SCRIPT, keys, args, raw=True), day)
+
+async def get_training_history_page(user_id, after=None, limit=20, types=None, date_from=None, date_to=None, fields=None):
+    cursor = (trainings_col.find(diary_queries.history_query(user_id, after, types, date_from, date_to),
+                                 diary_queries.history_projection(fields))
+              .sort(diary_queries.HISTORY_SORT)
+              .limit(limit + 1)
+              .batch_size(limit + 1))
+    return diary_queries.history_page(await cursor.to_list(), limit)
+
+# === STATYSTYKI I ANALIZY (CACHE) ===
+async def _aggregate(collection, pipeline):
+    return await (await collection.aggregate(pipeline)).to_list()
+
+async def get_user_stats(user_id):
+    async def compute():
+        user = await users_col.find_one({"_id": user_id}, {"stats": 1})
+        return (user or {}).get("stats", {})
+    return await cached("user_stats", user_id, compute)
+
+async def get_user_rollup_summary(user_id):
+    """Bieżący tydzień, miesiąc i cały okres per typ - jedno zapytanie po indeksie rollupów"""
+    async def compute():
+        summary = {period: {} for period in training_rollups.PERIODS}
+        projection = {"_id": 0, "period": 1, "type": 1, "count": 1, "minutes": 1, "kcal": 1, "distance_km": 1}
+        async for doc in rollups_col.find(training_rollups.rollup_summary_filter(user_id), projection):
+            summary[doc["period"]][doc["type"]] = doc
+        return summary
+    # Bieżący tydzień i miesiąc są częścią wyniku - nowy tydzień to nowy wpis
+    name = "rollup_summary:" + ":".join(training_rollups.period_keys(datetime.now()).values())
+    return await cached(name, user_id, compute)
+
+async def get_cardio_intensity_description(user_id):
+    """Intensywność treningów cardio: zapisana wartość, a dla starszych dokumentów natywne $switch"""
+    return await cached("cardio_intensity", user_id, lambda: _aggregate(
+        trainings_col, diary_queries.cardio_intensity_pipeline(user_id)))
+
+async def get_training_durations_with_previous(user_id):
+    return await cached("durations_with_previous", user_id, lambda: _aggregate(
+        trainings_col, diary_queries.durations_with_previous_pipeline(user_id)))
+
+async def get_latest_duration_per_type(user_id):
+    """Ostatni trening każdego typu i czas poprzedniego (pipeline w diary_queries.py)"""
+    return await cached("latest_duration_per_type", user_id, lambda: _aggregate(
+        trainings_col, diary_queries.latest_duration_per_type_pipeline(user_id, trainings_col.name)))
+
+async def get_last_trainings(user_id, count=4):
+    return await cached(f"last_trainings:{count}", user_id, lambda: _aggregate(
+        trainings_col, diary_queries.last_trainings_pipeline(user_id, count)))
+
+# === ZNAJOMI ===
+async def mirror_friend_lists(friend_docs):
+    if not redis_client:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for doc in friend_docs:
+        friend_ids = [str(f) for f in doc.get("friends", [])]
+        if friend_ids:
+            pipe.sadd(friends_key(doc["user_id"]), *friend_ids)
+    await pipe.execute()
+
+async def add_friend_by_username(user_id, friend_username):
+    friend, user_friends = await asyncio.gather(
+        users_col.find_one({"username": friend_username}, {"_id": 1}),
+        friends_col.find_one({"user_id": user_id}, {"friends": 1})
+    )
+    if not friend or friend["_id"] == user_id:
+        return False
+    friend_id = friend["_id"]
+    if user_friends and friend_id in user_friends.get("friends", []):
+        return False
+    # Obie listy w MongoDB i lustro w Redis - niezależne zapisy równolegle
+    await asyncio.gather(
+        friends_col.update_one({"user_id": user_id}, {"$addToSet": {"friends": friend_id}}, upsert=True),
+        friends_col.update_one({"user_id": friend_id}, {"$addToSet": {"friends": user_id}}, upsert=True),
+        mirror_friend_lists([
+            {"user_id": user_id, "friends": [friend_id]},
+            {"user_id": friend_id, "friends": [user_id]}
+        ])
+    )
+    await backfill_friend_feeds(user_id, friend_id)
+    return True
+
+async def list_friends(user_id):
+    friends_doc = await friends_col.find_one({"user_id": user_id}, {"friends": 1})
+    if not friends_doc or "friends" not in friends_doc:
+        return []
+    return await users_col.find({"_id": {"$in": friends_doc["friends"]}}, {"username": 1}).to_list()
+
+# === AKTYWNOŚĆ ZNAJOMYCH ===
+async def fan_out_training(training):
+    if not redis_client:
+        return None
+    keys, args = activity_feed.fan_out_call(training)
+    return await run_lua(activity_feed.FEED_FANOUT_SCRIPT, keys, args)
+
+async def backfill_friend_feeds(user_id, friend_id):
+    if not redis_client:
+        return
+    authors = [str(user_id), str(friend_id)]
+    flags = await redis_client.smismember(activity_feed.POPULAR_KEY, authors)
+    popular = [author for author, flag in zip(authors, flags) if flag]
+    await asyncio.gather(*(run_lua(activity_feed.FEED_MERGE_SCRIPT, keys, args)
+                           for keys, args in activity_feed.backfill_calls(user_id, friend_id, popular)))
+
+async def get_friends_feed(user_id, offset=0, limit=20):
+    """Strona ostatnich treningów znajomych - jeden skrypt Redis (+ najwyżej jedno zapytanie o nazwy)"""
+    if not redis_client:
+        return None
+    keys, args = activity_feed.feed_page_call(user_id, offset, limit)
+    items, cached = activity_feed.split_feed_raw(await run_lua(activity_feed.FEED_PAGE_SCRIPT, keys, args))
+    names = await resolve_usernames([item["user_id"] for item in items], cached)
+    return activity_feed.feed_page(items, names, offset, limit)
+
+# === SERIE I PRZYPOMNIENIA ===
+async def get_activity_bits(user_id):
+    if not redis_client:
+        return 0
+    data = await redis_client.execute_command("GET", activity_calendar.activity_key(user_id), NEVER_DECODE=True)
+    return activity_calendar.bitmap_to_int(data)
+
+async def get_user_streak(user_id):
+    """Aktualna i najlepsza seria oraz liczba dni treningowych w tym miesiącu"""
+    return diary_queries.streak_overview(await get_activity_bits(user_id))
+
+async def set_training_reminder(user_id):
+    """Ustaw przypomnienie o treningu na jutro"""
+    if redis_client:
+        await redis_client.set(diary_queries.reminder_key(user_id), diary_queries.REMINDER_MESSAGE,
+                               ex=diary_queries.REMINDER_TTL)
+
+async def get_training_reminder(user_id):
+    if not redis_client:
+        return None
+    reminder_key = diary_queries.reminder_key(user_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(reminder_key)
+    pipe.ttl(reminder_key)
+    return diary_queries.format_reminder(*await pipe.execute())
+
+# === RANKINGI ===
+async def build_leaderboard_rows(raw, offset=0):
+    rows, cached = diary_queries.split_leaderboard_raw(raw)
+    names = await resolve_usernames([uid for uid, _, _ in rows], cached)
+    return diary_queries.leaderboard_rows(rows, names, offset)
+
+async def fetch_leaderboard_page(leaderboard_key, offset=0, limit=10):
+    """Strona rankingu: pozycje, wyniki i nazwy (1 wywołanie Redis + najwyżej 1 zapytanie Mongo)"""
+    if not redis_client or limit <= 0:
+        return []
+    raw = await run_lua(LEADERBOARD_PAGE_SCRIPT, [leaderboard_key, USERNAMES_KEY], [offset, offset + limit - 1])
+    return await build_leaderboard_rows(raw, offset)
+
+async def get_calories_leaderboard(offset=0, limit=10):
+    return await fetch_leaderboard_page(diary_queries.calories_key(), offset, limit)
+
+async def get_leaderboard(metric="calories", period="week", period_key=None, training_type=None, offset=0, limit=10):
+    """Strona rankingu dowolnego okresu, miary i typu; zamknięte okresy, których klucze
+    wygasły, są czytane z archiwum w MongoDB"""
+    if not redis_client or limit <= 0:
+        return []
+    period_key = period_key or leaderboards.period_keys(datetime.now().date())[period]
+    raw = await run_lua(LEADERBOARD_PAGE_SCRIPT,
+                        [leaderboards.leaderboard_key(metric, period_key, training_type), USERNAMES_KEY],
+                        [offset, offset + limit - 1])
+    if not raw and leaderboards.is_closed(period, period_key):
+        doc = await leaderboard_archive_col.find_one(leaderboards.archive_filter(metric, period_key, training_type),
+                                                     leaderboards.archive_projection(offset, limit))
+        raw = leaderboards.archived_raw(doc)
+    return await build_leaderboard_rows(raw, offset)
+
+async def update_calories_leaderboard(user_id, calories):
+    """Dodaj kalorie do rankingów kalorii bieżących okresów (bez podziału na typ)"""
+    if not redis_client:
+        return
+    user_id_str = str(user_id)
+    # Wygaśnięcie liczone od końca okresu (EXPIREAT) - kolejne zapisy go nie przesuwają
+    pipe = redis_client.pipeline(transaction=False)
+    for key, value, expires in leaderboards.increments(datetime.now().date(), None, {"kcal": calories}):
+        pipe.zincrby(key, value, user_id_str)
+        if expires:
+            pipe.expireat(key, expires)
+    await pipe.execute()
+
+async def get_user_calories_position(user_id):
+    if not redis_client:
+        return None
+    user_id_str = str(user_id)
+    calories_key = diary_queries.calories_key()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zrevrank(calories_key, user_id_str)
+    pipe.zscore(calories_key, user_id_str)
+    return diary_queries.calories_position(*await pipe.execute())
+
+async def get_friends_calories_leaderboard(user_id, limit=10):
+    if not redis_client:
+        return None
+    keys, args = diary_queries.friends_leaderboard_call(user_id, limit)
+    raw = await run_lua(FRIENDS_LEADERBOARD_SCRIPT, keys, args)
+    return diary_queries.friends_leaderboard_result(raw, await build_leaderboard_rows(raw[2:]))
+
+async def get_leaderboard_view(user_id, offset=0, limit=10):
+    """Strona rankingu i pozycja użytkownika - oba odczyty równolegle"""
+    leaderboard, position = await asyncio.gather(
+        get_calories_leaderboard(offset, limit),
+        get_user_calories_position(user_id)
+    )
+    return {"leaderboard": leaderboard, "position": position}
+
+async def get_dashboard(user_id):
+    """Podsumowanie po zalogowaniu: seria, pozycja, przypomnienie i statystyki - równolegle"""
+    streak, position, reminder, stats = await asyncio.gather(
+        get_user_streak(user_id),
+        get_user_calories_position(user_id),
+        get_training_reminder(user_id),
+        users_col.find_one({"_id": user_id}, {"stats": 1})
+    )
+    return {
+        "streak": streak,
+        "position": position,
+        "reminder": reminder,
+        "stats": (stats or {}).get("stats", {})
+    }
@@ -1,135 +1,239 @@
-import uuid
-import json
-import random
-from datetime import datetime, timedelta
-
-# Generator użytkowników
-def generate_users(count):
-    first_names = ["janek", "ania", "kasia", "marek", "ola", "bartek", "zosia", "tomek", "gosia", "krzysiek"]
-    users = []
-    for i in range(count):
-        name = random.choice(first_names)
-        user = {
-            "_id": str(uuid.uuid4()),
-            "username": f"{name}{random.randint(100, 999)}",
-            "email": f"{name}{i}@example.com",
-            "password_hash": f"hashed_password_{i}",
-            "age": random.randint(18, 50),
-            "gender": random.choice(["male", "female"])
-        }
-        users.append(user)
-    return users
-
-# Typy treningów
-activity_types = [
-    "siłownia", "bieganie", "pływanie", "rower",
-    "yoga", "kalistenika", "trening funkcjonalny"
-]
-
-strength_exercises = ["przysiady", "martwy ciąg", "wyciskanie leżąc", "wiosłowanie", "podciąganie"]
-calisthenics_exercises = ["pompki", "dipy", "mostek", "podciąganie australijskie"]
-functional_exercises = ["kettlebell swing", "burpees", "box jump", "battle rope"]
-
-# Generator treningów
-def generate_trainings(user_id, days=12):
-    trainings = []
-    for i in range(days):
-        date = datetime.now() - timedelta(days=i)
-        activity_type = random.choice(activity_types)
-        entry = {
-            "user_id": user_id,
-            "date": date.strftime("%Y-%m-%d"),
-            "type": activity_type,
-            "notes": f"Trening typu {activity_type} w dniu {date.strftime('%d-%m-%Y')}"
-        }
-
-        if activity_type == "siłownia":
-            entry["metrics"] = {
-                "exercises": [
-                    {
-                        "name": random.choice(strength_exercises),
-                        "sets": random.randint(3, 5),
-                        "reps": random.randint(6, 12),
-                        "weight": random.choice([60, 80, 100, 120])
-                    } for _ in range(2)
-                ]
-            }
-        elif activity_type == "bieganie":
-            km = round(random.uniform(3, 15), 2)
-            minutes = round(km * random.uniform(4.5, 6.5), 2)
-            entry["metrics"] = {
-                "distance_km": km,
-                "duration_min": minutes,
-                "calories_burned": random.randint(300, 700)
-            }
-        elif activity_type == "pływanie":
-            entry["metrics"] = {
-                "laps": random.randint(10, 40),
-                "distance_m": random.randint(500, 2000),
-                "stroke": random.choice(["freestyle", "breaststroke", "backstroke"])
-            }
-        elif activity_type == "rower":
-            km = round(random.uniform(5, 40), 2)
-            minutes = round(km * random.uniform(2.0, 2.8), 2)
-            entry["metrics"] = {
-                "distance_km": km,
-                "duration_min": minutes
-            }
-        elif activity_type == "yoga":
-            entry["metrics"] = {
-                "duration_min": random.randint(30, 90),
-                "style": random.choice(["vinyasa", "hatha", "yin"])
-            }
-        elif activity_type == "kalistenika":
-            entry["metrics"] = {
-                "exercises": [
-                    {
-                        "name": random.choice(calisthenics_exercises),
-                        "sets": random.randint(2, 5),
-                        "reps": random.randint(8, 20)
-                    } for _ in range(3)
-                ]
-            }
-        elif activity_type == "trening funkcjonalny":
-            entry["metrics"] = {
-                "exercises": [
-                    {
-                        "name": random.choice(functional_exercises),
-                        "duration_sec": random.randint(20, 60),
-                        "rounds": random.randint(2, 5)
-                    } for _ in range(3)
-                ]
-            }
-
-        trainings.append(entry)
-    return trainings
-
-# GENEROWANIE DANYCH
-users = generate_users(10)
-trainings = []
-for user in users:
-    trainings.extend(generate_trainings(user["_id"]))
-
-# GENEROWANIE ZNAJOMYCH
-def generate_friendships(users):
-    friendships = []
-    user_ids = [u["_id"] for u in users]
-    for user_id in user_ids:
-        friends = random.sample([uid for uid in user_ids if uid != user_id], k=random.randint(2, 4))
-        friendships.append({
-            "user_id": user_id,
-            "friends": friends
-        })
-    return friendships
-
-friend_data = generate_friendships(users)
-
-# ZAPIS DO PLIKÓW
-with open("users_10.json", "w", encoding="utf-8") as f:
-    json.dump(users, f, indent=2, ensure_ascii=False)
-
-with open("trainings_10_users.json", "w", encoding="utf-8") as f:
-    json.dump(trainings, f, indent=2, ensure_ascii=False)
-
-with open("friends.json", "w", encoding="utf-8") as f:
-    json.dump(friend_data, f, indent=2, ensure_ascii=False)
\ No newline at end of file
+import uuid
+import json
+import os
+import random
+import argparse
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+# Imiona do generowania nazw użytkowników
+first_names = ["janek", "ania", "kasia", "marek", "ola", "bartek", "zosia", "tomek", "gosia", "krzysiek"]
+
+# Typy treningów
+activity_types = [
+    "siłownia", "bieganie", "pływanie", "rower",
+    "yoga", "kalistenika", "trening funkcjonalny"
+]
+
+strength_exercises = ["przysiady", "martwy ciąg", "wyciskanie leżąc", "wiosłowanie", "podciąganie"]
+calisthenics_exercises = ["pompki", "dipy", "mostek", "podciąganie australijskie"]
+functional_exercises = ["kettlebell swing", "burpees", "box jump", "battle rope"]
+
+# === DETERMINISTYCZNE ID ===
+def user_id_for(seed, index):
+    """ID użytkownika zależy tylko od ziarna i numeru - każdy proces wyliczy je sam"""
+    rng = random.Random(f"user-id:{seed}:{index}")
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+# Generator użytkownika
+def generate_user(rng, seed, index):
+    name = rng.choice(first_names)
+    return {
+        "_id": user_id_for(seed, index),
+        "username": f"{name}{index}",
+        "email": f"{name}{index}@example.com",
+        "password_hash": f"hashed_password_{index}",
+        "age": rng.randint(18, 50),
+        "gender": rng.choice(["male", "female"])
+    }
+
+# Generator metryk dla danego typu treningu
+def generate_metrics(rng, activity_type):
+    if activity_type == "siłownia":
+        return {
+            "exercises": [
+                {
+                    "name": rng.choice(strength_exercises),
+                    "sets": rng.randint(3, 5),
+                    "reps": rng.randint(6, 12),
+                    "weight": rng.choice([60, 80, 100, 120])
+                } for _ in range(2)
+            ]
+        }
+    elif activity_type == "bieganie":
+        km = round(rng.uniform(3, 15), 2)
+        minutes = round(km * rng.uniform(4.5, 6.5), 2)
+        return {
+            "distance_km": km,
+            "duration_min": minutes,
+            "calories_burned": rng.randint(300, 700)
+        }
+    elif activity_type == "pływanie":
+        return {
+            "laps": rng.randint(10, 40),
+            "distance_m": rng.randint(500, 2000),
+            "stroke": rng.choice(["freestyle", "breaststroke", "backstroke"])
+        }
+    elif activity_type == "rower":
+        km = round(rng.uniform(5, 40), 2)
+        minutes = round(km * rng.uniform(2.0, 2.8), 2)
+        return {
+            "distance_km": km,
+            "duration_min": minutes
+        }
+    elif activity_type == "yoga":
+        return {
+            "duration_min": rng.randint(30, 90),
+            "style": rng.choice(["vinyasa", "hatha", "yin"])
+        }
+    elif activity_type == "kalistenika":
+        return {
+            "exercises": [
+                {
+                    "name": rng.choice(calisthenics_exercises),
+                    "sets": rng.randint(2, 5),
+                    "reps": rng.randint(8, 20)
+                } for _ in range(3)
+            ]
+        }
+    elif activity_type == "trening funkcjonalny":
+        return {
+            "exercises": [
+                {
+                    "name": rng.choice(functional_exercises),
+                    "duration_sec": rng.randint(20, 60),
+                    "rounds": rng.randint(2, 5)
+                } for _ in range(3)
+            ]
+        }
+    return {}
+
+# Generator treningów (generator - nie trzyma historii w pamięci)
+def generate_trainings(rng, user_id, days, end_date, mix, activity_rate=1.0):
+    types, weights = zip(*mix.items())
+    for i in range(days):
+        if rng.random() >= activity_rate:
+            continue
+        date = end_date - timedelta(days=i)
+        activity_type = rng.choices(types, weights)[0]
+        yield {
+            "user_id": user_id,
+            "date": date.strftime("%Y-%m-%d"),
+            "type": activity_type,
+            "notes": f"Trening typu {activity_type} w dniu {date.strftime('%d-%m-%Y')}",
+            "metrics": generate_metrics(rng, activity_type)
+        }
+
+# Generator listy znajomych (indeksy losowane z całej puli użytkowników)
+def generate_friendship(rng, seed, index, total_users, min_friends, max_friends):
+    k = min(rng.randint(min_friends, max_friends), total_users - 1)
+    friend_indexes = set()
+    while len(friend_indexes) < k:
+        candidate = rng.randrange(total_users)
+        if candidate != index:
+            friend_indexes.add(candidate)
+    return {
+        "user_id": user_id_for(seed, index),
+        "friends": [user_id_for(seed, j) for j in sorted(friend_indexes)]
+    }
+
+# === GENEROWANIE SHARDU ===
+def write_ndjson_line(f, doc):
+    f.write(json.dumps(doc, ensure_ascii=False))
+    f.write("\n")
+
+def generate_shard(job):
+    """Zapisz jeden shard (users/trainings/friends) dla zakresu użytkowników"""
+    shard, first, last, params = job
+    rng = random.Random(f"shard:{params['seed']}:{shard}")
+    end_date = datetime.strptime(params["end_date"], "%Y-%m-%d")
+    out_dir = params["out_dir"]
+    suffix = f"{shard:05d}.ndjson"
+    counts = {"users": 0, "trainings": 0, "friends": 0}
+
+    with open(os.path.join(out_dir, f"users-{suffix}"), "w", encoding="utf-8") as users_f, \
+         open(os.path.join(out_dir, f"trainings-{suffix}"), "w", encoding="utf-8") as trainings_f, \
+         open(os.path.join(out_dir, f"friends-{suffix}"), "w", encoding="utf-8") as friends_f:
+        for index in range(first, last):
+            user = generate_user(rng, params["seed"], index)
+            write_ndjson_line(users_f, user)
+            counts["users"] += 1
+
+            for training in generate_trainings(rng, user["_id"], params["days"], end_date,
+                                               params["mix"], params["activity_rate"]):
+                write_ndjson_line(trainings_f, training)
+                counts["trainings"] += 1
+
+            if params["total_users"] > 1 and params["max_friends"] > 0:
+                write_ndjson_line(friends_f, generate_friendship(
+                    rng, params["seed"], index, params["total_users"],
+                    params["min_friends"], params["max_friends"]))
+                counts["friends"] += 1
+    return shard, counts
+
+def generate_dataset(users=10, days=12, mix=None, min_friends=2, max_friends=4, seed=0,
+                     end_date=None, activity_rate=1.0, out_dir="generated_data",
+                     shard_size=10000, workers=None):
+    """Wygeneruj zbiór danych jako shardy NDJSON, równolegle w wielu procesach"""
+    os.makedirs(out_dir, exist_ok=True)
+    params = {
+        "seed": seed,
+        "days": days,
+        "mix": mix or {t: 1 for t in activity_types},
+        "min_friends": min_friends,
+        "max_friends": max_friends,
+        "total_users": users,
+        "end_date": end_date or datetime.now().strftime("%Y-%m-%d"),
+        "activity_rate": activity_rate,
+        "out_dir": out_dir,
+    }
+    jobs = [
+        (shard, first, min(first + shard_size, users), params)
+        for shard, first in enumerate(range(0, users, shard_size))
+    ]
+    totals = {"users": 0, "trainings": 0, "friends": 0}
+    with Pool(processes=workers) as pool:
+        for shard, counts in pool.imap_unordered(generate_shard, jobs):
+            for name, count in counts.items():
+                totals[name] += count
+            print(f"Shard {shard:05d}: {counts['users']} użytkowników, {counts['trainings']} treningów")
+    return totals
+
+# === CLI ===
+def parse_mix(value):
+    """Parsuj mieszankę aktywności w formacie 'bieganie=3,rower=2,yoga=1'"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in activity_types:
+            raise argparse.ArgumentTypeError(f"Nieznany typ treningu: {name}")
+        mix[name] = float(weight) if weight else 1.0
+    return mix
+
+def parse_degree(value):
+    """Parsuj liczbę znajomych: '3' albo zakres '2-4'"""
+    low, _, high = value.partition("-")
+    low = int(low)
+    high = int(high) if high else low
+    if low < 0 or high < low:
+        raise argparse.ArgumentTypeError(f"Niepoprawny zakres znajomych: {value}")
+    return low, high
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generator danych testowych (shardy NDJSON)")
+    parser.add_argument("--users", type=int, default=10, help="liczba użytkowników")
+    parser.add_argument("--days", type=int, default=12, help="liczba dni historii na użytkownika")
+    parser.add_argument("--activity-rate", type=float, default=1.0,
+                        help="prawdopodobieństwo treningu danego dnia (0-1)")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="wagi typów treningów, np. 'bieganie=3,rower=2,yoga=1'")
+    parser.add_argument("--friends", type=parse_degree, default=(2, 4),
+                        help="liczba znajomych na użytkownika: 'N' albo 'MIN-MAX'")
+    parser.add_argument("--seed", type=int, default=0, help="ziarno losowania (te same dane dla tego samego ziarna)")
+    parser.add_argument("--end-date", default=None, help="data ostatniego dnia historii (RRRR-MM-DD), domyślnie dziś")
+    parser.add_argument("--shard-size", type=int, default=10000, help="liczba użytkowników w jednym shardzie")
+    parser.add_argument("--workers", type=int, default=None, help="liczba procesów (domyślnie liczba CPU)")
+    parser.add_argument("--out", default="generated_data", help="katalog wyjściowy")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    totals = generate_dataset(
+        users=args.users, days=args.days, mix=args.mix,
+        min_friends=args.friends[0], max_friends=args.friends[1],
+        seed=args.seed, end_date=args.end_date, activity_rate=args.activity_rate,
+        out_dir=args.out, shard_size=args.shard_size, workers=args.workers
+    )
+    print(f"Wygenerowano {totals['users']} użytkowników, {totals['trainings']} treningów, "
+          f"{totals['friends']} list znajomych w katalogu {args.out}.")
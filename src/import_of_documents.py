@@ -1,30 +1,255 @@
-from pymongo import MongoClient
-import json
-
-# Połączenie z lokalną bazą MongoDB
-client = MongoClient("mongodb://127.0.0.1:27017/?replicaSet=rs0")
-db = client["training_diary"]
-
-# === USERS ===
-with open("users_10.json", encoding="utf-8") as f:
-    users = json.load(f)
-
-db.users.delete_many({})
-db.users.insert_many(users)
-print("Załadowano użytkowników.")
-
-# === TRAININGS ===
-with open("trainings_10_users.json", encoding="utf-8") as f:
-    trainings = json.load(f)
-
-db.trainings.delete_many({})
-db.trainings.insert_many(trainings)
-print("Załadowano treningi.")
-
-# === FRIENDS === 
-with open("friends.json", encoding="utf-8") as f:
-    friends_data = json.load(f)
-
-db.friends.delete_many({})
-db.friends.insert_many(friends_data)
-print("Załadowano znajomych do kolekcji friends.")
\ No newline at end of file
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import argparse
+import hashlib
+import json
+import os
+import time
+import connections
+import indexes
+from training_diary import mirror_friend_lists, invalidate_all_caches
+
+# Połączenie z MongoDB (wspólna konfiguracja, tworzone przy pierwszym użyciu)
+db = connections.Lazy(connections.get_database)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHECKPOINT = "import_checkpoint.json"
+PROGRESS_EVERY = 50000
+READ_CHUNK_SIZE = 1 << 16
+DUPLICATE_KEY_ERROR = 11000
+
+# === STRUMIENIOWE CZYTANIE PLIKÓW ===
+def detect_format(path):
+    """Rozpoznaj format pliku: 'array' (tablica JSON) albo 'ndjson' (dokument na linię)"""
+    with open(path, encoding="utf-8") as f:
+        while True:
+            ch = f.read(1)
+            if not ch:
+                return "ndjson"
+            if not ch.isspace():
+                return "array" if ch == "[" else "ndjson"
+
+def _refill(f, buf, pos):
+    chunk = f.read(READ_CHUNK_SIZE)
+    return buf[pos:] + chunk, 0, not chunk
+
+def iter_json_array(f):
+    """Parsuj tablicę JSON przyrostowo - w pamięci jest tylko bieżący fragment pliku"""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = _refill(f, "", 0)
+    started = False
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                if started:
+                    raise ValueError("Niekompletna tablica JSON")
+                return
+            buf, pos, eof = _refill(f, buf, pos)
+            continue
+
+        ch = buf[pos]
+        if not started:
+            if ch != "[":
+                raise ValueError("Plik nie zaczyna się od tablicy JSON")
+            started = True
+            pos += 1
+        elif ch == "]":
+            return
+        elif ch == ",":
+            pos += 1
+        else:
+            try:
+                doc, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Dokument przecięty na granicy fragmentu - doczytaj resztę
+                if eof:
+                    raise
+                buf, pos, eof = _refill(f, buf, pos)
+                continue
+            pos = end
+            yield doc
+
+def iter_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_documents(path):
+    """Zwróć generator dokumentów z pliku (tablica JSON lub NDJSON)"""
+    fmt = detect_format(path)
+    with open(path, encoding="utf-8") as f:
+        if fmt == "array":
+            yield from iter_json_array(f)
+        else:
+            yield from iter_ndjson(f)
+
+def iter_batches(docs, batch_size):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# === CHECKPOINT ===
+class Checkpoint:
+    """Zapisuje liczbę zaimportowanych dokumentów dla każdego pliku"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def get(self, key):
+        return self.state.get(key, {"done": 0, "completed": False})
+
+    def update(self, key, done, completed=False):
+        with self.lock:
+            self.state[key] = {"done": done, "completed": completed}
+            if not self.path:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self.lock:
+            self.state = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+# === OPERACJE ZAPISU ===
+def deterministic_id(source, index):
+    """Stałe _id dla dokumentów bez _id - ponowienie paczki nie tworzy duplikatów"""
+    digest = hashlib.md5(f"{source}:{index}".encode("utf-8")).digest()
+    return ObjectId(digest[:12])
+
+def insert_ops(batch, source, start_index):
+    ops = []
+    for i, doc in enumerate(batch, start_index):
+        if "_id" not in doc:
+            doc["_id"] = deterministic_id(source, i)
+        ops.append(InsertOne(doc))
+    return ops
+
+def friends_ops(batch, source, start_index):
+    # Listy znajomych są scalane ($addToSet), więc ponowny import jest bezpieczny
+    return [
+        UpdateOne(
+            {"user_id": doc["user_id"]},
+            {"$addToSet": {"friends": {"$each": doc.get("friends", [])}}},
+            upsert=True
+        )
+        for doc in batch
+    ]
+
+def write_batch(collection, ops):
+    """Zapis nieuporządkowany; duplikaty _id (np. po wznowieniu) są pomijane"""
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != DUPLICATE_KEY_ERROR for err in errors):
+            raise
+
+# === IMPORT JEDNEJ KOLEKCJI ===
+def import_file(path, collection_name, build_ops, checkpoint, batch_size=DEFAULT_BATCH_SIZE, after_write=None):
+    key = f"{collection_name}:{os.path.abspath(path)}"
+    state = checkpoint.get(key)
+    if state["completed"]:
+        print(f"[{collection_name}] Pominięto - plik {path} już zaimportowany.")
+        return state["done"]
+
+    collection = db[collection_name]
+    source = os.path.basename(path)
+    skip = state["done"]
+    if skip:
+        print(f"[{collection_name}] Wznawianie od dokumentu {skip}.")
+
+    docs = iter_documents(path)
+    for _ in range(skip):
+        next(docs, None)
+
+    done = skip
+    started = time.perf_counter()
+    next_report = done + PROGRESS_EVERY
+    for batch in iter_batches(docs, batch_size):
+        write_batch(collection, build_ops(batch, source, done))
+        if after_write:
+            after_write(batch)
+        done += len(batch)
+        checkpoint.update(key, done)
+        if done >= next_report:
+            elapsed = time.perf_counter() - started
+            rate = (done - skip) / elapsed if elapsed else 0
+            print(f"[{collection_name}] {done} dokumentów ({rate:.0f} dok/s)")
+            next_report = done + PROGRESS_EVERY
+
+    checkpoint.update(key, done, completed=True)
+    elapsed = time.perf_counter() - started
+    rate = (done - skip) / elapsed if elapsed else 0
+    print(f"[{collection_name}] Zakończono: {done} dokumentów w {elapsed:.1f} s ({rate:.0f} dok/s)")
+    return done
+
+def import_files(paths, collection_name, build_ops, checkpoint, batch_size=DEFAULT_BATCH_SIZE, after_write=None):
+    """Importuj kolejno kilka plików (np. shardy z generatora) do jednej kolekcji"""
+    if isinstance(paths, str):
+        paths = [paths]
+    return sum(import_file(path, collection_name, build_ops, checkpoint, batch_size, after_write)
+               for path in paths)
+
+def run_import(users_paths, trainings_paths, friends_paths,
+               batch_size=DEFAULT_BATCH_SIZE, checkpoint_path=DEFAULT_CHECKPOINT):
+    """Importuj trzy kolekcje równolegle; po błędzie kolejne uruchomienie wznawia import"""
+    # Indeksy przed importem: upserty znajomych po user_id korzystają z indeksu unikalnego
+    indexes.ensure_indexes(db)
+    checkpoint = Checkpoint(checkpoint_path)
+    jobs = [
+        (users_paths, "users", insert_ops, None),
+        (trainings_paths, "trainings", insert_ops, None),
+        # Znajomi trafiają też do lustra w Redis (ranking wśród znajomych)
+        (friends_paths, "friends", friends_ops, mirror_friend_lists),
+    ]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = {
+            name: pool.submit(import_files, paths, name, build_ops, checkpoint, batch_size, after_write)
+            for paths, name, build_ops, after_write in jobs if paths
+        }
+    results = {name: future.result() for name, future in futures.items()}
+    checkpoint.clear()
+    # Zaimportowane treningi nie przechodzą przez add_training - wyniki w cache są nieaktualne
+    invalidate_all_caches()
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Strumieniowy import danych do MongoDB (tablica JSON lub NDJSON)")
+    parser.add_argument("--users", nargs="*", default=["users_10.json"])
+    parser.add_argument("--trainings", nargs="*", default=["trainings_10_users.json"])
+    parser.add_argument("--friends", nargs="*", default=["friends.json"])
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT,
+                        help="plik z postępem importu (wznawianie po awarii)")
+    parser.add_argument("--rebuild-redis", action="store_true",
+                        help="po imporcie odbuduj serie, rankingi i przypomnienia w Redis")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    run_import(args.users, args.trainings, args.friends, args.batch_size, args.checkpoint)
+    print("Załadowano użytkowników, treningi i znajomych.")
+    if args.rebuild_redis:
+        from rebuild_redis_state import rebuild_all
+        # Lustro znajomych zostało już zaktualizowane w trakcie importu
+        rebuild_all(friends=False)
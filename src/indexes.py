@@ -0,0 +1,291 @@
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+import connections
+import diary_queries
+import leaderboards
+import training_dates
+import training_rollups
+
+# Indeksy aplikacji zadeklarowane w Pythonie (database/mongo_init_script.js tworzy je tylko
+# raz, przy inicjalizacji kontenera). ensure_indexes() jest idempotentne: tworzy brakujące,
+# pomija istniejące (po kluczu, niezależnie od nazwy) i zgłasza konflikty opcji (np. indeks
+# bez `unique` tam, gdzie jest wymagany) zamiast je usuwać. Wywoływane przy starcie aplikacji
+# i przed importem danych.
+#
+# check_query_plans() uruchamia explain() dla każdego zapytania wysyłanego przez
+# training_diary.py w obsłudze użytkownika oraz przez usuwanie danych, backfill i eksport
+# i zgłasza COLLSCAN albo sortowanie w pamięci (SORT nad danymi kolekcji). Przebudowy
+# z założenia czytające całą kolekcję (rebuild_rollups, rebuild_friends_mirror) nie są sprawdzane.
+#
+#   python indexes.py                 # utwórz brakujące indeksy
+#   python indexes.py --check         # + sprawdź plany zapytań (kod wyjścia 1 przy problemach)
+
+TRAININGS_COLLECTION = os.environ.get("TRAININGS_COLLECTION", "trainings")
+
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        # login: wyszukanie po email (hasło jest sprawdzane w Pythonie)
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    TRAININGS_COLLECTION: [
+        # historia, porównanie ostatnich treningów (sort date, _id)
+        IndexModel([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)]),
+        # okno po typie, ostatni trening każdego typu, intensywność cardio
+        IndexModel([("user_id", ASCENDING), ("type", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("type", ASCENDING)]),
+        # eksport tygodni (zakres dat w kolejności dat) i retencja time-series (zakres dat paczkami)
+        IndexModel([("date", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    # Jeden dokument znajomych na użytkownika - upserty po user_id nie mogą tworzyć duplikatów
+    "friends": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    training_rollups.ROLLUPS_COLLECTION: [
+        IndexModel([(field, ASCENDING) for field in training_rollups.ROLLUP_KEY_FIELDS], unique=True),
+    ],
+    # Jedna migawka na okres × miarę × typ (odczyt archiwalnego rankingu i upsert archiwizacji)
+    leaderboards.ARCHIVE_COLLECTION: [
+        IndexModel([(field, ASCENDING) for field in leaderboards.ARCHIVE_KEY_FIELDS], unique=True),
+        # usunięcie konta: $pull pozycji użytkownika ze wszystkich migawek
+        IndexModel([("entries.user_id", ASCENDING)]),
+    ],
+    # Znaczniki policzonych treningów: odczyt po _id, usunięcie konta po user_id
+    diary_queries.STATS_APPLIED_COLLECTION: [
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+}
+
+# === TWORZENIE INDEKSÓW ===
+def _key(spec):
+    return tuple((field, int(direction)) for field, direction in spec)
+
+def _options(document):
+    return {"unique": bool(document.get("unique", False))}
+
+def ensure_indexes(db=None, collections=None, rebuild_conflicting=False, quiet=False):
+    """Utwórz brakujące indeksy; zwraca {kolekcja: {created, existing, conflicts, redundant}}.
+    redundant: niezadeklarowane indeksy będące prefiksem zadeklarowanego (np. po zmianie indeksu)."""
+    db = db if db is not None else connections.get_database()
+    report = {}
+    for name in collections or INDEXES:
+        collection = db[name]
+        declared = INDEXES[name]
+        existing = {}
+        for index_name, info in collection.index_information().items():
+            existing[_key(info["key"])] = (index_name, _options(info))
+        result = {"created": [], "existing": [], "conflicts": [], "redundant": []}
+        missing = []
+        for model in declared:
+            document = model.document
+            key = _key(document["key"].items())
+            if key not in existing:
+                missing.append(model)
+                continue
+            index_name, options = existing[key]
+            if options == _options(document):
+                result["existing"].append(index_name)
+            elif rebuild_conflicting:
+                collection.drop_index(index_name)
+                missing.append(model)
+            else:
+                result["conflicts"].append(f"{index_name}: jest {options}, wymagane {_options(document)}")
+        for model in missing:
+            try:
+                result["created"].append(collection.create_indexes([model])[0])
+            except OperationFailure as e:
+                # Np. duplikaty przy indeksie unikalnym - dane trzeba najpierw poprawić
+                result["conflicts"].append(f"{model.document['name']}: {e.details.get('errmsg', e) if e.details else e}")
+        declared_keys = {_key(model.document["key"].items()) for model in declared}
+        for key, (index_name, _) in existing.items():
+            if key not in declared_keys and key != (("_id", 1),) and any(
+                    declared_key[:len(key)] == key for declared_key in declared_keys):
+                result["redundant"].append(index_name)
+        report[name] = result
+        if not quiet:
+            print_index_report(name, result)
+    return report
+
+def print_index_report(name, result):
+    for index_name in result["created"]:
+        print(f"[{name}] Utworzono indeks {index_name}")
+    for conflict in result["conflicts"]:
+        print(f"[{name}] Konflikt indeksu {conflict}")
+    for index_name in result["redundant"]:
+        print(f"[{name}] Indeks {index_name} jest prefiksem zadeklarowanego - można go usunąć")
+
+# === PLANY ZAPYTAŃ ===
+def diary_query_specs(user_id, username, email, friend_ids=(), timeseries=False, today=None):
+    """Zapytania wysyłane przez training_diary.py (te same buildery co w aplikacji).
+    find: (nazwa, kolekcja, filtr, sortowanie[, hint]); aggregate: (nazwa, kolekcja, pipeline)"""
+    today = today or date.today()
+    # Ostatni zamknięty tydzień (archiwum rankingów, eksport) i granica retencji
+    week_end = today - timedelta(days=today.weekday() + 1)
+    week_start = week_end - timedelta(days=6)
+    sample_ids = [ObjectId()]
+    finds = [
+        ("register_user", "users", {"username": username}, None),
+        ("verify_credentials", "users", {"email": email}, None),
+        ("change_password", "users", {"_id": user_id}, None),
+        ("resolve_usernames", "users", {"_id": {"$in": diary_queries.username_lookup_ids([user_id])}}, None),
+        ("add_friend_by_username", "users", {"username": username}, None),
+        ("list_friends", "friends", {"user_id": user_id}, None),
+        ("list_friends (profile)", "users", {"_id": {"$in": list(friend_ids) or [user_id]}}, None),
+        ("get_training_history_page", TRAININGS_COLLECTION, diary_queries.history_query(user_id),
+         diary_queries.HISTORY_SORT),
+        ("get_training_history_page (typy)", TRAININGS_COLLECTION,
+         diary_queries.history_query(user_id, types=["bieganie"]), diary_queries.HISTORY_SORT),
+        ("get_user_rollup_summary", training_rollups.ROLLUPS_COLLECTION,
+         training_rollups.rollup_summary_filter(user_id), None),
+        ("get_latest_duration_per_type ($lookup)", TRAININGS_COLLECTION, {"user_id": user_id, "type": "bieganie"},
+         [("date", -1), ("_id", -1)]),
+        ("get_leaderboard (archiwum)", leaderboards.ARCHIVE_COLLECTION,
+         leaderboards.archive_filter("calories", leaderboards.period_keys(week_start)["week"]), None),
+        ("add_trainings_bulk (znaczniki)", diary_queries.STATS_APPLIED_COLLECTION, {"_id": {"$in": sample_ids}}, None),
+        # deletion_of_data.py
+        ("delete_accounts (znaczniki)", diary_queries.STATS_APPLIED_COLLECTION, {"user_id": user_id}, None),
+        ("delete_accounts (rollupy)", training_rollups.ROLLUPS_COLLECTION, {"user_id": user_id}, None),
+        ("delete_accounts (archiwum rankingów)", leaderboards.ARCHIVE_COLLECTION,
+         {"entries.user_id": str(user_id)}, None),
+        ("delete_trainings_in_range (znaczniki)", diary_queries.PENDING_DELETES_COLLECTION,
+         {"_id": {"$in": sample_ids}}, None),
+    ]
+    retention = training_dates.range_condition(None, week_start)
+    if timeseries:
+        # Bez indeksu _id: zapisane treningi po user_id i zakresie dat, retencja w kolejności pola czasu
+        sample = {"_id": sample_ids[0], "user_id": user_id, "date": training_dates.to_datetime(week_start)}
+        finds += [
+            ("add_trainings_bulk (zapisane)", TRAININGS_COLLECTION, diary_queries.trainings_batch_filter([sample]),
+             None),
+            ("delete_trainings_in_range", TRAININGS_COLLECTION, retention, diary_queries.DATE_SORT),
+        ]
+    else:
+        finds += [
+            ("add_trainings_bulk (zapisane)", TRAININGS_COLLECTION, {"_id": {"$in": sample_ids}}, None),
+            ("delete_accounts (treningi)", TRAININGS_COLLECTION, {"user_id": user_id}, None),
+            ("delete_trainings_in_range", TRAININGS_COLLECTION, retention, [("_id", 1)], [("_id", 1)]),
+            ("backfill_cardio_intensity", TRAININGS_COLLECTION, diary_queries.intensity_backfill_query(),
+             [("_id", 1)], [("_id", 1)]),
+        ]
+    # training_export.py: osobne zapytanie dla każdego formatu daty
+    for condition in training_dates.format_conditions(week_start, week_end):
+        finds.append(("export_trainings", TRAININGS_COLLECTION, condition, diary_queries.DATE_SORT))
+    aggregates = [
+        ("get_cardio_intensity_description", TRAININGS_COLLECTION,
+         diary_queries.cardio_intensity_pipeline(user_id)),
+        ("get_training_durations_with_previous", TRAININGS_COLLECTION,
+         diary_queries.durations_with_previous_pipeline(user_id)),
+        ("get_latest_duration_per_type", TRAININGS_COLLECTION,
+         diary_queries.latest_duration_per_type_pipeline(user_id, TRAININGS_COLLECTION)),
+        ("compare_last_training_with_previous_three", TRAININGS_COLLECTION,
+         diary_queries.last_trainings_pipeline(user_id, 4)),
+    ]
+    return finds, aggregates
+
+_CHILDREN = ("inputStage", "inputStages", "outerStage", "innerStage", "thenStage", "elseStage", "queryPlan")
+# Etapy czytające dane kolekcji; SORT nad nimi to sortowanie w pamięci
+_READS = {"COLLSCAN", "IXSCAN", "FETCH", "IDHACK", "EXPRESS_IXSCAN", "EXPRESS_CLUSTERED_IXSCAN"}
+# Etapy, po których dane nie pochodzą już bezpośrednio z kolekcji (sortowanie wyniku grupowania jest w porządku)
+_BARRIERS = {"GROUP", "EQ_LOOKUP", "EQ_LOOKUP_UNWIND"}
+
+def _children(node):
+    for field in _CHILDREN:
+        child = node.get(field)
+        if isinstance(child, dict):
+            yield child
+        elif isinstance(child, list):
+            yield from child
+
+def _reads_collection(node):
+    stage = node.get("stage")
+    if stage in _READS:
+        return True
+    if stage in _BARRIERS:
+        return False
+    return any(_reads_collection(child) for child in _children(node))
+
+def plan_problems(node):
+    """COLLSCAN i SORT nad danymi kolekcji w drzewie planu"""
+    problems = []
+    stage = node.get("stage")
+    if stage == "COLLSCAN":
+        problems.append("COLLSCAN")
+    if stage == "SORT" and _reads_collection(node):
+        problems.append(f"SORT w pamięci {node.get('sortPattern')}")
+    for child in _children(node):
+        problems.extend(plan_problems(child))
+    return problems
+
+def explain_problems(explain):
+    """Problemy z wyniku explain (find albo aggregate, także z etapem $cursor)"""
+    problems = []
+    planners = [explain.get("queryPlanner")]
+    stages = explain.get("stages") or []
+    grouped = False
+    for stage in stages:
+        if "$cursor" in stage:
+            planners.append(stage["$cursor"].get("queryPlanner"))
+        elif "$group" in stage:
+            grouped = True
+        elif "$sort" in stage and not grouped:
+            # $sort, którego nie dało się przenieść do warstwy zapytań (np. $setWindowFields)
+            problems.append(f"$sort w pamięci {stage['$sort'].get('sortKey')}")
+    for planner in planners:
+        if planner and planner.get("winningPlan"):
+            problems.extend(plan_problems(planner["winningPlan"]))
+    return problems
+
+def sample_identity(db):
+    """Użytkownik z treningami (i znajomymi) jako parametry zapytań do explain()"""
+    training = db[TRAININGS_COLLECTION].find_one({}, {"user_id": 1})
+    user = db.users.find_one({"_id": training["user_id"]} if training else {})
+    if user is None:
+        raise SystemExit("Brak danych do sprawdzenia planów - zaimportuj dane testowe")
+    friends = db.friends.find_one({"user_id": user["_id"]}) or {}
+    return user["_id"], user.get("username", ""), user.get("email", ""), friends.get("friends", [])[:10]
+
+def is_timeseries(db, name=TRAININGS_COLLECTION):
+    info = next(iter(db.list_collections(filter={"name": name})), None)
+    return bool(info) and info.get("type") == "timeseries"
+
+def check_query_plans(db=None, identity=None):
+    """explain() każdego zapytania; zwraca [(nazwa, [problemy])] - pusta lista problemów to OK"""
+    db = db if db is not None else connections.get_database()
+    finds, aggregates = diary_query_specs(*(identity or sample_identity(db)), timeseries=is_timeseries(db))
+    results = []
+    for name, collection, query, sort, *hint in finds:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if hint:
+            cursor = cursor.hint(hint[0])
+        results.append((name, explain_problems(cursor.explain())))
+    for name, collection, pipeline in aggregates:
+        explain = db.command("explain", {"aggregate": collection, "pipeline": pipeline, "cursor": {}},
+                             verbosity="queryPlanner")
+        results.append((name, explain_problems(explain)))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indeksy MongoDB aplikacji i kontrola planów zapytań")
+    parser.add_argument("--check", action="store_true", help="sprawdź plany zapytań (explain)")
+    parser.add_argument("--rebuild-conflicting", action="store_true",
+                        help="usuń i utwórz ponownie indeksy o innych opcjach (np. brak unique)")
+    args = parser.parse_args()
+
+    report = ensure_indexes(rebuild_conflicting=args.rebuild_conflicting)
+    failed = any(result["conflicts"] for result in report.values())
+    if not failed:
+        print("Indeksy zgodne z deklaracją.")
+    if args.check:
+        for name, problems in check_query_plans():
+            print(f"{'OK ' if not problems else 'BŁĄD'} {name}" + (f": {', '.join(problems)}" if problems else ""))
+            failed = failed or bool(problems)
+    sys.exit(1 if failed else 0)
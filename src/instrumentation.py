@@ -0,0 +1,390 @@
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+from bson import json_util
+from pymongo import monitoring
+
+# Metryki operacji dziennika: czas wywołania korutyn diary_service.py i publicznych funkcji
+# training_diary.py oraz - dla każdej operacji - liczba i czas komend MongoDB (CommandListener),
+# liczba zwróconych dokumentów i liczba round tripów do Redis. Włączane zmienną DIARY_METRICS=1;
+# wyłączone nie zmieniają niczego (funkcje nie są opakowywane, listener i liczniki Redis nie są
+# rejestrowane).
+#
+# Komendy i round tripy są liczone dla każdej aktywnej operacji w danym kontekście (wątek albo
+# zadanie asyncio), tak jak czas (add_training obejmuje też apply_training_side_effects i run_lua,
+# które wywołuje), a log wolnych operacji zawiera wszystkie komendy wywołania wraz z filtrem /
+# pipeline'em.
+#
+# Zmienne środowiskowe:
+#   DIARY_METRICS=1                 - włącz metryki
+#   DIARY_METRICS_SNAPSHOT=plik     - okresowy zrzut JSON (co DIARY_METRICS_INTERVAL s, domyślnie 60)
+#   DIARY_METRICS_PORT=9108         - endpoint /metrics w formacie tekstowym Prometheus
+#   DIARY_SLOW_MS=200               - próg wolnej operacji (ms)
+#   DIARY_SLOW_LOG=slow_ops.log     - plik logu wolnych operacji (JSON na linię)
+
+# Przedziały histogramu czasu operacji (sekundy)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Funkcje interaktywne obejmujące całą sesję i diary_service.run (obejmuje każdą operację) - nie mierzymy ich
+SKIPPED = {"main_menu", "start", "watch_new_trainings", "run"}
+# Maksymalna długość zapisu filtra / pipeline'u w logu wolnych operacji
+MAX_COMMAND_CHARS = 2000
+
+_lock = threading.Lock()
+# Stos aktywnych operacji (krotka) - osobny w każdym wątku i zadaniu asyncio, dziedziczony przez
+# zadania tworzone w trakcie operacji (asyncio.gather) i przez korutyny z diary_service.run
+_calls = contextvars.ContextVar("diary_operations", default=())
+_metrics = {}
+_config = {"enabled": False, "slow_ms": None, "slow_log": None}
+_mongo_listener = None
+
+def enabled():
+    return _config["enabled"]
+
+def _operation_metrics(name):
+    metrics = _metrics.get(name)
+    if metrics is None:
+        metrics = _metrics.setdefault(name, {
+            "calls": 0, "errors": 0, "seconds": 0.0, "buckets": [0] * len(BUCKETS),
+            "mongo_commands": {}, "mongo_seconds": 0.0, "mongo_docs": 0, "mongo_failures": 0,
+            "redis_round_trips": 0,
+        })
+    return metrics
+
+# === POMIAR OPERACJI ===
+class _Call:
+    __slots__ = ("name", "started", "commands")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.commands = [] if _config["slow_log"] else None
+
+def _finish(call, failed):
+    seconds = time.perf_counter() - call.started
+    with _lock:
+        metrics = _operation_metrics(call.name)
+        metrics["calls"] += 1
+        metrics["errors"] += failed
+        metrics["seconds"] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                metrics["buckets"][i] += 1
+                break
+    if call.commands is not None and seconds * 1000 >= _config["slow_ms"]:
+        log_slow_operation(call, seconds)
+
+def timed(name, func):
+    """Opakuj funkcję albo korutynę pomiarem czasu; komendy baz w trakcie wywołania są liczone dla `name`"""
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            call = _Call(name)
+            token = _calls.set(_calls.get() + (call,))
+            failed = True
+            try:
+                result = await func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _calls.reset(token)
+                _finish(call, failed)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            call = _Call(name)
+            token = _calls.set(_calls.get() + (call,))
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _calls.reset(token)
+                _finish(call, failed)
+    wrapper.__wrapped_operation__ = name
+    return wrapper
+
+def instrument_module(module, skip=SKIPPED):
+    """Opakuj publiczne funkcje i korutyny zdefiniowane w module (podmiana zmiennych globalnych
+    modułu, więc wywołania wewnątrz modułu, np. z main_menu, też są mierzone)"""
+    for name, func in list(vars(module).items()):
+        if (name.startswith("_") or name in skip or not inspect.isfunction(func)
+                or func.__module__ != module.__name__ or hasattr(func, "__wrapped_operation__")):
+            continue
+        setattr(module, name, timed(name, func))
+
+def _current_calls():
+    return _calls.get()
+
+def _operation_names(calls):
+    """Nazwy aktywnych operacji bez powtórzeń (rekurencja nie liczy komendy dwa razy)"""
+    return tuple(dict.fromkeys(call.name for call in calls))
+
+# === MONGODB ===
+def _command_summary(event):
+    """Kolekcja i filtr / pipeline komendy (dla logu wolnych operacji)"""
+    command = event.command
+    summary = {"command": event.command_name, "collection": command.get(event.command_name)}
+    for field in ("filter", "pipeline", "sort", "projection", "updates", "deletes"):
+        if field in command:
+            summary[field] = command[field]
+    if "documents" in command:
+        summary["documents"] = len(command["documents"])
+    text = json_util.dumps(summary, default=str)
+    return text if len(text) <= MAX_COMMAND_CHARS else text[:MAX_COMMAND_CHARS] + "..."
+
+def _returned_docs(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    return reply.get("n", 0) if isinstance(reply.get("n"), int) else 0
+
+class CommandMetrics(monitoring.CommandListener):
+    """Zdarzenia komend są wywoływane w wątku (klient synchroniczny) albo zadaniu asyncio
+    (AsyncMongoClient) wykonującym operację, więc stos z ContextVar wskazuje operacje,
+    których dotyczy komenda"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        calls = _current_calls()
+        if not calls:
+            return
+        summary = _command_summary(event) if calls[0].commands is not None else None
+        self._pending[(event.request_id, event.connection_id)] = _operation_names(calls)
+        if summary is not None:
+            for call in calls:
+                call.commands.append(summary)
+
+    def _record(self, event, failed):
+        pending = self._pending.pop((event.request_id, event.connection_id), None)
+        if pending is None:
+            return
+        docs = 0 if failed else _returned_docs(event.reply)
+        with _lock:
+            for name in pending:
+                metrics = _operation_metrics(name)
+                commands = metrics["mongo_commands"]
+                commands[event.command_name] = commands.get(event.command_name, 0) + 1
+                metrics["mongo_seconds"] += event.duration_micros / 1e6
+                metrics["mongo_docs"] += docs
+                metrics["mongo_failures"] += failed
+
+    def succeeded(self, event):
+        self._record(event, False)
+
+    def failed(self, event):
+        self._record(event, True)
+
+# === REDIS ===
+def _count_round_trip(command=None):
+    calls = _current_calls()
+    if not calls:
+        return
+    with _lock:
+        for name in _operation_names(calls):
+            _operation_metrics(name)["redis_round_trips"] += 1
+    if calls[0].commands is not None:
+        for call in calls:
+            call.commands.append(json.dumps({"redis": command}, default=str))
+
+def _patch_redis():
+    """Round trip = jedno Redis.execute_command (też EVALSHA skryptów Lua) albo jedno Pipeline.execute"""
+    import redis.client
+    import redis.asyncio.client
+
+    def sync_single(original):
+        @functools.wraps(original)
+        def execute_command(self, *args, **options):
+            _count_round_trip(args[0] if args else None)
+            return original(self, *args, **options)
+        return execute_command
+
+    def sync_pipeline(original):
+        @functools.wraps(original)
+        def execute(self, *args, **kwargs):
+            _count_round_trip(f"PIPELINE ({len(self.command_stack)})")
+            return original(self, *args, **kwargs)
+        return execute
+
+    def async_single(original):
+        @functools.wraps(original)
+        async def execute_command(self, *args, **options):
+            _count_round_trip(args[0] if args else None)
+            return await original(self, *args, **options)
+        return execute_command
+
+    def async_pipeline(original):
+        @functools.wraps(original)
+        async def execute(self, *args, **kwargs):
+            _count_round_trip(f"PIPELINE ({len(self.command_stack)})")
+            return await original(self, *args, **kwargs)
+        return execute
+
+    for cls, attr, wrap in ((redis.client.Redis, "execute_command", sync_single),
+                            (redis.client.Pipeline, "execute", sync_pipeline),
+                            (redis.asyncio.client.Redis, "execute_command", async_single),
+                            (redis.asyncio.client.Pipeline, "execute", async_pipeline)):
+        original = getattr(cls, attr)
+        if not getattr(original, "__instrumented__", False):
+            patched = wrap(original)
+            patched.__instrumented__ = True
+            setattr(cls, attr, patched)
+
+# === WŁĄCZENIE ===
+def enable(slow_ms=None, slow_log=None):
+    """Zarejestruj listener MongoDB (działa dla klientów tworzonych później - connections tworzy
+    je leniwie) i liczniki Redis. Wywołaj przed pierwszym połączeniem."""
+    global _mongo_listener
+    _config.update(enabled=True, slow_ms=slow_ms if slow_ms is not None else 200,
+                   slow_log=slow_log)
+    if _mongo_listener is None:
+        _mongo_listener = CommandMetrics()
+        monitoring.register(_mongo_listener)
+    _patch_redis()
+
+def setup_from_env(module, service=None):
+    """Włącz metryki dla modułu i jego warstwy usług, jeśli DIARY_METRICS=1 (wywoływane na końcu
+    training_diary.py z diary_service)"""
+    if os.environ.get("DIARY_METRICS", "") not in ("1", "true", "yes"):
+        return False
+    slow_ms = os.environ.get("DIARY_SLOW_MS")
+    enable(float(slow_ms) if slow_ms else None, os.environ.get("DIARY_SLOW_LOG") or None)
+    skip = set(SKIPPED)
+    if service is not None:
+        instrument_module(service)
+        # Synchroniczne opakowania korutyn serwisu - operację mierzy już korutyna
+        skip |= {name for name, func in vars(service).items() if inspect.iscoroutinefunction(func)}
+    instrument_module(module, skip)
+    if os.environ.get("DIARY_METRICS_SNAPSHOT"):
+        start_snapshots(os.environ["DIARY_METRICS_SNAPSHOT"], float(os.environ.get("DIARY_METRICS_INTERVAL", 60)))
+    if os.environ.get("DIARY_METRICS_PORT"):
+        serve_metrics(int(os.environ["DIARY_METRICS_PORT"]))
+    return True
+
+# === LOG WOLNYCH OPERACJI ===
+def log_slow_operation(call, seconds):
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "operation": call.name,
+        "duration_ms": round(seconds * 1000, 3),
+        "commands": call.commands,
+    }
+    with _lock, open(_config["slow_log"], "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+# === EKSPORT ===
+def snapshot():
+    """Kopia metryk: {operacja: {calls, errors, seconds, buckets, mongo_*, redis_round_trips}}"""
+    with _lock:
+        return {name: {**m, "buckets": list(m["buckets"]), "mongo_commands": dict(m["mongo_commands"])}
+                for name, m in _metrics.items()}
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+def write_snapshot(path):
+    data = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "operations": snapshot()}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def start_snapshots(path, interval=60.0):
+    """Zrzut JSON co `interval` sekund w wątku w tle"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            write_snapshot(path)
+    thread = threading.Thread(target=loop, name="metrics-snapshot", daemon=True)
+    thread.start()
+    return thread
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus_text(prefix="training_diary"):
+    lines = [
+        f"# HELP {prefix}_operation_duration_seconds Czas operacji dziennika",
+        f"# TYPE {prefix}_operation_duration_seconds histogram",
+    ]
+    data = snapshot()
+    for name, m in sorted(data.items()):
+        op = f'operation="{_label(name)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, m["buckets"]):
+            cumulative += count
+            lines.append(f'{prefix}_operation_duration_seconds_bucket{{{op},le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_operation_duration_seconds_bucket{{{op},le="+Inf"}} {m["calls"]}')
+        lines.append(f"{prefix}_operation_duration_seconds_sum{{{op}}} {m['seconds']}")
+        lines.append(f"{prefix}_operation_duration_seconds_count{{{op}}} {m['calls']}")
+    counters = (
+        ("operation_errors_total", "Operacje zakończone wyjątkiem", "errors"),
+        ("mongo_command_seconds_total", "Czas komend MongoDB w operacji", "mongo_seconds"),
+        ("mongo_documents_returned_total", "Dokumenty zwrócone przez MongoDB", "mongo_docs"),
+        ("mongo_command_failures_total", "Nieudane komendy MongoDB", "mongo_failures"),
+        ("redis_round_trips_total", "Round tripy do Redis", "redis_round_trips"),
+    )
+    for metric, help_text, field in counters:
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} counter")
+        for name, m in sorted(data.items()):
+            lines.append(f'{prefix}_{metric}{{operation="{_label(name)}"}} {m[field]}')
+    lines.append(f"# HELP {prefix}_mongo_commands_total Komendy MongoDB wg operacji i typu")
+    lines.append(f"# TYPE {prefix}_mongo_commands_total counter")
+    for name, m in sorted(data.items()):
+        for command, count in sorted(m["mongo_commands"].items()):
+            lines.append(f'{prefix}_mongo_commands_total{{operation="{_label(name)}",command="{_label(command)}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def serve_metrics(port, host="127.0.0.1"):
+    """Endpoint /metrics dla Prometheusa w wątku w tle"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def print_report(data=None):
+    data = snapshot() if data is None else data
+    for name, m in sorted(data.items(), key=lambda item: -item[1]["seconds"]):
+        mean_ms = m["seconds"] / m["calls"] * 1000 if m["calls"] else 0.0
+        commands = sum(m["mongo_commands"].values())
+        print(f"{name:>38}: {m['calls']} wywołań | śr. {mean_ms:.2f} ms | MongoDB {commands} komend "
+              f"({m['mongo_seconds'] * 1000:.1f} ms, {m['mongo_docs']} dok.) | Redis {m['redis_round_trips']} RT")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Podgląd zrzutu metryk (DIARY_METRICS_SNAPSHOT)")
+    parser.add_argument("snapshot", help="plik JSON zapisany przez write_snapshot")
+    parser.add_argument("--prometheus", action="store_true", help="wypisz w formacie Prometheus")
+    args = parser.parse_args()
+    with open(args.snapshot, encoding="utf-8") as f:
+        saved = json.load(f)
+    if args.prometheus:
+        _metrics.update(saved["operations"])
+        print(prometheus_text(), end="")
+    else:
+        print_report(saved["operations"])
@@ -0,0 +1,206 @@
+import argparse
+import calendar
+import os
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import activity_calendar
+import training_rollups
+
+# Rankingi w Redis: okres × miara × (wszystkie typy albo jeden typ treningu).
+#   leaderboard:{miara}:{klucz okresu}          - np. leaderboard:calories:2025-W23
+#   leaderboard:{miara}:{typ}:{klucz okresu}    - np. leaderboard:distance:bieganie:2025-06
+# Okresy: dzień ("2025-06-03"), tydzień ISO ("2025-W23", rok ISO), miesiąc ("2025-06")
+# i cały okres ("all"); miary: kalorie, minuty i kilometry. Trening trafia do okresów
+# według swojej daty (jak rollupy w MongoDB).
+#
+# Klucz okresu wygasa w stałym momencie (EXPIREAT): koniec okresu + RETENTION, więc kolejne
+# zapisy nie przedłużają mu życia. Zamknięte okresy archive_leaderboards() (training_diary.py)
+# kopiuje do kolekcji leaderboard_archive, zanim klucze wygasną:
+#
+#   python leaderboards.py --archive        # np. codziennie z crona
+
+PERIODS = ("day", "week", "month", "all")
+# Miara rankingu -> pole z training_rollups.training_totals
+METRICS = {"calories": "kcal", "minutes": "minutes", "distance": "distance_km"}
+# Jak długo klucz zamkniętego okresu zostaje w Redis (czas na archiwizację i podgląd poprzedniego okresu)
+RETENTION = {"day": 2 * 86400, "week": 7 * 86400, "month": 31 * 86400}
+ARCHIVE_COLLECTION = "leaderboard_archive"
+ARCHIVE_KEY_FIELDS = ["period", "period_key", "metric", "type"]
+# Liczba pozycji zapisywanych w archiwum na jeden ranking
+ARCHIVE_TOP = int(os.environ.get("LEADERBOARD_ARCHIVE_TOP", 1000))
+ALL_TYPES = "all"
+# Wynik członka rankingu uznawany za zerowy po odjęciu usuniętych treningów
+EMPTY_SCORE = 1e-6
+
+# === KLUCZE I OKRESY ===
+def period_keys(day):
+    return {"day": day.isoformat(), **training_rollups.period_keys(day)}
+
+def leaderboard_key(metric, period_key, training_type=None):
+    if training_type:
+        return f"leaderboard:{metric}:{training_type}:{period_key}"
+    return f"leaderboard:{metric}:{period_key}"
+
+def current_key(metric="calories", period="week", training_type=None, day=None):
+    return leaderboard_key(metric, period_keys(day or date.today())[period], training_type)
+
+def parse_key(key):
+    """leaderboard:{miara}[:{typ}]:{okres} -> (miara, typ albo None, okres, klucz okresu)"""
+    parts = key.split(":")
+    period_key = parts[-1]
+    return parts[1], ":".join(parts[2:-1]) or None, period_of(period_key), period_key
+
+def period_of(period_key):
+    if period_key == "all":
+        return "all"
+    if "-W" in period_key:
+        return "week"
+    return "month" if len(period_key) == 7 else "day"
+
+def period_bounds(period, period_key):
+    """Pierwszy i ostatni dzień okresu (None dla "all")"""
+    if period == "all":
+        return None
+    if period == "day":
+        day = date.fromisoformat(period_key)
+        return day, day
+    if period == "week":
+        year, week = period_key.split("-W")
+        first = date.fromisocalendar(int(year), int(week), 1)
+        return first, first + timedelta(days=6)
+    year, month = (int(part) for part in period_key.split("-"))
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+def validate_period_key(period_key):
+    """Okres klucza wpisanego przez użytkownika. ValueError dla klucza spoza kalendarza
+    (2025-W60, 2025-13, 2025-02-30) albo zapisanego inaczej niż klucze rankingów (2025-W5)."""
+    period = period_of(period_key)
+    bounds = period_bounds(period, period_key)
+    if bounds and period_keys(bounds[0])[period] != period_key:
+        raise ValueError(f"niepoprawny klucz okresu: {period_key}")
+    return period
+
+def is_closed(period, period_key, today=None):
+    bounds = period_bounds(period, period_key)
+    return bounds is not None and bounds[1] < (today or date.today())
+
+@lru_cache(maxsize=4096)
+def expire_at(period, period_key):
+    """Unix time wygaśnięcia klucza okresu: północ po jego końcu + RETENTION; None dla "all" """
+    bounds = period_bounds(period, period_key)
+    if bounds is None:
+        return None
+    end = datetime.combine(bounds[1] + timedelta(days=1), datetime.min.time())
+    return int(end.timestamp()) + RETENTION[period]
+
+# === ZAPIS ===
+def increments(day, training_type, totals, now=None):
+    """[(klucz, przyrost, expire_at)] dla treningu z dnia `day` - pomija zerowe miary
+    i okresy, których klucze już wygasły (zostają w rollupach i archiwum)"""
+    now = now or time.time()
+    updates = []
+    for period, period_key in period_keys(day).items():
+        expires = expire_at(period, period_key)
+        if expires is not None and expires <= now:
+            continue
+        for metric, field in METRICS.items():
+            value = totals.get(field) or 0
+            if value <= 0:
+                continue
+            updates.append((leaderboard_key(metric, period_key), value, expires))
+            if training_type:
+                updates.append((leaderboard_key(metric, period_key, training_type), value, expires))
+    return updates
+
+def training_increments(training, now=None):
+    totals = training_rollups.training_totals(training.get("metrics") or {})
+    return increments(activity_calendar.to_date(training["date"]), training.get("type"), totals, now)
+
+def aggregated_increments(trainings, now=None):
+    """{klucz: (expire_at, {user_id: suma})} dla paczki treningów - jeden ZINCRBY na ranking i użytkownika"""
+    result = {}
+    for training in trainings:
+        user_id = str(training["user_id"])
+        for key, value, expires in training_increments(training, now):
+            scores = result.setdefault(key, (expires, {}))[1]
+            scores[user_id] = scores.get(user_id, 0) + value
+    return result
+
+def queue_leaderboard_updates(pipe, trainings, now=None, sign=1):
+    """Dodaj do pipeline aktualizację wszystkich rankingów paczki; zwraca liczbę komend.
+    sign=-1 odejmuje treningi (usuwanie danych) i usuwa członków, którym nic nie zostało."""
+    commands = 0
+    for key, (expires, scores) in aggregated_increments(trainings, now).items():
+        for user_id, value in scores.items():
+            pipe.zincrby(key, value * sign, user_id)
+            commands += 1
+        if sign < 0:
+            # Miary są dodatnie, więc wynik <= 0 (z dokładnością do błędu float) to brak treningów
+            pipe.zremrangebyscore(key, "-inf", EMPTY_SCORE)
+            commands += 1
+        if expires is not None:
+            pipe.expireat(key, expires)
+            commands += 1
+    return commands
+
+# === ARCHIWUM ===
+def archive_document(key, entries, total, archived_at):
+    """Migawka rankingu: `entries` to [(user_id, wynik), ...] od najwyższego"""
+    metric, training_type, period, period_key = parse_key(key)
+    return {
+        "period": period,
+        "period_key": period_key,
+        "metric": metric,
+        "type": training_type or ALL_TYPES,
+        "entries": [
+            {"position": i, "user_id": user_id, "score": float(score)}
+            for i, (user_id, score) in enumerate(entries, 1)
+        ],
+        "total": total,
+        "archived_at": archived_at
+    }
+
+def archive_filter(metric, period_key, training_type=None):
+    return {"period": period_of(period_key), "period_key": period_key, "metric": metric,
+            "type": training_type or ALL_TYPES}
+
+def key_filter(key):
+    """Filtr dokumentu archiwum dla klucza rankingu w Redis"""
+    metric, training_type, _, period_key = parse_key(key)
+    return archive_filter(metric, period_key, training_type)
+
+def archive_identity(doc):
+    return tuple(doc[field] for field in ARCHIVE_KEY_FIELDS)
+
+def archive_projection(offset=0, limit=10):
+    """Tylko strona pozycji - $slice po stronie serwera"""
+    return {"_id": 0, "entries": {"$slice": [offset, limit]}}
+
+def archived_raw(doc):
+    """Strona z archiwum w formacie skryptu LEADERBOARD_PAGE_SCRIPT: [id, wynik, nazwa, ...]"""
+    raw = []
+    for entry in (doc or {}).get("entries", []):
+        raw += [entry["user_id"], entry["score"], ""]
+    return raw
+
+# === WYŚWIETLANIE ===
+PERIOD_NAMES = {"day": "DZIEŃ", "week": "TYDZIEŃ", "month": "MIESIĄC", "all": "CAŁY OKRES"}
+METRIC_NAMES = {"calories": "KALORII", "minutes": "MINUT", "distance": "DYSTANSU"}
+METRIC_UNITS = {"calories": "kcal", "minutes": "min", "distance": "km"}
+
+def format_score(metric, score):
+    return f"{score:.1f} {METRIC_UNITS[metric]}" if metric == "distance" else f"{int(score)} {METRIC_UNITS[metric]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archiwizacja zamkniętych okresów rankingów w MongoDB")
+    parser.add_argument("--archive", action="store_true", help="zapisz zamknięte okresy do leaderboard_archive")
+    parser.add_argument("--refresh", action="store_true", help="nadpisz okresy już zarchiwizowane")
+    args = parser.parse_args()
+
+    if args.archive:
+        from training_diary import archive_leaderboards
+        archive_leaderboards(refresh=args.refresh)
+    else:
+        parser.print_help()
@@ -0,0 +1,168 @@
+import argparse
+import os
+import time
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING
+import cardio_intensity
+import training_dates
+from training_diary import db, trainings_col
+
+# Migracja pola `date` treningów ze stringa "RRRR-MM-DD" na datę BSON - bez przestoju:
+#  1. walidator kolekcji dopuszcza oba typy (collMod),
+#  2. dokumenty są konwertowane paczkami użytkowników ($toDate w aktualizacji pipeline),
+#     więc treningi jednego użytkownika zmieniają format praktycznie jednocześnie,
+#  3. odczyty w training_diary.py obsługują oba formaty przez cały czas migracji.
+# Po migracji ustaw TRAININGS_NATIVE_DATES=1, żeby nowe treningi od razu miały datę BSON.
+#
+# Opcjonalnie (--to-timeseries) treningi są kopiowane do kolekcji time-series
+# (metaField user_id, timeField date). Aplikacja przełącza się na nią przez
+# TRAININGS_COLLECTION=<nazwa>. Ograniczenia time-series w MongoDB 6.0: brak zapisów
+# w transakcjach (add_training zapisuje trening po transakcji ze statystykami), brak change streamów
+# i ograniczone update/delete. Kopia wymaga wstrzymania zapisów treningów: wznawia się od ostatniego
+# _id, a importowane treningi mają _id z md5, więc trening dopisany w trakcie mógłby trafić przed nie.
+
+DEFAULT_USER_BATCH = 500
+DEFAULT_COPY_BATCH = 5000
+
+TRAININGS_VALIDATOR = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["user_id", "date", "type"],
+        "properties": {
+            "user_id": {"bsonType": "string", "description": "User ID must be a string and is required"},
+            "date": {"bsonType": ["string", "date"], "description": "Date must be a string or a date and is required"},
+            "type": {
+                "bsonType": "string",
+                "enum": ["siłownia", "bieganie", "pływanie", "rower", "yoga", "kalistenika", "trening funkcjonalny"],
+                "description": "Type must be one of the allowed training types"
+            },
+            "metrics": {"bsonType": "object", "description": "Metrics must be an object"}
+        }
+    }
+}
+
+# === KONWERSJA W MIEJSCU ===
+def allow_native_dates():
+    """Rozluźnij walidator: pole date może być stringiem albo datą BSON"""
+    db.command("collMod", trainings_col.name, validator=TRAININGS_VALIDATOR)
+
+def iter_user_batches(batch_size):
+    # Grupowanie po indeksie (user_id, date) - bez wczytywania całej kolekcji do pamięci
+    cursor = trainings_col.aggregate(
+        [{"$match": {"date": {"$type": "string"}}}, {"$group": {"_id": "$user_id"}}],
+        allowDiskUse=True
+    )
+    batch = []
+    for doc in cursor:
+        batch.append(doc["_id"])
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def convert_dates_in_place(user_batch=DEFAULT_USER_BATCH, pause=0.0):
+    """Zamień stringi dat na daty BSON; ponowne uruchomienie kontynuuje od pozostałych stringów"""
+    allow_native_dates()
+    converted = 0
+    started = time.perf_counter()
+    for user_ids in iter_user_batches(user_batch):
+        result = trainings_col.update_many(
+            {"user_id": {"$in": user_ids}, "date": {"$type": "string"}},
+            [{"$set": {"date": {"$toDate": "$date"}}}]
+        )
+        converted += result.modified_count
+        elapsed = time.perf_counter() - started
+        print(f"Skonwertowano {converted} treningów ({converted / elapsed:.0f} dok/s)")
+        if pause:
+            time.sleep(pause)
+    return converted
+
+# === KOPIA DO KOLEKCJI TIME-SERIES ===
+def create_timeseries_collection(name):
+    if name in db.list_collection_names():
+        return db[name]
+    db.create_collection(name, timeseries={
+        "timeField": "date",
+        "metaField": "user_id",
+        "granularity": "hours"
+    })
+    target = db[name]
+    target.create_index([("user_id", ASCENDING), ("date", DESCENDING), ("_id", DESCENDING)])
+    target.create_index([("user_id", ASCENDING), ("type", ASCENDING), ("date", DESCENDING)])
+    return target
+
+def timeseries_document(doc):
+    """Trening w formacie kolekcji time-series: data BSON i intensywność cardio (kolekcji time-series
+    nie da się później uzupełnić przez backfill_cardio_intensity - aktualizacje tylko po metaField)"""
+    doc = dict(doc, date=training_dates.to_datetime(doc["date"]))
+    if "intensity_description" not in doc:
+        intensity = cardio_intensity.classify_intensity(doc.get("type"), doc.get("metrics"))
+        if intensity is not None:
+            doc["intensity_description"] = intensity
+    return doc
+
+def copy_to_timeseries(name, batch_size=DEFAULT_COPY_BATCH, checkpoint_path="timeseries_checkpoint.json"):
+    """Skopiuj treningi (z konwersją daty) do kolekcji time-series; wznawia od ostatniego _id"""
+    target = create_timeseries_collection(name)
+    last_id = None
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            last_id = json_util.loads(f.read()).get("last_id")
+
+    query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+    cursor = trainings_col.find(query).sort("_id", ASCENDING).batch_size(batch_size)
+    copied = 0
+    batch = []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal copied
+        # Kolekcja time-series nie ma unikalnego _id - paczka zapisana przed awarią (a przed zapisem
+        # punktu kontrolnego) byłaby skopiowana drugi raz. Zapytanie po indeksie (user_id, date, _id).
+        stored = {d["_id"] for d in target.find(
+            {"user_id": {"$in": list({d["user_id"] for d in batch})}, "_id": {"$in": [d["_id"] for d in batch]}},
+            {"_id": 1})}
+        missing = [timeseries_document(d) for d in batch if d["_id"] not in stored]
+        if missing:
+            target.insert_many(missing, ordered=False)
+        copied += len(missing)
+        with open(checkpoint_path, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps({"last_id": batch[-1]["_id"]}))
+        print(f"Skopiowano {copied} treningów ({copied / (time.perf_counter() - started):.0f} dok/s)")
+
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    # Trening zapisany w trakcie kopii z _id mniejszym od już skopiowanych nie zostałby przeniesiony
+    source_count, target_count = trainings_col.count_documents({}), target.count_documents({})
+    if source_count != target_count:
+        raise RuntimeError(f"Kolekcja {name} ma {target_count} treningów, a źródło {source_count} - "
+                           f"zapisy treningów nie były wstrzymane. Usuń {name} i powtórz kopię.")
+    return copied
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migracja dat treningów na daty BSON / kolekcję time-series")
+    parser.add_argument("--user-batch", type=int, default=DEFAULT_USER_BATCH,
+                        help="liczba użytkowników konwertowanych jednym update_many")
+    parser.add_argument("--pause", type=float, default=0.0, help="przerwa między paczkami (s) - mniejsze obciążenie")
+    parser.add_argument("--to-timeseries", metavar="NAZWA", default=None,
+                        help="zamiast konwersji w miejscu skopiuj treningi do kolekcji time-series")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_COPY_BATCH, help="paczka kopiowania do time-series")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.to_timeseries:
+        copy_to_timeseries(args.to_timeseries, args.batch_size)
+        print(f"Gotowe. Ustaw TRAININGS_COLLECTION={args.to_timeseries}, aby aplikacja używała nowej kolekcji.")
+    else:
+        convert_dates_in_place(args.user_batch, args.pause)
+        print("Gotowe. Ustaw TRAININGS_NATIVE_DATES=1 dla nowych treningów.")
@@ -0,0 +1,40 @@
+import base64
+import hashlib
+import hmac
+import os
+
+# Hasła użytkowników: scrypt z biblioteki standardowej (bez dodatkowych zależności).
+# Format zapisu w users.password_hash: "scrypt$N$r$p$sól$skrót" (base64).
+# Starsze konta (rejestracja sprzed haszowania, dane z generatora) mają hasło zapisane
+# wprost - verify_password je akceptuje, a login zamienia na skrót (needs_rehash).
+
+SCHEME = "scrypt"
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+KEY_LENGTH = 32
+SALT_LENGTH = 16
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+def _derive(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=KEY_LENGTH)
+
+def hash_password(password):
+    salt = os.urandom(SALT_LENGTH)
+    key = _derive(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+def verify_password(password, stored):
+    if not stored:
+        return False
+    if not stored.startswith(SCHEME + "$"):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    _, n, r, p, salt, key = stored.split("$")
+    derived = _derive(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(derived, base64.b64decode(key))
+
+def needs_rehash(stored):
+    """Hasło zapisane wprost albo skrót ze starszymi parametrami"""
+    return not stored.startswith(f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
@@ -0,0 +1,219 @@
+from collections import defaultdict
+from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
+import argparse
+import time
+import uuid
+
+import activity_calendar
+import activity_feed
+import leaderboards
+from training_diary import (
+    redis_client, trainings_col, users_col, friends_col,
+    rebuild_friends_mirror, USERNAMES_KEY
+)
+
+# Odbudowa stanu Redis (bitmapy aktywności, rankingi, przypomnienia, nazwy, feedy)
+# na podstawie MongoDB - np. po imporcie danych albo po wyczyszczeniu Redis.
+# Nowe wartości są budowane pod kluczami tymczasowymi i podmieniane przez RENAME,
+# więc czytelnicy nigdy nie widzą rankingu w połowie budowy.
+# Treningi dodane przez add_training w trakcie odbudowy mogą zostać nadpisane -
+# odbudowę najlepiej uruchamiać w oknie bez ruchu.
+
+REMINDER_TTL = 86400
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_BATCH_SIZE = 5000
+
+# === STRUMIEŃ TRENINGÓW ===
+def iter_user_trainings(batch_size=DEFAULT_BATCH_SIZE):
+    """Jeden posortowany kursor po wszystkich treningach, pogrupowany po użytkowniku.
+    Sortowanie zgodne z indeksem (user_id, date), więc nie wymaga sortowania w pamięci."""
+    pipeline = [
+        {"$sort": {"user_id": 1, "date": -1}},
+        {"$project": {"_id": 0, "user_id": 1, "date": 1, "type": 1, "metrics.duration_min": 1,
+                      "metrics.calories_burned": 1, "metrics.distance_km": 1, "metrics.distance_m": 1}}
+    ]
+    cursor = trainings_col.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    return groupby(cursor, key=itemgetter("user_id"))
+
+def summarize_user(docs, today, now, expirations):
+    """Bitmapa dni, wyniki w rankingach, których okresy jeszcze trwają w Redis, i czy użytkownik
+    trenował dziś. `expirations` zbiera czas wygaśnięcia każdego klucza rankingu."""
+    bits = 0
+    scores = defaultdict(float)
+    trained_today = False
+    for doc in docs:
+        day = activity_calendar.to_date(doc["date"])
+        number = activity_calendar.day_number(day)
+        if number >= 0:
+            bits |= 1 << number
+        for key, value, expires in leaderboards.training_increments(doc, now):
+            scores[key] += value
+            expirations[key] = expires
+        if day == today:
+            trained_today = True
+    return bits, scores, trained_today
+
+# === ODBUDOWA ===
+def swap_keys(renames):
+    """Podmień klucze tymczasowe na docelowe (RENAME jest atomowy)"""
+    if not renames:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for tmp_key, live_key in renames:
+        pipe.rename(tmp_key, live_key)
+    pipe.execute()
+
+def rebuild_activity_and_leaderboards(chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """Przelicz bitmapy aktywności, przypomnienia i wszystkie rankingi, których okresy są jeszcze
+    w Redis (bieżące i zamknięte przed upływem RETENTION, plus cały okres)"""
+    prefix = f"rebuild:{uuid.uuid4().hex[:8]}:"
+    today = datetime.now().date()
+    now = time.time()
+    expirations = {}
+
+    pipe = redis_client.pipeline(transaction=False)
+    renames = []
+    users = 0
+    started = time.perf_counter()
+    for user_id, docs in iter_user_trainings(batch_size):
+        user_id_str = str(user_id)
+        bits, scores, trained_today = summarize_user(docs, today, now, expirations)
+
+        live_key = activity_calendar.activity_key(user_id_str)
+        pipe.set(prefix + live_key, activity_calendar.int_to_bitmap(bits))
+        renames.append((prefix + live_key, live_key))
+        for key, score in scores.items():
+            pipe.zadd(prefix + key, {user_id_str: score})
+        if trained_today:
+            pipe.set(f"reminder:{user_id_str}:tomorrow", "Czas na trening!", ex=REMINDER_TTL)
+
+        users += 1
+        if users % chunk_size == 0:
+            pipe.execute()
+            swap_keys(renames)
+            renames = []
+            elapsed = time.perf_counter() - started
+            print(f"Przeliczono {users} użytkowników ({users / elapsed:.0f} użytk./s)")
+    pipe.execute()
+    swap_keys(renames)
+
+    # Rankingi podmieniane na końcu - wszystkie naraz, w jednej transakcji; rankingi bez
+    # treningów w MongoDB są usuwane (SCAN, nie KEYS)
+    stale = [key for key in redis_client.scan_iter(match="leaderboard:*", count=1000) if key not in expirations]
+    swap = redis_client.pipeline(transaction=True)
+    for live_key, expires in expirations.items():
+        swap.rename(prefix + live_key, live_key)
+        if expires is not None:
+            swap.expireat(live_key, expires)
+    if stale:
+        swap.delete(*stale)
+    swap.execute()
+
+    elapsed = time.perf_counter() - started
+    print(f"Odbudowano bitmapy i rankingi dla {users} użytkowników w {elapsed:.1f} s")
+    return users
+
+def rebuild_usernames(batch_size=DEFAULT_BATCH_SIZE):
+    """Wypełnij hash users:usernames na podstawie kolekcji users"""
+    mapping = {}
+    for user in users_col.find({}, {"username": 1}).batch_size(batch_size):
+        mapping[str(user["_id"])] = user["username"]
+        if len(mapping) >= batch_size:
+            redis_client.hset(USERNAMES_KEY, mapping=mapping)
+            mapping = {}
+    if mapping:
+        redis_client.hset(USERNAMES_KEY, mapping=mapping)
+
+def rebuild_outboxes(chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """Listy feed:out - ostatnie FEED_LENGTH treningów każdego użytkownika, od najnowszych.
+    Kursor posortowany zgodnie z indeksem (user_id, date, _id)."""
+    prefix = f"rebuild:{uuid.uuid4().hex[:8]}:"
+    pipeline = [
+        {"$sort": {"user_id": 1, "date": -1, "_id": -1}},
+        {"$project": {"user_id": 1, "date": 1, "type": 1, "metrics.duration_min": 1,
+                      "metrics.calories_burned": 1, "metrics.distance_km": 1}}
+    ]
+    cursor = trainings_col.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+    pipe = redis_client.pipeline(transaction=False)
+    renames = []
+    users = 0
+    for user_id, docs in groupby(cursor, key=itemgetter("user_id")):
+        entries = []
+        previous_day, position = None, 0
+        for doc in docs:
+            if len(entries) >= activity_feed.FEED_LENGTH:
+                continue  # reszta treningów użytkownika - kursor musi je przejść
+            day = activity_calendar.to_date(doc["date"])
+            position = position + 1 if day == previous_day else 0
+            previous_day = day
+            entries.append(activity_feed.make_entry(doc, activity_feed.rebuilt_timestamp(doc, position)))
+        live_key = activity_feed.outbox_key(user_id)
+        pipe.rpush(prefix + live_key, *entries)
+        renames.append((prefix + live_key, live_key))
+        users += 1
+        if users % chunk_size == 0:
+            pipe.execute()
+            swap_keys(renames)
+            renames = []
+    pipe.execute()
+    swap_keys(renames)
+    return users
+
+def rebuild_popular():
+    """Zbiór feed:popular - użytkownicy z więcej niż FEED_FANOUT_LIMIT znajomymi"""
+    limit = activity_feed.FEED_FANOUT_LIMIT
+    # Element o indeksie `limit` istnieje tylko w listach dłuższych niż limit
+    popular = {str(doc["user_id"]) for doc in friends_col.find({f"friends.{limit}": {"$exists": True}}, {"user_id": 1})}
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.delete(activity_feed.POPULAR_KEY)
+    if popular:
+        pipe.sadd(activity_feed.POPULAR_KEY, *popular)
+    pipe.execute()
+    return popular
+
+def rebuild_feeds(chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """Odbuduj feedy aktywności znajomych: najpierw listy feed:out i zbiór popularnych,
+    potem feed każdego użytkownika jako scalenie list feed:out jego znajomych (skrypt Lua)"""
+    started = time.perf_counter()
+    authors = rebuild_outboxes(chunk_size, batch_size)
+    popular = rebuild_popular()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.script_load(activity_feed.FEED_MERGE_SCRIPT)
+    users = 0
+    for doc in friends_col.find({}, {"user_id": 1, "friends": 1}).batch_size(batch_size):
+        activity_feed.queue_rebuild_feed(pipe, doc["user_id"], doc.get("friends", []), popular)
+        users += 1
+        if users % chunk_size == 0:
+            pipe.execute()
+            pipe.script_load(activity_feed.FEED_MERGE_SCRIPT)
+    pipe.execute()
+    elapsed = time.perf_counter() - started
+    print(f"Odbudowano feedy {users} użytkowników ({authors} autorów, {len(popular)} popularnych) w {elapsed:.1f} s")
+    return users
+
+def rebuild_all(chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE, friends=True, feeds=True):
+    if not redis_client:
+        print("Redis niedostępny - odbudowa przerwana")
+        return
+    rebuild_usernames(batch_size)
+    if friends:
+        rebuild_friends_mirror(chunk_size)
+    rebuild_activity_and_leaderboards(chunk_size, batch_size)
+    if feeds:
+        rebuild_feeds(chunk_size, batch_size)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Odbudowa stanu Redis na podstawie MongoDB")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="liczba użytkowników na jeden pipeline Redis")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="batchSize kursora MongoDB")
+    parser.add_argument("--skip-friends", action="store_true", help="nie odbudowuj lustra znajomych")
+    parser.add_argument("--skip-feeds", action="store_true", help="nie odbudowuj feedów aktywności znajomych")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    rebuild_all(args.chunk_size, args.batch_size, friends=not args.skip_friends,
+                feeds=not args.skip_feeds)
@@ -0,0 +1,109 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Raporty dla trenerów liczone z plików Parquet z training_export.py - bez MongoDB.
+# Wszystkie obliczenia są wektorowe (groupby / percentile na kolumnach), więc raport
+# z milionów treningów liczy się w sekundach na jednej maszynie.
+
+DEFAULT_PATH = "analytics"
+PACE_PERCENTILES = (10, 25, 50, 75, 90)
+
+# === WCZYTYWANIE ===
+def _filters(weeks=None, types=None):
+    filters = []
+    if weeks:
+        filters.append(("week", "in", list(weeks)))
+    if types:
+        filters.append(("type", "in", list(types)))
+    return filters or None
+
+def _load(path, table, weeks, types, columns):
+    """Filtr po tygodniach pomija całe partycje (katalogi week=...)"""
+    return pd.read_parquet(os.path.join(path, table), engine="pyarrow", columns=columns,
+                           filters=_filters(weeks, types))
+
+def load_trainings(path=DEFAULT_PATH, weeks=None, types=None, columns=None):
+    return _load(path, "trainings", weeks, types, columns)
+
+def load_exercises(path=DEFAULT_PATH, weeks=None, types=None, columns=None):
+    return _load(path, "exercises", weeks, types, columns)
+
+# === RAPORTY ===
+def weekly_volume(trainings):
+    """Tydzień × typ: liczba treningów, aktywni użytkownicy, minuty, kilometry, kalorie"""
+    return (trainings.groupby(["week", "type"], observed=True)
+            .agg(trainings=("training_id", "size"),
+                 users=("user_id", "nunique"),
+                 minutes=("duration_min", "sum"),
+                 distance_km=("distance_km", "sum"),
+                 calories=("calories_burned", "sum"))
+            .reset_index()
+            .sort_values(["week", "type"], ignore_index=True))
+
+def pace_distribution(trainings, types=("bieganie",), percentiles=PACE_PERCENTILES):
+    """Percentyle tempa (min/km) dla typów z dystansem i czasem"""
+    df = trainings[trainings["type"].isin(types) & trainings["pace_min_per_km"].notna()]
+    rows = []
+    for training_type, group in df.groupby("type", observed=True):
+        values = group["pace_min_per_km"].to_numpy()
+        row = {"type": training_type, "count": len(values), "mean": float(np.mean(values))}
+        row.update({f"p{p}": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def pace_histogram(trainings, training_type="bieganie", bins=None):
+    """Histogram tempa: liczba treningów w przedziałach (domyślnie co 0,5 min/km)"""
+    values = trainings.loc[(trainings["type"] == training_type), "pace_min_per_km"].dropna().to_numpy()
+    if not len(values):
+        return pd.DataFrame(columns=["from", "to", "count"])
+    if bins is None:
+        bins = np.arange(np.floor(values.min()), np.ceil(values.max()) + 0.5, 0.5)
+    counts, edges = np.histogram(values, bins=bins)
+    return pd.DataFrame({"from": edges[:-1], "to": edges[1:], "count": counts})
+
+def weekly_active_users(trainings):
+    """Aktywni użytkownicy i średnia liczba treningów na aktywnego użytkownika w tygodniu"""
+    per_user = trainings.groupby(["week", "user_id"], observed=True).size()
+    return (per_user.groupby(level="week")
+            .agg(active_users="size", trainings_per_user="mean")
+            .reset_index())
+
+def strength_volume(exercises):
+    """Tydzień × ćwiczenie: serie, powtórzenia i objętość (serie × powtórzenia × ciężar)"""
+    df = exercises.assign(
+        total_reps=exercises["sets"].fillna(0) * exercises["reps"].fillna(0),
+    )
+    df["volume_kg"] = df["total_reps"] * df["weight"].fillna(0)
+    return (df.groupby(["week", "name"], observed=True)
+            .agg(sets=("sets", "sum"), reps=("total_reps", "sum"), volume_kg=("volume_kg", "sum"),
+                 users=("user_id", "nunique"))
+            .reset_index()
+            .sort_values(["week", "volume_kg"], ascending=[True, False], ignore_index=True))
+
+def user_weekly_minutes(trainings):
+    """Macierz użytkownik × tydzień z sumą minut (0 dla tygodni bez treningów)"""
+    return trainings.pivot_table(index="user_id", columns="week", values="duration_min",
+                                 aggfunc="sum", fill_value=0, observed=True)
+
+REPORTS = {
+    "weekly": lambda path, weeks: weekly_volume(load_trainings(path, weeks)),
+    "pace": lambda path, weeks: pace_distribution(load_trainings(path, weeks), ("bieganie", "rower")),
+    "active": lambda path, weeks: weekly_active_users(load_trainings(path, weeks)),
+    "strength": lambda path, weeks: strength_volume(load_exercises(path, weeks)),
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Raporty z eksportu Parquet (training_export.py)")
+    parser.add_argument("report", choices=list(REPORTS), help="rodzaj raportu")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="katalog eksportu")
+    parser.add_argument("--weeks", nargs="*", default=None, help="tygodnie ISO, np. 2025-W22 2025-W23")
+    parser.add_argument("--csv", default=None, help="zapisz raport do pliku CSV")
+    args = parser.parse_args()
+    report = REPORTS[args.report](args.path, args.weeks)
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+    with pd.option_context("display.max_rows", 200, "display.width", 160):
+        print(report)
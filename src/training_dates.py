@@ -0,0 +1,52 @@
+from datetime import date, datetime
+
+import activity_calendar
+
+# Pole `date` treningu może być zapisane jako string "RRRR-MM-DD" (układ historyczny)
+# albo jako data BSON (po migracji / w kolekcji time-series). Operatory porównania
+# MongoDB nie porównują różnych typów BSON, więc warunki na datach budujemy dla obu
+# formatów - zapytania działają przed, w trakcie i po migracji.
+
+DATE_FORMAT = "%Y-%m-%d"
+
+def to_date_string(value):
+    return activity_calendar.to_date(value).strftime(DATE_FORMAT)
+
+def to_datetime(value):
+    """Data BSON (północ UTC) - tak samo jak $toDate na stringu 'RRRR-MM-DD'"""
+    day = activity_calendar.to_date(value)
+    return datetime(day.year, day.month, day.day)
+
+def to_storage(value, native):
+    return to_datetime(value) if native else to_date_string(value)
+
+def format_conditions(date_from=None, date_to=None):
+    """Warunki zakresu dat (włącznie) osobno dla stringów i dat BSON; None gdy brak granic"""
+    bounds = {}
+    if date_from:
+        bounds["$gte"] = date_from
+    if date_to:
+        bounds["$lte"] = date_to
+    if not bounds:
+        return None
+    return [
+        {"date": {op: to_date_string(v) for op, v in bounds.items()}},
+        {"date": {op: to_datetime(v) for op, v in bounds.items()}},
+    ]
+
+def range_condition(date_from=None, date_to=None):
+    """Warunek zakresu dat (włącznie) dopasowujący oba formaty zapisu; None gdy brak granic"""
+    conditions = format_conditions(date_from, date_to)
+    return {"$or": conditions} if conditions else None
+
+def keyset_after_condition(after_date, after_id):
+    """Dokumenty za (after_date, after_id) w porządku malejącym (date, _id).
+    W porządku BSON daty są "większe" od stringów, więc po ostatniej dacie BSON
+    następują wszystkie dokumenty z datą zapisaną jako string."""
+    condition = [
+        {"date": {"$lt": after_date}},
+        {"date": after_date, "_id": {"$lt": after_id}},
+    ]
+    if isinstance(after_date, (datetime, date)):
+        condition.append({"date": {"$type": "string"}})
+    return {"$or": condition}
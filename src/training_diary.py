@@ -1,202 +1,250 @@
-from pymongo import MongoClient
 from bson import ObjectId
 from datetime import datetime
-import redis
-from datetime import datetime, timedelta
+from redis.exceptions import NoScriptError
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure
+import activity_calendar
+import training_rollups
+import cardio_intensity
+import training_dates
+import training_events
+import diary_queries
+import diary_service
+import connections
+import instrumentation
+import leaderboards
+import indexes
+from diary_queries import USERNAMES_KEY, get_week_key
+import os
+import sys
+
+# Operacje użytkownika (konta, sesje, treningi, znajomi, feed, serie, rankingi, analizy) są
+# zaimplementowane raz, w diary_service.py - funkcje o tych samych nazwach poniżej to ich
+# synchroniczne opakowania (diary_service.run). Ten moduł zawiera poza tym CLI (wyświetlanie)
+# oraz narzędzia wsadowe na klientach synchronicznych: przebudowę rollupów i lustra znajomych,
+# backfill intensywności, archiwizację rankingów i dziennik zdarzeń (change stream).
+
 # === DB SETUP ===
-client = MongoClient("mongodb://localhost:27017/?replicaSet=rs0")
-db = client["training_diary"]
-users_col = db["users"]
-trainings_col = db["trainings"]
-friends_col = db["friends"]
+# Klienci synchroniczni (narzędzia wsadowe, import, usuwanie danych) powstają przy pierwszym
+# użyciu (connections.py) - import modułu nie łączy się z siecią
+client = connections.Lazy(connections.get_mongo_client)
+db = connections.Lazy(connections.get_database)
+users_col = connections.collection("users")
+# Kolekcja treningów może być zwykła albo time-series (zob. migrate_training_dates.py)
+trainings_col = connections.collection(os.environ.get("TRAININGS_COLLECTION", "trainings"))
+friends_col = connections.collection("friends")
+rollups_col = connections.collection(training_rollups.ROLLUPS_COLLECTION)
+leaderboard_archive_col = connections.collection(leaderboards.ARCHIVE_COLLECTION)
+stats_applied_col = connections.collection(diary_queries.STATS_APPLIED_COLLECTION)
+pending_deletes_col = connections.collection(diary_queries.PENDING_DELETES_COLLECTION)
 
 # === USER REGISTRATION ===
 def register_user(username, email, password, age, gender):
-    if users_col.find_one({"username": username}):
-        return False
-    user = {
-        "username": username,
-        "email": email,
-        "password_hash": password,
-        "age": age,
-        "gender": gender,
-        "stats": {
-            "total_trainings": 0,
-            "total_calories": 0,
-            "total_minutes": 0
-        }
-    }
-    users_col.insert_one(user)
-    return True
+    return diary_service.run(diary_service.register_user(username, email, password, age, gender))
+
 # ===Połączenie Redis===
-try:
-    redis_client = redis.Redis(host='localhost', port=6379, password='redis123', decode_responses=True)
-    redis_client.ping()  # Test połączenia
-    print("Redis połączony!")
-except:
-    print("Błąd połączenia z Redis")
-    redis_client = None
+# Dostępność sprawdzana przy pierwszym użyciu; `if not redis_client` jest prawdziwe, gdy Redis nie działa
+redis_client = connections.Lazy(connections.get_redis)
+
+# === SKRYPTY LUA ===
+_lua_scripts = {}
+
+def run_lua(source, keys=(), args=(), raw=False):
+    """Wykonaj skrypt Lua (EVALSHA, a przy pierwszym użyciu EVAL) - jeden round trip.
+    raw=True zwraca bajty bez dekodowania (np. gdy skrypt zwraca bitmapę)"""
+    script = _lua_scripts.get(source)
+    if script is None:
+        script = _lua_scripts[source] = redis_client.register_script(source)
+    if not raw:
+        return script(keys=list(keys), args=list(args))
+    try:
+        return redis_client.execute_command("EVALSHA", script.sha, len(keys), *keys, *args, NEVER_DECODE=True)
+    except NoScriptError:
+        return redis_client.execute_command("EVAL", source, len(keys), *keys, *args, NEVER_DECODE=True)
+
+# === CACHE ANALIZ UŻYTKOWNIKA ===
+def invalidate_user_cache(user_id):
+    """Unieważnij wszystkie wyniki użytkownika (add_training robi to w skrypcie efektów)"""
+    return diary_service.run(diary_service.invalidate_user_cache(user_id))
+
+def invalidate_all_caches():
+    """Unieważnij wyniki wszystkich użytkowników - po zmianach danych poza add_training"""
+    return diary_service.run(diary_service.invalidate_all_caches())
+
+def get_cache_stats():
+    """Trafienia, chybienia i czekania na wynik liczony przez innego klienta, per rodzaj wyniku"""
+    return diary_service.run(diary_service.get_cache_stats())
 
 # === USER LOGIN ===
+def verify_credentials(email, password):
+    """Dokument użytkownika (_id, username) po poprawnym haśle; stare hasła zapisane wprost zamienia na skrót"""
+    return diary_service.run(diary_service.verify_credentials(email, password))
+
 def login_user(email, password):
-    user = users_col.find_one({"email": email, "password_hash": password})
-    if user:
-        return user["_id"]
-    return None
+    return diary_service.run(diary_service.login_user(email, password))
+
+# === SESJE W REDIS ===
+def login(email, password):
+    """Jedna weryfikacja hasła (MongoDB + scrypt), potem kolejne wywołania używają tokenu"""
+    return diary_service.run(diary_service.login(email, password))
+
+def authenticate(token):
+    """Sprawdź token jednym round tripem do Redis (HGETALL + przesunięcie TTL); None gdy sesja wygasła"""
+    return diary_service.run(diary_service.authenticate(token))
+
+def logout(token):
+    return diary_service.run(diary_service.logout(token))
+
+def revoke_sessions(user_id):
+    """Unieważnij wszystkie sesje użytkownika; zwraca ich liczbę"""
+    return diary_service.run(diary_service.revoke_sessions(user_id))
+
+def change_password(user_id, old_password, new_password):
+    return diary_service.run(diary_service.change_password(user_id, old_password, new_password))
+
+# === TRAININGS LAYOUT ===
+def trainings_layout():
+    """'timeseries' albo 'collection' - sprawdzane raz, przy pierwszym zapisie"""
+    return diary_service.run(diary_service.trainings_layout())
 
 # === ADD TRAINING WITH TRANSACTION ===
 def add_training(user_id, training):
-    with client.start_session() as session:
-        with session.start_transaction():
-            training["user_id"] = user_id
-            trainings_col.insert_one(training, session=session)
-
-            calories = training["metrics"].get("calories_burned", 0)
-            duration = training["metrics"].get("duration_min", 0)
-
-            users_col.update_one(
-                {"_id": user_id}, # POPRAWKA  2025-06-04
-                {
-                    "$inc": {
-                        "stats.total_trainings": 1,
-                        "stats.total_calories": calories,
-                        "stats.total_minutes": duration
-                    }
-                },
-                session=session
-            )
-            # Aktualizuj streak po dodaniu treningu
-            session.commit_transaction()
-            
-    # Aktualizuj streak po zakończeniu transakcji
-    new_streak = update_user_streak(user_id,training)
-    print(f"Seria treningowa: {new_streak} dni!")
-    # Aktualizuj ranking kalorii (tylko jeśli trening ma kalorie)
-    if calories > 0:
-        update_calories_leaderboard(user_id, calories)
-        
-        # Sprawdź pozycję użytkownika w rankingu
-        position_data = get_user_calories_position(user_id)
-        if position_data and position_data["position"]:
-            print(f"Ranking kalorii: #{position_data['position']} miejsce ({position_data['calories']} kcal w tym tygodniu)")
-    # Ustaw przypomnienie na jutro
-    set_training_reminder(user_id)
+    """Zapisz trening (transakcja: trening, users.stats, rollupy), potem efekty w Redis.
+    Zwraca serię i pozycję w rankingu albo None, gdy Redis jest niedostępny."""
+    return diary_service.run(diary_service.add_training(user_id, training))
+
+def print_training_effects(effects):
+    if not effects:
+        return
+    if effects["new_record"]:
+        print(f"NOWY REKORD! Seria {effects['best']} dni!")
+    print(f"Seria treningowa: {effects['streak']} dni!")
+    if effects["position"]:
+        print(f"Ranking kalorii: #{effects['position']} miejsce ({effects['calories']} kcal w tym tygodniu)")
+
+# === BULK TRAININGS (SYNCHRONIZACJA URZĄDZEŃ) ===
+def add_trainings_bulk_multi(trainings_by_user):
+    """Zapisz paczki treningów wielu użytkowników: {user_id: [trening, ...]}.
+    Każdy trening ma `dedup_key` od klienta - ponowienie po błędzie pomija już zapisane treningi,
+    więc kalorie i statystyki nie są liczone podwójnie. Jedna transakcja (insert_many, jedno $inc
+    users.stats na użytkownika, zagregowane rollupy) i jeden pipeline Redis na całą paczkę."""
+    return diary_service.run(diary_service.add_trainings_bulk_multi(trainings_by_user))
+
+def add_trainings_bulk(user_id, trainings):
+    """Zapisz paczkę treningów jednego użytkownika; zwraca {inserted, duplicates, effects}"""
+    return diary_service.run(diary_service.add_trainings_bulk(user_id, trainings))
 
 # === VIEW TRAININGS ===
-def view_trainings(user_id):
-    results = trainings_col.find({"user_id": user_id})
-    for r in results:
-        print(r)
+def get_training_history_page(user_id, after=None, limit=20, types=None, date_from=None, date_to=None, fields=None):
+    """Strona historii treningów (od najnowszych), paginacja keyset po indeksie (user_id, date, _id).
+    `after` to wartość "next" z poprzedniej strony - koszt strony nie zależy od długości historii."""
+    return diary_service.run(diary_service.get_training_history_page(user_id, after, limit, types, date_from, date_to,
+                                                                     fields))
+
+def view_trainings(user_id, page_size=20):
+    """Wyświetl historię treningów strona po stronie"""
+    after = None
+    while True:
+        page = get_training_history_page(user_id, after=after, limit=page_size)
+        if not page["items"] and after is None:
+            print("Brak treningów.")
+            return
+        for r in page["items"]:
+            metrics = r.get("metrics", {})
+            line = f"{training_dates.to_date_string(r['date'])} | {r.get('type')} | {metrics.get('duration_min', 0)} min | {metrics.get('calories_burned', 0)} kcal"
+            if "distance_km" in metrics:
+                line += f" | {metrics['distance_km']} km"
+            print(line)
+        after = page["next"]
+        if not after or input("Enter - następna strona, q - powrót: ").strip().lower() == "q":
+            return
 
 # === GET STATS ===
 def get_user_stats(user_id):
-    user = users_col.find_one({"_id": user_id})
-    return user.get("stats", {})
+    return diary_service.run(diary_service.get_user_stats(user_id))
+
+def get_user_rollup_summary(user_id):
+    """Statystyki na ekran: bieżący tydzień, miesiąc i cały okres per typ - jedno zapytanie po indeksie"""
+    return diary_service.run(diary_service.get_user_rollup_summary(user_id))
+
+def display_user_stats(user_id):
+    """Wyświetl statystyki z rollupów (menu opcja 3)"""
+    summary = get_user_rollup_summary(user_id)
+    titles = {"week": "Ten tydzień", "month": "Ten miesiąc", "all": "Łącznie"}
+    for period in training_rollups.PERIODS:
+        rows = summary[period]
+        print(f"\n=== {titles[period]} ===")
+        if not rows:
+            print("Brak treningów")
+            continue
+        for t_type, r in sorted(rows.items()):
+            print(f"{t_type}: {r['count']} tren. | {r['minutes']:.0f} min | {r['kcal']:.0f} kcal | {r['distance_km']:.1f} km")
+        print(f"RAZEM: {sum(r['count'] for r in rows.values())} tren. | "
+              f"{sum(r['minutes'] for r in rows.values()):.0f} min | {sum(r['kcal'] for r in rows.values()):.0f} kcal")
+
+def rebuild_rollups(user_id=None):
+    """Przelicz rollupy (i users.stats) od zera: $group + $merge, potem usuń nieaktualne dokumenty"""
+    if user_id is not None and ObjectId.is_valid(user_id):
+        user_id = ObjectId(user_id)
+    match = {"user_id": user_id} if user_id is not None else {}
+    # $merge wymaga unikalnego indeksu na kluczu rollupu
+    indexes.ensure_indexes(db, [training_rollups.ROLLUPS_COLLECTION], quiet=True)
+    rebuilt_at = datetime.now()
+    trainings_col.aggregate(training_rollups.rebuild_pipeline(rebuilt_at, match), allowDiskUse=True)
+    rollups_col.delete_many(training_rollups.stale_rollups_filter(rebuilt_at, match))
+    rollups_col.aggregate(training_rollups.user_stats_pipeline(match), allowDiskUse=True)
+    if user_id is not None:
+        invalidate_user_cache(user_id)
+    else:
+        invalidate_all_caches()
     
 # === ADD FRIEND ===    
 def add_friend_by_username(user_id, friend_username):
-    friend = users_col.find_one({"username": friend_username})
-    if not friend:
-        return False
-    friend_id = friend["_id"]
-    if user_id == friend_id:
-        return False
-    
-    # Sprawdź czy już są znajomymi
-    user_friends = friends_col.find_one({"user_id": user_id})
-    if user_friends and friend_id in user_friends.get("friends", []):
-        return False
-    
-    # Dodaj znajomego do listy użytkownika (lub utwórz listę)
-    friends_col.update_one(
-        {"user_id": user_id},
-        {"$addToSet": {"friends": friend_id}},
-        upsert=True
-    )
-    
-    # Dodaj użytkownika do listy znajomego (obustronnie)
-    friends_col.update_one(
-        {"user_id": friend_id},
-        {"$addToSet": {"friends": user_id}},
-        upsert=True
-    )
-    
-    return True
+    return diary_service.run(diary_service.add_friend_by_username(user_id, friend_username))
+
 # === LIST FRIENDS ===
 def list_friends(user_id):
-    # Znajdź dokument znajomych dla użytkownika
-    friends_doc = friends_col.find_one({"user_id": user_id})
-    if not friends_doc or "friends" not in friends_doc:
-        return []
-    
-    friend_ids = friends_doc["friends"]
-    return list(users_col.find({"_id": {"$in": friend_ids}}, {"username": 1}))
+    return diary_service.run(diary_service.list_friends(user_id))
 
 # === INTENSITY DESCRIPTION FUNCTION ===
 def get_cardio_intensity_description(user_id):
-    pipeline = [
-        {"$match": {"user_id": user_id, "type": {"$in": ["bieganie", "rower", "pływanie"]}}},
-        {"$addFields": {
-            "intensity_description": {
-                "$function": {
-                    "body": """
-                    function(type, metrics) {
-                        if (!metrics || !type) return null;
-                        if (type === 'bieganie' && metrics.distance_km && metrics.duration_min) {
-                            const kmph = (metrics.distance_km / (metrics.duration_min / 60));
-                            if (kmph < 7) return 'niskie tempo';
-                            else if (kmph < 11) return 'umiarkowane tempo';
-                            else return 'wysokie tempo';
-                        }
-                        if (type === 'rower' && metrics.avg_speed_kmh) {
-                            if (metrics.avg_speed_kmh < 15) return 'wolna jazda';
-                            else if (metrics.avg_speed_kmh < 25) return 'umiarkowane tempo';
-                            else return 'szybka jazda';
-                        }
-                        if (type === 'pływanie' && metrics.laps && metrics.pool_length_m && metrics.duration_min) {
-                            const mpm = (metrics.laps * metrics.pool_length_m) / metrics.duration_min;
-                            if (mpm < 15) return 'spokojne tempo';
-                            else if (mpm < 30) return 'średnie tempo';
-                            else return 'intensywne pływanie';
-                        }
-                        return 'brak danych';
-                    }
-                    """,
-                    "args": ["$type", "$metrics"],
-                    "lang": "js"
-                }
-            }
-        }}
-    ]
-    return list(trainings_col.aggregate(pipeline))
+    """Intensywność treningów cardio: zapisana wartość, a dla starszych dokumentów natywne $switch"""
+    return diary_service.run(diary_service.get_cardio_intensity_description(user_id))
+
+def backfill_cardio_intensity(batch_size=1000):
+    """Uzupełnij intensity_description w istniejących dokumentach, paczkami po _id"""
+    if trainings_layout() == "timeseries":
+        # Time-series (MongoDB 6.0) aktualizuje tylko po metaField, a _id nie ma tam indeksu. Kopia do
+        # time-series (migrate_training_dates.py) uzupełnia pole, a odczyt liczy brakujące przez $switch.
+        print("Kolekcja time-series: pomijam uzupełnianie intensywności (uzupełnia je kopia do time-series).")
+        return 0
+    query = diary_queries.intensity_backfill_query()
+    update = [{"$set": {"intensity_description": cardio_intensity.intensity_expression()}}]
+    updated = 0
+    # Skan indeksu _id z filtrem (bez sortowania w pamięci wyników z indeksu type); kolejna paczka
+    # zaczyna się za ostatnim _id poprzedniej, więc skan nie wraca do już uzupełnionych dokumentów
+    for ids in diary_queries.iter_id_batches(trainings_col, query, batch_size, hint=[("_id", 1)]):
+        updated += trainings_col.update_many({"_id": {"$in": ids}}, update).modified_count
+        print(f"Uzupełniono intensywność: {updated} treningów")
+    if updated:
+        invalidate_all_caches()
+    return updated
 
 # === WINDOW FIELD AGGREGATION ===
 def get_training_durations_with_previous(user_id):
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$setWindowFields": {
-            "partitionBy": "$type",
-            "sortBy": {"date": 1},
-            "output": {
-                "previous_duration": {
-                    "$shift": {
-                        "output": "$metrics.duration_min",
-                        "by": -1
-                    }
-                }
-            }
-        }}
-    ]
-    return list(trainings_col.aggregate(pipeline))
+    return diary_service.run(diary_service.get_training_durations_with_previous(user_id))
+
+# === LATEST TRAINING PER TYPE VS PREVIOUS ===
+def get_latest_duration_per_type(user_id):
+    """Ostatni trening każdego typu i czas poprzedniego (pipeline w diary_queries.py)"""
+    return diary_service.run(diary_service.get_latest_duration_per_type(user_id))
 
 # === COMPARE TRAININGS ===
+def get_last_trainings(user_id, count=4):
+    return diary_service.run(diary_service.get_last_trainings(user_id, count))
+
 def compare_last_training_with_previous_three(user_id):
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$sort": {"date": -1}},
-        {"$limit": 4}
-    ]
-    trainings = list(trainings_col.aggregate(pipeline))
+    trainings = get_last_trainings(user_id, 4)
     if len(trainings) < 2:
         print("Za mało danych do porównania.")
         return
@@ -206,99 +254,69 @@ def compare_last_training_with_previous_three(user_id):
     print(f"\nOstatni trening: {last['type']}, {last['metrics'].get('duration_min', 0)} min, {last['metrics'].get('calories_burned', 0)} kcal")
     print("Poprzednie 3 treningi:")
     for t in previous:
-        # date jest stringiem, nie datetime - użyj bezpośrednio
-        print(f"- {t['type']} | {t['date']} | {t['metrics'].get('duration_min', 0)} min | {t['metrics'].get('calories_burned', 0)} kcal")
+        print(f"- {t['type']} | {training_dates.to_date_string(t['date'])} | {t['metrics'].get('duration_min', 0)} min | {t['metrics'].get('calories_burned', 0)} kcal")
         
 # === WATCH CHANGE STREAM ===
+# Sinki dziennika zdarzeń, np. TRAINING_EVENT_SINKS=file,redis-stream
+EVENT_SINKS = os.environ.get("TRAINING_EVENT_SINKS", "file").split(",")
+
 def watch_new_trainings():
-    with trainings_col.watch([{"$match": {"operationType": "insert"}}]) as stream:
-        print("Change stream listening for new trainings...")
-        for change in stream:
-            doc = change["fullDocument"]
-            log_entry = f'New training: {doc["type"]} by {doc["user_id"]} on {doc["date"]}\n'
-            with open("log.txt", "a") as f:
-                f.write(log_entry)
-            print(log_entry.strip())
-
-# === MENU ===
+    """Dziennik nowych treningów: buforowany konsument change streamu z tokenem wznowienia"""
+    consumer = training_events.ChangeStreamConsumer(
+        trainings_col,
+        training_events.build_sinks(EVENT_SINKS, redis_client),
+        training_events.FileTokenStore("events_resume_token.json")
+    )
+    print("Change stream listening for new trainings...")
+    try:
+        consumer.run()
+    except OperationFailure as e:
+        # Np. kolekcja time-series - change streamy nie są obsługiwane
+        print(f"Change stream niedostępny: {e}")
+    finally:
+        consumer.close()
+
+# === KALENDARZ AKTYWNOŚCI I SERIE ===
+def get_activity_bits(user_id):
+    """Pobierz bitmapę dni treningowych użytkownika (jeden GET) jako liczbę całkowitą"""
+    return diary_service.run(diary_service.get_activity_bits(user_id))
+
 def get_user_streak(user_id):
-    """Pobierz aktualną serię użytkownika"""
-    if not redis_client:
-        return {"current": 0, "best": 0}
-        
-    user_id_str = str(user_id)
-    current = redis_client.get(f"user:{user_id_str}:streak:current") or 0
-    best = redis_client.get(f"user:{user_id_str}:streak:best") or 0
-    
-    return {
-        "current": int(current),
-        "best": int(best)
-    }
+    """Aktualna i najlepsza seria oraz liczba dni treningowych w tym miesiącu (liczone z bitmapy)"""
+    return diary_service.run(diary_service.get_user_streak(user_id))
+
+def get_activity_heatmap(user_id, year=None):
+    """Daty treningów w danym roku - dane do heatmapy aktywności"""
+    return activity_calendar.training_days(get_activity_bits(user_id), year or datetime.now().year)
+
+def get_monthly_training_days(user_id, year=None):
+    """Liczba dni treningowych w każdym miesiącu roku"""
+    return activity_calendar.monthly_counts(get_activity_bits(user_id), year or datetime.now().year)
 
 def update_user_streak(user_id,training):
-    """Aktualizuj serię po dodaniu treningu"""
-    if not redis_client:
+    """Aktualizuj serię po dodaniu treningu (bez rankingu i przypomnienia)"""
+    effects = apply_training_side_effects(user_id, training, ranked=False, reminder=False)
+    if not effects:
         return
-    user_id_str = str(user_id)
-    today = datetime.now().strftime("%Y-%m-%d")
-    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-    
-    # Sprawdź czy użytkownik trenował wczoraj
-    yesterday_training = trainings_col.find_one({
-        "user_id": user_id,
-        "date": yesterday
-    })
-    
-    # Pobierz aktualną serię
-    current_streak = int(redis_client.get(f"user:{user_id_str}:streak:current") or 0)
-    best_streak = int(redis_client.get(f"user:{user_id_str}:streak:best") or 0)
-    
-    last_training_day = redis_client.get(f"user:{user_id_str}:streak:last_day")
-    training_date = training["date"]  # Data dodawanego treningu
-
-    if last_training_day == training_date:
-        # Już trenował w tym dniu
-        return current_streak
-    elif last_training_day:
-        # Sprawdź czy to kontynuacja serii (dzień po ostatnim treningu)
-        last_date = datetime.strptime(last_training_day, "%Y-%m-%d")
-        current_date = datetime.strptime(training_date, "%Y-%m-%d")
-        if (current_date - last_date).days == 1:
-            # Kontynuuj serię
-            new_streak = current_streak + 1
-        else:
-            # Przerwa w serii lub trening wstecz
-            new_streak = 1
-    else:
-        # Pierwszy trening
-        new_streak = 1
-
-    # Zapisz datę treningu (nie dzisiejszą datę!)
-    redis_client.set(f"user:{user_id_str}:streak:last_day", training_date)
-    
-    # Zapisz nową serię
-    redis_client.set(f"user:{user_id_str}:streak:current", new_streak)
-    
-    # Aktualizuj najlepszą serię jeśli potrzeba
-    if new_streak > best_streak:
-        redis_client.set(f"user:{user_id_str}:streak:best", new_streak)
-        print(f"NOWY REKORD! Seria {new_streak} dni!")
-    
-    return new_streak
+    if effects["new_record"]:
+        print(f"NOWY REKORD! Seria {effects['best']} dni!")
+    return effects["streak"]
 
 def display_user_streak(user_id):
     """Wyświetl informacje o serii użytkownika"""
-    if not redis_client:
+    if not diary_service.redis_client:
         print("Redis niedostępny - streaks nie działają")
         return
-    user_id_str = str(user_id)
+    # Jeden odczyt bitmapy wystarcza na serie i licznik dni w miesiącu
     streak_data = get_user_streak(user_id)
     current = streak_data["current"]
     best = streak_data["best"]
+    month_days = streak_data["month_days"]
     
     print(f"\nTWOJA SERIA TRENINGOWA:")
     print(f"Aktualna seria: {current} dni")
     print(f"Najlepsza seria: {best} dni")
+    print(f"Dni treningowe w tym miesiącu: {month_days}")
     
     if current == 0:
         print("Dodaj trening aby rozpocząć serię!")
@@ -310,52 +328,23 @@ def display_user_streak(user_id):
         print("LEGENDA! Miesięczna seria!")
     else:
         print(f"Świetnie! Jeszcze {7-current} dni do tygodniowej serii!")
-def get_week_key():
-    """Generuj klucz dla aktualnego tygodnia (format: 2025-W23)"""
-    today = datetime.now()
-    week = today.isocalendar()[1]  # Numer tygodnia w roku
-    year = today.year
-    return f"{year}-W{week:02d}"
-
 def update_calories_leaderboard(user_id, calories):
-    """Dodaj kalorie do rankingu tygodniowego"""
-    if not redis_client:
-        return
-    user_id_str = str(user_id)
-    week_key = get_week_key()
-    calories_key = f"leaderboard:calories:{week_key}"
-    # Dodaj kalorie do aktualnej sumy użytkownika
-    redis_client.zincrby(calories_key, calories, user_id_str)
-    
-    # Ustaw TTL na 7 dni (ranking resetuje się co tydzień)
-    redis_client.expire(calories_key, 604800)  # 604800 sekund = 7 dni
-    
+    """Dodaj kalorie do rankingów kalorii bieżących okresów (bez podziału na typ)"""
+    return diary_service.run(diary_service.update_calories_leaderboard(user_id, calories))
+
 def set_training_reminder(user_id):
     """Ustaw przypomnienie o treningu na jutro"""
-    if not redis_client:
-        return
-    user_id_str = str(user_id)
-    reminder_key = f"reminder:{user_id_str}:tomorrow"
-    message = "Czas na trening!"
-    
-    # Przypomnienie na 24 godziny
-    redis_client.setex(reminder_key, 86400, message)
+    return diary_service.run(diary_service.set_training_reminder(user_id))
+
+# === EFEKTY TRENINGU W REDIS (JEDEN ROUND TRIP) ===
+def apply_training_side_effects(user_id, training, ranked=True, reminder=True):
+    """Aktualizuj streak, rankingi (wszystkie okresy, miary i typ treningu) i przypomnienie atomowo;
+    zwróć serię oraz pozycję w bieżącym tygodniowym rankingu kalorii"""
+    return diary_service.run(diary_service.apply_training_side_effects(user_id, training, ranked, reminder))
 
 def get_training_reminder(user_id):
     """Sprawdź czy użytkownik ma przypomnienie"""
-    if not redis_client:
-        return None
-    user_id_str = str(user_id)
-    reminder_key = f"reminder:{user_id_str}:tomorrow"
-    message = redis_client.get(reminder_key)
-    
-    if message:
-        # Sprawdź ile godzin zostało
-        ttl = redis_client.ttl(reminder_key)
-        hours_left = ttl // 3600
-        return f"{message} (zostało {hours_left} godzin)"
-    
-    return None
+    return diary_service.run(diary_service.get_training_reminder(user_id))
 
 def display_training_reminder(user_id):
     """Wyświetl przypomnienie użytkownika"""
@@ -369,65 +358,172 @@ def display_training_reminder(user_id):
         print("Brak przypomnienia")
         print("Dodaj trening aby ustawić przypomnienie na jutro!")
 
-def get_calories_leaderboard():
-    """Pobierz top 10 ranking spalonych kalorii"""
+def fetch_leaderboard_page(leaderboard_key, offset=0, limit=10):
+    """Pobierz stronę rankingu: pozycje, wyniki i nazwy (1 wywołanie Redis + najwyżej 1 zapytanie Mongo)"""
+    return diary_service.run(diary_service.fetch_leaderboard_page(leaderboard_key, offset, limit))
+
+# === RANKING WŚRÓD ZNAJOMYCH ===
+def mirror_friend_lists(friend_docs):
+    """Dodaj listy znajomych (dokumenty jak w kolekcji friends) do zbiorów Redis jednym pipeline"""
+    return diary_service.run(diary_service.mirror_friend_lists(friend_docs))
+
+def rebuild_friends_mirror(batch_size=1000):
+    """Odbuduj zbiory znajomych w Redis na podstawie kolekcji friends"""
+    batch = []
+    for doc in friends_col.find({}, {"user_id": 1, "friends": 1}).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            mirror_friend_lists(batch)
+            batch = []
+    mirror_friend_lists(batch)
+
+def get_friends_calories_leaderboard(user_id, limit=10):
+    """Ranking kalorii w tym tygodniu wśród znajomych użytkownika (łącznie z nim)"""
+    return diary_service.run(diary_service.get_friends_calories_leaderboard(user_id, limit))
+
+def display_friends_calories_leaderboard(user_id):
+    """Wyświetl ranking kalorii wśród znajomych"""
+    if not diary_service.redis_client:
+        print("Redis niedostępny - ranking nie działa")
+        return
+    result = get_friends_calories_leaderboard(user_id)
+    print(f"\nRANKING KALORII WŚRÓD ZNAJOMYCH - TYDZIEN {get_week_key()}")
+    print("=" * 40)
+    if not result["leaderboard"]:
+        print("Brak danych w tym tygodniu")
+        return
+    for entry in result["leaderboard"]:
+        print(f"{entry['position']}. {entry['username']} - {entry['calories']} kcal")
+    if result["position"]:
+        print(f"Twoje miejsce: #{result['position']} z {result['total']}")
+
+def get_calories_leaderboard(offset=0, limit=10):
+    """Pobierz stronę rankingu spalonych kalorii (domyślnie top 10)"""
+    return diary_service.run(diary_service.get_calories_leaderboard(offset, limit))
+
+def get_leaderboard(metric="calories", period="week", period_key=None, training_type=None, offset=0, limit=10):
+    """Strona rankingu dowolnego okresu, miary i typu; zamknięte okresy, których klucze
+    wygasły, są czytane z archiwum w MongoDB"""
+    return diary_service.run(diary_service.get_leaderboard(metric, period, period_key, training_type, offset,
+                                                           limit))
+
+def archive_leaderboards(refresh=False, batch_size=100):
+    """Zapisz migawki rankingów zamkniętych okresów (top ARCHIVE_TOP) w kolekcji leaderboard_archive.
+    Klucze Redis są znajdowane przez SCAN; okresy już zarchiwizowane są pomijane (chyba że refresh)."""
     if not redis_client:
-        return []
-    week_key = get_week_key()
-    calories_key = f"leaderboard:calories:{week_key}"
-    
-    # Pobierz top 10 z wynikami (zrevrange(od najwyższego))
-    top_users = redis_client.zrevrange(calories_key, 0, 9, withscores=True)
-    
-    # Konwertuj na czytelną listę z nazwami użytkowników
-    leaderboard = []
-    for i, (user_id, calories) in enumerate(top_users, 1):
-        user = users_col.find_one({"_id": user_id})
-        username = user["username"] if user else "Nieznany"
-        leaderboard.append({
-            "position": i,
-            "username": username,
-            "calories": int(calories)
-        })
-    
-    return leaderboard
+        print("Redis niedostępny - archiwizacja przerwana")
+        return 0
+    indexes.ensure_indexes(db, [leaderboards.ARCHIVE_COLLECTION], quiet=True)
+    today = datetime.now().date()
+    closed = []
+    for key in redis_client.scan_iter(match="leaderboard:*", count=1000):
+        _, _, period, period_key = leaderboards.parse_key(key)
+        if leaderboards.is_closed(period, period_key, today):
+            closed.append(key)
+    archived = 0
+    for start in range(0, len(closed), batch_size):
+        batch = closed[start:start + batch_size]
+        if not refresh:
+            filters = {key: leaderboards.key_filter(key) for key in batch}
+            done = {leaderboards.archive_identity(d) for d in leaderboard_archive_col.find(
+                {"$or": list(filters.values())}, dict.fromkeys(leaderboards.ARCHIVE_KEY_FIELDS, 1))}
+            batch = [key for key in batch if leaderboards.archive_identity(filters[key]) not in done]
+        if not batch:
+            continue
+        # Migawki jednej paczki kluczy w jednym round tripie
+        pipe = redis_client.pipeline(transaction=False)
+        for key in batch:
+            pipe.zrevrange(key, 0, leaderboards.ARCHIVE_TOP - 1, withscores=True)
+            pipe.zcard(key)
+        results = pipe.execute()
+        archived_at = datetime.now()
+        ops = []
+        for i, key in enumerate(batch):
+            if not results[2 * i + 1]:
+                continue  # klucz wygasł po SCAN
+            doc = leaderboards.archive_document(key, results[2 * i], results[2 * i + 1], archived_at)
+            ops.append(ReplaceOne(leaderboards.key_filter(key), doc, upsert=True))
+        if ops:
+            leaderboard_archive_col.bulk_write(ops, ordered=False)
+        archived += len(ops)
+    print(f"Zarchiwizowano {archived} rankingów zamkniętych okresów")
+    return archived
 
 def get_user_calories_position(user_id):
     """Sprawdź pozycję użytkownika w rankingu kalorii"""
-    if not redis_client:
-        return None
-    user_id_str = str(user_id)
-    week_key = get_week_key()
-    calories_key = f"leaderboard:calories:{week_key}"
-    
-    # Pobierz pozycję (rank) i wynik (score)
-    position = redis_client.zrevrank(calories_key, user_id_str)
-    score = redis_client.zscore(calories_key, user_id_str)
-    
-    return {
-        "position": (position + 1) if position is not None else None,
-        "calories": int(score) if score else 0
-    }
+    return diary_service.run(diary_service.get_user_calories_position(user_id))
 
-def display_calories_leaderboard():
+def display_calories_leaderboard(offset=0, limit=10):
     """Wyświetl ranking spalonych kalorii"""
-    if not redis_client:
+    display_leaderboard("calories", "week", offset=offset, limit=limit)
+
+def display_leaderboard(metric="calories", period="week", training_type=None, period_key=None, offset=0, limit=10):
+    """Wyświetl ranking wybranej miary, okresu (bieżącego albo podanego) i typu treningu"""
+    if not diary_service.redis_client:
         print("Redis niedostępny - ranking nie działa")
         return
-    week_key = get_week_key()
-    print(f"\nRANKING KALORII - TYDZIEN {week_key}")
+    if period_key:
+        period = leaderboards.period_of(period_key)
+    else:
+        period_key = leaderboards.period_keys(datetime.now().date())[period]
+    title = f"RANKING {leaderboards.METRIC_NAMES[metric]} - {leaderboards.PERIOD_NAMES[period]}"
+    if period != "all":
+        title += f" {period_key}"
+    if training_type:
+        title += f" ({training_type})"
+    print(f"\n{title}")
     print("=" * 40)
     
-    leaderboard = get_calories_leaderboard()
+    leaderboard = get_leaderboard(metric, period, period_key, training_type, offset, limit)
     
     if leaderboard:
         for entry in leaderboard:
-            print(f"{entry['position']}. {entry['username']} - {entry['calories']} kcal")
+            print(f"{entry['position']}. {entry['username']} - {leaderboards.format_score(metric, entry['score'])}")
     else:
-        print("Brak danych w tym tygodniu")
-        print("Dodaj trening z kaloriami aby pojawic sie w rankingu!")
-def main_menu(user_id):
+        print("Brak danych w tym okresie")
+        print("Dodaj trening aby pojawic sie w rankingu!")
+# === AKTYWNOŚĆ ZNAJOMYCH ===
+def fan_out_training(training):
+    """Dopisz trening do feedów znajomych autora (jeden skrypt Lua); zwraca liczbę feedów"""
+    return diary_service.run(diary_service.fan_out_training(training))
+
+def backfill_friend_feeds(user_id, friend_id):
+    """Scal ostatnie treningi nowych znajomych z ich feedami (w obie strony)"""
+    return diary_service.run(diary_service.backfill_friend_feeds(user_id, friend_id))
+
+def get_friends_feed(user_id, offset=0, limit=20):
+    """Strona ostatnich treningów znajomych (od najnowszych): jeden skrypt Redis + najwyżej jedno zapytanie o nazwy"""
+    return diary_service.run(diary_service.get_friends_feed(user_id, offset, limit))
+
+def display_friends_feed(user_id, page_size=10):
+    """Wyświetl aktywność znajomych strona po stronie"""
+    print("\n=== AKTYWNOŚĆ ZNAJOMYCH ===")
+    offset = 0
     while True:
+        page = get_friends_feed(user_id, offset, page_size)
+        if page is None:
+            print("Feed niedostępny (Redis nie działa).")
+            return
+        if not page["items"] and offset == 0:
+            print("Brak aktywności znajomych.")
+            return
+        for item in page["items"]:
+            line = f"{item['date']} | {item['username']} | {item['type']} | {item.get('duration_min') or 0} min"
+            if item.get("distance_km"):
+                line += f" | {item['distance_km']} km"
+            if item.get("calories_burned"):
+                line += f" | {item['calories_burned']} kcal"
+            print(line)
+        offset = page["next"]
+        if not offset or input("Enter - następna strona, q - powrót: ").strip().lower() == "q":
+            return
+
+def main_menu(user_id, token=None):
+    while True:
+        # Każda operacja sprawdza sesję jednym odczytem z Redis (bez MongoDB)
+        if token and not authenticate(token):
+            print("Sesja wygasła - zaloguj się ponownie.")
+            break
         print("\n=== MENU TRENINGOWE ===")
         print("1. Dodaj trening")
         print("2. Wyświetl treningi")
@@ -440,6 +536,9 @@ def main_menu(user_id):
         print("9. Zobacz ranking kalorii")
         print("10. Sprawdź przypomnienie")
         print("11. Porównaj czas trwania z poprzednim treningiem (wg typu)")
+        print("12. Ranking kalorii wśród znajomych")
+        print("13. Zmień hasło")
+        print("14. Aktywność znajomych")
         print("0. Wyloguj")
 
         choice = input("Choose: ")
@@ -471,16 +570,17 @@ def main_menu(user_id):
                 "metrics": metrics
             }
 
-            add_training(user_id, training)
+            print_training_effects(add_training(user_id, training))
             print("Trening dodany.")
 
         elif choice == "2":
             view_trainings(user_id)
         elif choice == "3":
-            print(get_user_stats(user_id))
+            display_user_stats(user_id)
         elif choice == "4":
             fuser = input("Nazwa znajomego: ")
-            print("Znajomy dodany!" if add_friend_by_username(user_id, fuser) else "Błąd.")
+            added = add_friend_by_username(user_id, fuser)
+            print("Znajomy dodany!" if added else "Błąd.")
         elif choice == "5":
             for u in list_friends(user_id):
                 print("-", u["username"])
@@ -492,39 +592,54 @@ def main_menu(user_id):
         elif choice == "8":
             display_user_streak(user_id)    
         elif choice == "9": 
-            display_calories_leaderboard()
+            period = {"1": "day", "3": "month", "4": "all"}.get(
+                input("Okres (1 dzień, 2 tydzień, 3 miesiąc, 4 cały okres) [2]: ").strip(), "week")
+            metric = {"2": "minutes", "3": "distance"}.get(
+                input("Miara (1 kalorie, 2 minuty, 3 dystans) [1]: ").strip(), "calories")
+            training_type = input("Typ treningu (Enter - wszystkie): ").strip() or None
+            while True:
+                period_key = input("Wcześniejszy okres, np. 2025-W23 (Enter - bieżący): ").strip() or None
+                try:
+                    if period_key:
+                        leaderboards.validate_period_key(period_key)
+                    break
+                except ValueError:
+                    print("Niepoprawny okres - podaj dzień 2025-06-04, tydzień 2025-W23 albo miesiąc 2025-06.")
+            display_leaderboard(metric, period, training_type, period_key)
         elif choice == "10":
             display_training_reminder(user_id)
         elif choice == "11":
-            result = get_training_durations_with_previous(user_id)
-
-            # Słownik: {typ_treningu: ostatni_trening}
-            latest_by_type = {}
-
-            for r in result:
-                t_type = r.get("type")
-                curr_date = r.get("date")
-                if not t_type or not curr_date:
-                    continue
-                if t_type not in latest_by_type or curr_date > latest_by_type[t_type]["date"]:
-                    latest_by_type[t_type] = r
-
             print("\n=== Ostatni trening każdego typu + porównanie ===")
-            for t_type, training in latest_by_type.items():
-                curr_dur = training.get("metrics", {}).get("duration_min", 0)
-                prev_dur = training.get("previous_duration")
+            for row in get_latest_duration_per_type(user_id):
+                curr_dur = row["current_duration"]
+                prev_dur = row["previous_duration"]
                 if prev_dur is not None:
-                    diff = curr_dur - prev_dur
+                    diff = row["delta"]
                     trend = f"(+{diff} min)" if diff > 0 else f"({diff} min)" if diff < 0 else "(bez zmian)"
-                    print(f"{t_type}: {curr_dur} min, poprzedni {prev_dur} min {trend}")
+                    print(f"{row['type']}: {curr_dur} min, poprzedni {prev_dur} min {trend}")
                 else:
-                    print(f"{t_type}: {curr_dur} min, brak wcześniejszego treningu")
+                    print(f"{row['type']}: {curr_dur} min, brak wcześniejszego treningu")
+        elif choice == "12":
+            display_friends_calories_leaderboard(user_id)
+        elif choice == "13":
+            old_pw = input("Obecne hasło: ")
+            new_pw = input("Nowe hasło: ")
+            if change_password(user_id, old_pw, new_pw):
+                print("Hasło zmienione. Zaloguj się ponownie.")
+                break
+            print("Błędne hasło.")
+        elif choice == "14":
+            display_friends_feed(user_id)
         elif choice == "0":
+            logout(token)
             break
         
 # === APP START ===
+# CLI jest cienkim klientem asynchronicznej warstwy usług (diary_service.py); klient synchroniczny
+# służy tylko do jednorazowego sprawdzenia indeksów przy starcie i dziennikowi zdarzeń w tle
 def start():
     print("=== Training Diary App ===")
+    indexes.ensure_indexes(db)
     while True:
         print("\n1. Zaloguj się")
         print("2. Zarejestruj się")
@@ -534,9 +649,9 @@ def start():
         if opt == "1":
             email = input("Email: ")
             pw = input("Hasło: ")
-            uid = login_user(email, pw)
-            if uid:
-                main_menu(uid)
+            session = login(email, pw)
+            if session:
+                main_menu(session["user_id"], session["token"])
             else:
                 print("Niepoprawne dane logowania.")
         elif opt == "2":
@@ -545,10 +660,15 @@ def start():
             pw = input("Hasło: ")
             age = int(input("Age: "))
             gen = input("Gender: ")
-            print("Zarejestrowano." if register_user(un, em, pw, age, gen) else "Nazwa użytkownika już zajęta.")
+            registered = register_user(un, em, pw, age, gen)
+            print("Zarejestrowano." if registered else "Nazwa użytkownika już zajęta.")
         elif opt == "0":
             break
 
+# === METRYKI (DIARY_METRICS=1) ===
+# Opakowuje publiczne funkcje modułu i korutyny diary_service pomiarem czasu, komend MongoDB i round tripów Redis
+instrumentation.setup_from_env(sys.modules[__name__], diary_service)
+
 if __name__ == "__main__":
     from threading import Thread
     Thread(target=watch_new_trainings, daemon=True).start()
@@ -0,0 +1,319 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from bson import json_util
+from pymongo.errors import OperationFailure, PyMongoError
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+import training_dates
+
+# Dziennik zdarzeń treningowych z change streamu.
+# Konsument czyta zdarzenia paczkami (batchSize / maxAwaitTimeMS), buforuje je
+# i zapisuje do ujść (plik z rotacją, strumień Redis, kanał pub/sub) po zebraniu
+# `flush_events` zdarzeń albo po `flush_interval` sekundach. Token wznowienia
+# jest zapisywany dopiero po zapisie paczki we wszystkich ujściach, więc po
+# restarcie lub zerwaniu połączenia nie giną zdarzenia (dostarczanie "co najmniej raz").
+# Niedostępne ujście (sieć, dysk) wstrzymuje konsumenta do skutku; zdarzenie, którego ujście
+# nie przyjmuje (błąd danych), jest pomijane z komunikatem, żeby nie blokowało strumienia.
+# Ujścia Redis zwracają zdarzenia odrzucone przez serwer - pozostałe polecenia pipeline już
+# się wykonały, więc nie są zapisywane drugi raz.
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_AWAIT_MS = 500
+DEFAULT_FLUSH_EVENTS = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0
+CHANGE_STREAM_HISTORY_LOST = 286
+# Błędy ujść ponawiane bez końca (zdarzenia czekają w buforze, token się nie przesuwa)
+TRANSIENT_SINK_ERRORS = (RedisConnectionError, RedisTimeoutError, OSError)
+
+# Change stream przekazuje tylko pola potrzebne w dzienniku
+EVENT_PIPELINE = [
+    {"$match": {"operationType": "insert"}},
+    {"$project": {
+        "operationType": 1,
+        "clusterTime": 1,
+        "fullDocument._id": 1,
+        "fullDocument.user_id": 1,
+        "fullDocument.type": 1,
+        "fullDocument.date": 1
+    }}
+]
+
+def format_event(change):
+    """Zdarzenie z samych stringów - XADD i JSON nie przyjmują ObjectId (konta z rejestracji)"""
+    doc = change["fullDocument"]
+    return {
+        "training_id": str(doc["_id"]),
+        "user_id": str(doc["user_id"]),
+        "type": str(doc.get("type") or ""),
+        "date": training_dates.to_date_string(doc["date"])
+    }
+
+def format_log_line(event):
+    return f'New training: {event["type"]} by {event["user_id"]} on {event["date"]}\n'
+
+def rejected_events(events, results):
+    """Pary (zdarzenie, błąd) dla poleceń pipeline odrzuconych przez serwer (execute(raise_on_error=False))"""
+    return [(event, result) for event, result in zip(events, results) if isinstance(result, Exception)]
+
+# === TOKENY WZNOWIENIA ===
+class FileTokenStore:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            return json_util.loads(f.read()).get("resume_token")
+
+    def save(self, token):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json_util.dumps({"resume_token": token}))
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class RedisTokenStore:
+    def __init__(self, client, key="events:trainings:resume_token"):
+        self.client = client
+        self.key = key
+
+    def load(self):
+        data = self.client.get(self.key)
+        return json_util.loads(data).get("resume_token") if data else None
+
+    def save(self, token):
+        self.client.set(self.key, json_util.dumps({"resume_token": token}))
+
+    def clear(self):
+        self.client.delete(self.key)
+
+# === UJŚCIA ===
+class FileSink:
+    """Plik dziennika otwarty przez cały czas pracy; rotacja po przekroczeniu max_bytes"""
+
+    def __init__(self, path="log.txt", max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(self.path, "a", encoding="utf-8", buffering=1024 * 1024)
+
+    def write(self, events):
+        self.file.write("".join(format_log_line(event) for event in events))
+        self.file.flush()
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8", buffering=1024 * 1024)
+
+    def close(self):
+        self.file.close()
+
+class RedisStreamSink:
+    """XADD całej paczki w jednym pipeline; strumień przycinany w przybliżeniu do maxlen"""
+
+    def __init__(self, client, key="events:trainings", maxlen=100000):
+        self.client = client
+        self.key = key
+        self.maxlen = maxlen
+
+    def write(self, events):
+        pipe = self.client.pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(self.key, event, maxlen=self.maxlen, approximate=True)
+        return rejected_events(events, pipe.execute(raise_on_error=False))
+
+    def close(self):
+        pass
+
+class RedisPubSubSink:
+    """PUBLISH każdego zdarzenia (JSON) w jednym pipeline"""
+
+    def __init__(self, client, channel="events:trainings"):
+        self.client = client
+        self.channel = channel
+
+    def write(self, events):
+        pipe = self.client.pipeline(transaction=False)
+        for event in events:
+            pipe.publish(self.channel, json.dumps(event, ensure_ascii=False))
+        return rejected_events(events, pipe.execute(raise_on_error=False))
+
+    def close(self):
+        pass
+
+# === KONSUMENT ===
+class ChangeStreamConsumer:
+    def __init__(self, collection, sinks, token_store, batch_size=DEFAULT_BATCH_SIZE,
+                 max_await_ms=DEFAULT_MAX_AWAIT_MS, flush_events=DEFAULT_FLUSH_EVENTS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, retry_delay=1.0):
+        self.collection = collection
+        self.sinks = sinks
+        self.token_store = token_store
+        self.batch_size = batch_size
+        self.max_await_ms = max_await_ms
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.stop_event = threading.Event()
+        self.buffer = []
+        self.pending_token = None
+        self.processed = 0
+        self.skipped = 0
+
+    def skip(self, sink, event, error):
+        self.skipped += 1
+        print(f"Pominięto zdarzenie {event.get('training_id')} w {type(sink).__name__}: {error}")
+
+    def write_sink(self, sink, events):
+        """Zapis paczki do ujścia. Błędy przejściowe są ponawiane co retry_delay, dopóki konsument
+        działa. Zdarzenia, które ujście zwróciło jako odrzucone przez serwer, są pomijane (reszta
+        paczki jest już zapisana). Inny błąd przed zapisem (np. DataError, TypeError) - paczka jest
+        zapisywana po jednym zdarzeniu, a zdarzenia odrzucone przez ujście są pomijane."""
+        while True:
+            try:
+                for event, error in sink.write(events) or []:
+                    self.skip(sink, event, error)
+                return
+            except TRANSIENT_SINK_ERRORS as e:
+                if self.stop_event.is_set():
+                    raise
+                print(f"Ujście {type(sink).__name__} niedostępne ({e}) - ponowienie za {self.retry_delay} s")
+                self.stop_event.wait(self.retry_delay)
+            except Exception:
+                break
+        for event in events:
+            try:
+                for rejected, error in sink.write([event]) or []:
+                    self.skip(sink, rejected, error)
+            except TRANSIENT_SINK_ERRORS:
+                # Ujście zniknęło w trakcie - reszta paczki wraca do trybu ponawiania
+                self.write_sink(sink, [event])
+            except Exception as e:
+                self.skip(sink, event, e)
+
+    def flush(self):
+        if self.buffer:
+            for sink in self.sinks:
+                self.write_sink(sink, self.buffer)
+            self.processed += len(self.buffer)
+            self.buffer = []
+        if self.pending_token is not None:
+            self.token_store.save(self.pending_token)
+            self.pending_token = None
+
+    def consume(self):
+        """Jedna sesja change streamu - od zapisanego tokenu do błędu lub zatrzymania"""
+        with self.collection.watch(EVENT_PIPELINE, resume_after=self.token_store.load(),
+                                   batch_size=self.batch_size,
+                                   max_await_time_ms=self.max_await_ms) as stream:
+            last_flush = time.monotonic()
+            while not self.stop_event.is_set() and stream.alive:
+                # try_next zwraca None po maxAwaitTimeMS bez zdarzeń - bufor zapisujemy też wtedy
+                change = stream.try_next()
+                if change is not None:
+                    try:
+                        self.buffer.append(format_event(change))
+                    except (KeyError, TypeError, ValueError, AttributeError) as e:
+                        self.skipped += 1
+                        print(f"Pominięto zdarzenie bez wymaganych pól ({e!r})")
+                # Token przesuwa się również na pustych paczkach (postBatchResumeToken)
+                self.pending_token = stream.resume_token
+                if len(self.buffer) >= self.flush_events or time.monotonic() - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = time.monotonic()
+        self.flush()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.consume()
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_HISTORY_LOST:
+                    raise
+                # Token wypadł z oplogu - zaczynamy od bieżącej chwili
+                print("Token wznowienia wygasł - change stream startuje od nowa.")
+                self.buffer = []
+                self.pending_token = None
+                self.token_store.clear()
+            except PyMongoError as e:
+                # Zdarzenia przeczytane przed błędem trafiają do ujść; reszta zostanie powtórzona od tokenu
+                print(f"Change stream przerwany ({e}) - ponowne połączenie...")
+                self.flush()
+                self.stop_event.wait(self.retry_delay)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+def build_sinks(names, redis_client=None, log_path="log.txt", max_bytes=10 * 1024 * 1024, backups=5):
+    sinks = []
+    for name in names:
+        if name == "file":
+            sinks.append(FileSink(log_path, max_bytes, backups))
+        elif name == "redis-stream":
+            sinks.append(RedisStreamSink(redis_client))
+        elif name == "redis-pubsub":
+            sinks.append(RedisPubSubSink(redis_client))
+        else:
+            raise ValueError(f"Nieznane ujście: {name}")
+    return sinks
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Konsument change streamu treningów (dziennik zdarzeń)")
+    parser.add_argument("--sink", action="append", choices=["file", "redis-stream", "redis-pubsub"],
+                        help="ujście zdarzeń (można podać kilka razy; domyślnie file)")
+    parser.add_argument("--log", default="log.txt", help="plik dziennika")
+    parser.add_argument("--max-bytes", type=int, default=10 * 1024 * 1024, help="rozmiar pliku przed rotacją")
+    parser.add_argument("--backups", type=int, default=5, help="liczba zachowanych plików po rotacji")
+    parser.add_argument("--token-file", default="events_resume_token.json", help="plik tokenu wznowienia")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-await-ms", type=int, default=DEFAULT_MAX_AWAIT_MS)
+    parser.add_argument("--flush-events", type=int, default=DEFAULT_FLUSH_EVENTS)
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL)
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    from training_diary import redis_client, trainings_col
+
+    consumer = ChangeStreamConsumer(
+        trainings_col,
+        build_sinks(args.sink or ["file"], redis_client, args.log, args.max_bytes, args.backups),
+        FileTokenStore(args.token_file),
+        args.batch_size, args.max_await_ms, args.flush_events, args.flush_interval
+    )
+    print("Change stream listening for new trainings...")
+    try:
+        consumer.run()
+    except KeyboardInterrupt:
+        consumer.stop()
+        consumer.flush()
+    finally:
+        consumer.close()
+        print(f"Zapisano {consumer.processed} zdarzeń, pominięto {consumer.skipped}.")
@@ -0,0 +1,296 @@
+import argparse
+import heapq
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo import ReadPreference
+
+import activity_calendar
+import diary_queries
+import training_dates
+import training_rollups
+from training_diary import trainings_col
+
+# Eksport treningów do plików Parquet dla analiz między użytkownikami (training_analytics.py),
+# bez obciążania bazy zapytaniami ad hoc. Treningi są czytane jednym kursorem (z sekundarnego
+# węzła replica setu, jeśli jest dostępny), metryki różnych typów są spłaszczane do kolumn,
+# a pliki partycjonowane po tygodniu ISO:
+#
+#   analytics/trainings/week=2025-W23/data.parquet   - jeden wiersz na trening
+#   analytics/exercises/week=2025-W23/data.parquet   - jeden wiersz na ćwiczenie (siłownia, kalistenika, ...)
+#   analytics/_manifest.json                         - wyeksportowane tygodnie
+#
+# Eksport jest przyrostowy: zapisywane są tylko zakończone tygodnie, których nie ma
+# w manifeście. Treningi dopisane później do już wyeksportowanych tygodni (np. synchronizacja
+# urządzenia ze starszymi datami) wymagają --since albo --full.
+
+DEFAULT_OUT_DIR = "analytics"
+MANIFEST = "_manifest.json"
+COMPRESSION = "zstd"
+DEFAULT_BATCH_SIZE = 5000
+# Liczba wierszy buforowanych na tydzień przed zapisem grupy wierszy do pliku
+DEFAULT_ROW_GROUP = 50000
+
+TRAINING_SCHEMA = pa.schema([
+    ("training_id", pa.string()),
+    ("user_id", pa.string()),
+    ("date", pa.date32()),
+    ("type", pa.string()),
+    ("duration_min", pa.float64()),
+    ("calories_burned", pa.float64()),
+    ("distance_km", pa.float64()),
+    ("pace_min_per_km", pa.float64()),
+    ("avg_speed_kmh", pa.float64()),
+    ("laps", pa.int32()),
+    ("pool_length_m", pa.float64()),
+    ("stroke", pa.string()),
+    ("style", pa.string()),
+    ("intensity_description", pa.string()),
+    ("exercise_count", pa.int32()),
+    ("total_sets", pa.int32()),
+    ("total_reps", pa.int32()),
+    ("volume_kg", pa.float64()),
+])
+
+EXERCISE_SCHEMA = pa.schema([
+    ("training_id", pa.string()),
+    ("user_id", pa.string()),
+    ("date", pa.date32()),
+    ("type", pa.string()),
+    ("name", pa.string()),
+    ("sets", pa.int32()),
+    ("reps", pa.int32()),
+    ("weight", pa.float64()),
+    ("duration_sec", pa.int32()),
+    ("rounds", pa.int32()),
+])
+
+# === SPŁASZCZANIE METRYK ===
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def _int(value):
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+def _exercise(item):
+    """Ćwiczenie jako słownik; treningi z menu CLI zapisują same nazwy (lista stringów)"""
+    if isinstance(item, dict):
+        return item
+    if isinstance(item, str) and item.strip():
+        return {"name": item.strip()}
+    return None
+
+def flatten_training(doc):
+    """Wiersz treningu i wiersze ćwiczeń; kształt metryk zależy od typu treningu
+    (bieg/rower: dystans i czas, pływanie: długości, siłownia: serie/powtórzenia/ciężar)"""
+    day = activity_calendar.to_date(doc["date"])
+    week = training_rollups.iso_week_key(day)
+    metrics = doc.get("metrics") or {}
+    training_id = str(doc["_id"])
+    # Konta z rejestracji mają ObjectId, z importu - stringi UUID
+    user_id = str(doc["user_id"])
+
+    distance = _number(metrics.get("distance_km"))
+    if distance is None and _number(metrics.get("distance_m")) is not None:
+        distance = metrics["distance_m"] / 1000
+    duration = _number(metrics.get("duration_min"))
+    row = {
+        "training_id": training_id,
+        "user_id": user_id,
+        "date": day,
+        "week": week,
+        "type": doc.get("type"),
+        "duration_min": duration,
+        "calories_burned": _number(metrics.get("calories_burned")),
+        "distance_km": distance,
+        "pace_min_per_km": duration / distance if duration and distance else None,
+        "avg_speed_kmh": _number(metrics.get("avg_speed_kmh")),
+        "laps": _int(metrics.get("laps")),
+        "pool_length_m": _number(metrics.get("pool_length_m")),
+        "stroke": metrics.get("stroke"),
+        "style": metrics.get("style"),
+        "intensity_description": doc.get("intensity_description"),
+        "exercise_count": None,
+        "total_sets": None,
+        "total_reps": None,
+        "volume_kg": None,
+    }
+
+    exercises = []
+    if isinstance(metrics.get("exercises"), list):
+        total_sets = total_reps = 0
+        volume = 0.0
+        for exercise in filter(None, map(_exercise, metrics["exercises"])):
+            sets = _int(exercise.get("sets"))
+            reps = _int(exercise.get("reps"))
+            weight = _number(exercise.get("weight"))
+            total_sets += sets or 0
+            total_reps += (sets or 0) * (reps or 0)
+            volume += (sets or 0) * (reps or 0) * (weight or 0)
+            exercises.append({
+                "training_id": training_id,
+                "user_id": user_id,
+                "date": day,
+                "week": week,
+                "type": doc.get("type"),
+                "name": exercise.get("name"),
+                "sets": sets,
+                "reps": reps,
+                "weight": weight,
+                "duration_sec": _int(exercise.get("duration_sec")),
+                "rounds": _int(exercise.get("rounds")),
+            })
+        row.update(exercise_count=len(exercises), total_sets=total_sets, total_reps=total_reps, volume_kg=volume)
+    return row, exercises
+
+# === TYGODNIE I MANIFEST ===
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def last_complete_week_end(today=None):
+    """Niedziela przed bieżącym tygodniem - bieżący tydzień nie jest jeszcze zamknięty"""
+    today = today or date.today()
+    return week_start(today) - timedelta(days=1)
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"weeks": {}, "exported_through": None}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+# === ZAPIS PARTYCJI ===
+# Kolumna `week` pochodzi z nazwy katalogu partycji (week=...), nie z pliku
+TABLES = {"trainings": TRAINING_SCHEMA, "exercises": EXERCISE_SCHEMA}
+
+class WeekWriter:
+    """Pliki jednego tygodnia zapisywane pod nazwą tymczasową (z kropką - czytniki Parquet ją
+    pomijają) i podmieniane po zamknięciu, więc przerwany eksport nie zostawia niepełnych partycji"""
+
+    def __init__(self, out_dir, week, row_group):
+        self.week = week
+        self.paths = {name: os.path.join(out_dir, name, f"week={week}", "data.parquet") for name in TABLES}
+        self.row_group = row_group
+        self.buffers = {name: [] for name in TABLES}
+        self.writers = {}
+        self.rows = {name: 0 for name in TABLES}
+
+    def _tmp_path(self, name):
+        directory, filename = os.path.split(self.paths[name])
+        return os.path.join(directory, f".{filename}.tmp")
+
+    def add(self, row, exercises):
+        self.buffers["trainings"].append(row)
+        self.buffers["exercises"].extend(exercises)
+        if len(self.buffers["trainings"]) >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        for name, schema in TABLES.items():
+            rows = self.buffers[name]
+            if not rows:
+                continue
+            if name not in self.writers:
+                os.makedirs(os.path.dirname(self.paths[name]), exist_ok=True)
+                self.writers[name] = pq.ParquetWriter(self._tmp_path(name), schema, compression=COMPRESSION)
+            self.writers[name].write_table(pa.Table.from_pylist(rows, schema=schema))
+            self.rows[name] += len(rows)
+            self.buffers[name] = []
+
+    def close(self):
+        self.flush()
+        for name, path in self.paths.items():
+            if name in self.writers:
+                self.writers[name].close()
+                os.replace(self._tmp_path(name), path)
+            elif os.path.exists(path):
+                # Ponowny eksport tygodnia, w którym nie ma już np. ćwiczeń
+                os.remove(path)
+        return self.rows
+
+# === EKSPORT ===
+def sorted_cursors(source, since, until, batch_size=DEFAULT_BATCH_SIZE):
+    """Kursory posortowane po dacie, osobno dla dat zapisanych jako string i jako data BSON
+    (w porządku BSON wszystkie stringi są przed datami); scala je heapq.merge po dniu treningu.
+    Zakres i kolejność z indeksu (date, _id) - eksport nowych tygodni czyta tylko je, bez sortowania."""
+    return [
+        source.find(condition, batch_size=batch_size, sort=diary_queries.DATE_SORT)
+        for condition in training_dates.format_conditions(since, until)
+    ]
+
+def export_trainings(out_dir=DEFAULT_OUT_DIR, since=None, until=None, full=False,
+                     batch_size=DEFAULT_BATCH_SIZE, row_group=DEFAULT_ROW_GROUP):
+    """Wyeksportuj zakończone tygodnie od ostatniego eksportu (albo od `since`); zwraca {tydzień: wiersze}"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"weeks": {}, "exported_through": None} if full else load_manifest(out_dir)
+    # Koniec eksportu zaokrąglony w dół do niedzieli - zapisujemy tylko pełne tygodnie
+    until = last_complete_week_end(activity_calendar.to_date(until) + timedelta(days=1)) if until \
+        else last_complete_week_end()
+    if since:
+        since = week_start(activity_calendar.to_date(since))
+    elif manifest["exported_through"]:
+        since = activity_calendar.to_date(manifest["exported_through"]) + timedelta(days=1)
+    if since and since > until:
+        print("Brak nowych zakończonych tygodni do eksportu.")
+        return {}
+
+    # Odczyt z sekundarnego węzła - eksport nie konkuruje z ruchem aplikacji na primary
+    source = trainings_col.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    cursors = sorted_cursors(source, since, until, batch_size)
+
+    started = time.perf_counter()
+    exported = {}
+    writer = None
+    read = 0
+
+    def close_week():
+        exported[writer.week] = writer.close()
+        manifest["weeks"][writer.week] = {**exported[writer.week],
+                                          "exported_at": datetime.now().isoformat(timespec="seconds")}
+
+    try:
+        # Treningi po dacie - otwarty jest tylko plik bieżącego tygodnia
+        for doc in heapq.merge(*cursors, key=lambda d: activity_calendar.to_date(d["date"])):
+            row, exercises = flatten_training(doc)
+            if writer is None or writer.week != row["week"]:
+                if writer is not None:
+                    close_week()
+                writer = WeekWriter(out_dir, row["week"], row_group)
+            writer.add(row, exercises)
+            read += 1
+            if read % 100000 == 0:
+                print(f"Odczytano {read} treningów ({read / (time.perf_counter() - started):.0f} dok/s)")
+    finally:
+        for cursor in cursors:
+            cursor.close()
+    if writer is not None:
+        close_week()
+    manifest["exported_through"] = until.isoformat()
+    save_manifest(out_dir, manifest)
+    elapsed = time.perf_counter() - started
+    print(f"Wyeksportowano {read} treningów w {len(exported)} tygodniach do {out_dir} w {elapsed:.1f} s")
+    return exported
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Eksport treningów do Parquet (partycje po tygodniu ISO)")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="katalog eksportu")
+    parser.add_argument("--since", default=None, help="eksportuj ponownie od tygodnia zawierającego datę RRRR-MM-DD")
+    parser.add_argument("--until", default=None, help="ostatni dzień eksportu (domyślnie koniec poprzedniego tygodnia)")
+    parser.add_argument("--full", action="store_true", help="eksportuj wszystko od nowa (ignoruj manifest)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rozmiar paczki kursora")
+    parser.add_argument("--row-group", type=int, default=DEFAULT_ROW_GROUP, help="wierszy w grupie Parquet")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    export_trainings(args.out, args.since, args.until, args.full, args.batch_size, args.row_group)
@@ -0,0 +1,174 @@
+from datetime import datetime
+from pymongo import UpdateOne
+import argparse
+
+import training_dates
+
+# Zmaterializowane statystyki: suma treningów na użytkownika × typ × okres.
+# Okresy: tydzień ISO ("2025-W23"), miesiąc ("2025-06") i cały okres ("all").
+# add_training aktualizuje je przyrostowo ($inc w tej samej transakcji),
+# a rebuild_rollups przelicza wszystko od zera jednym $group + $merge.
+
+ROLLUPS_COLLECTION = "training_rollups"
+ROLLUP_KEY_FIELDS = ["user_id", "period", "period_key", "type"]
+PERIODS = ("week", "month", "all")
+
+def iso_week_key(day):
+    """Klucz tygodnia ISO - rok ISO, a nie kalendarzowy (np. 2024-12-30 -> 2025-W01)"""
+    iso_year, week, _ = day.isocalendar()
+    return f"{iso_year}-W{week:02d}"
+
+def month_key(day):
+    return day.strftime("%Y-%m")
+
+def period_keys(day):
+    return {"week": iso_week_key(day), "month": month_key(day), "all": "all"}
+
+def training_totals(metrics):
+    """Wartości sumowane w rollupach dla jednego treningu"""
+    distance = metrics.get("distance_km")
+    if distance is None and metrics.get("distance_m") is not None:
+        distance = metrics["distance_m"] / 1000
+    return {
+        "count": 1,
+        "minutes": metrics.get("duration_min", 0) or 0,
+        "kcal": metrics.get("calories_burned", 0) or 0,
+        "distance_km": distance or 0
+    }
+
+def rollup_update_ops(training, sign=1):
+    """Operacje $inc (upsert) dla wszystkich okresów treningu; sign=-1 cofa trening"""
+    day = training_dates.to_datetime(training["date"])
+    totals = {field: value * sign for field, value in training_totals(training.get("metrics", {})).items()}
+    return [
+        UpdateOne(
+            {"user_id": training["user_id"], "period": period, "period_key": key, "type": training["type"]},
+            {"$inc": totals},
+            upsert=True
+        )
+        for period, key in period_keys(day).items()
+    ]
+
+def aggregated_rollup_ops(trainings, sign=1):
+    """Jak rollup_update_ops, ale dla wielu treningów: jedna operacja $inc na dokument rollupu"""
+    sums = {}
+    for training in trainings:
+        day = training_dates.to_datetime(training["date"])
+        totals = training_totals(training.get("metrics", {}))
+        for period, key in period_keys(day).items():
+            group = sums.setdefault((training["user_id"], period, key, training["type"]), dict.fromkeys(totals, 0))
+            for field, value in totals.items():
+                group[field] += value * sign
+    return [
+        UpdateOne(
+            {"user_id": user_id, "period": period, "period_key": key, "type": training_type},
+            {"$inc": totals},
+            upsert=True
+        )
+        for (user_id, period, key, training_type), totals in sums.items()
+    ]
+
+def rollup_summary_filter(user_id, day=None):
+    """Filtr jednego odczytu ekranu statystyk: bieżący tydzień, miesiąc i cały okres.
+    Oba $in dają w indeksie tylko punktowe zakresy, niezależnie od długości historii."""
+    keys = period_keys(day or datetime.now())
+    return {
+        "user_id": user_id,
+        "period": {"$in": list(keys)},
+        "period_key": {"$in": list(keys.values())}
+    }
+
+def rebuild_pipeline(rebuilt_at, match=None):
+    """Agregacja licząca wszystkie rollupy w jednym przebiegu po treningach"""
+    # $toDate obsługuje oba formaty pola date: string "RRRR-MM-DD" i datę BSON
+    date = {"$toDate": "$date"}
+    return [
+        {"$match": match or {}},
+        {"$project": {
+            "user_id": 1,
+            "type": 1,
+            "minutes": {"$ifNull": ["$metrics.duration_min", 0]},
+            "kcal": {"$ifNull": ["$metrics.calories_burned", 0]},
+            "distance_km": {"$ifNull": [
+                "$metrics.distance_km",
+                {"$divide": [{"$ifNull": ["$metrics.distance_m", 0]}, 1000]}
+            ]},
+            "periods": [
+                {"period": "week", "period_key": {"$dateToString": {"date": date, "format": "%G-W%V"}}},
+                {"period": "month", "period_key": {"$dateToString": {"date": date, "format": "%Y-%m"}}},
+                {"period": "all", "period_key": "all"}
+            ]
+        }},
+        {"$unwind": "$periods"},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "period": "$periods.period",
+                "period_key": "$periods.period_key",
+                "type": "$type"
+            },
+            "count": {"$sum": 1},
+            "minutes": {"$sum": "$minutes"},
+            "kcal": {"$sum": "$kcal"},
+            "distance_km": {"$sum": "$distance_km"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "period": "$_id.period",
+            "period_key": "$_id.period_key",
+            "type": "$_id.type",
+            "count": 1,
+            "minutes": 1,
+            "kcal": 1,
+            "distance_km": 1,
+            "rebuilt_at": {"$literal": rebuilt_at}
+        }},
+        {"$merge": {
+            "into": ROLLUPS_COLLECTION,
+            "on": ROLLUP_KEY_FIELDS,
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+def stale_rollups_filter(rebuilt_at, match=None):
+    """Rollupy nietknięte przez przebudowę z `rebuilt_at` - także te utworzone przyrostowo ($inc z upsert),
+    które nie mają pola rebuilt_at"""
+    return {**(match or {}), "$or": [
+        {"rebuilt_at": {"$lt": rebuilt_at}},
+        {"rebuilt_at": {"$exists": False}}
+    ]}
+
+def user_stats_pipeline(match=None):
+    """Przelicz users.stats z rollupów "all" (importer i generator ich nie wypełniają)"""
+    return [
+        {"$match": {**(match or {}), "period": "all"}},
+        {"$group": {
+            "_id": "$user_id",
+            "total_trainings": {"$sum": "$count"},
+            "total_calories": {"$sum": "$kcal"},
+            "total_minutes": {"$sum": "$minutes"}
+        }},
+        {"$project": {
+            "stats": {
+                "total_trainings": "$total_trainings",
+                "total_calories": "$total_calories",
+                "total_minutes": "$total_minutes"
+            }
+        }},
+        {"$merge": {
+            "into": "users",
+            "on": "_id",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard"
+        }}
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Przeliczenie rollupów statystyk treningowych")
+    parser.add_argument("--user", default=None, help="przelicz tylko jednego użytkownika (user_id)")
+    args = parser.parse_args()
+
+    from training_diary import rebuild_rollups
+    rebuild_rollups(args.user)
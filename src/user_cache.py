@@ -0,0 +1,102 @@
+import argparse
+import os
+
+from bson import json_util
+
+# Cache wyników analiz użytkownika (statystyki, intensywność cardio, porównania treningów)
+# w Redis, z unieważnianiem przez wersję zamiast kasowania kluczy:
+#
+#   cache:user:{id}:version                      - licznik zmian użytkownika (INCR przy zapisie treningu)
+#   cache:generation                             - licznik globalny (przebudowy, import, usuwanie danych)
+#   cache:user:{id}:{generacja}.{wersja}:{nazwa} - wynik (JSON rozszerzony BSON, TTL CACHE_TTL)
+#
+# Zapis treningu podbija wersję w tym samym skrypcie/pipeline co pozostałe efekty w Redis,
+# więc wszystkie wpisy użytkownika przestają być czytane naraz, a stare wygasają same.
+# Odczyt to jeden skrypt Lua: wersja + wpis + liczniki trafień. Przy chybieniu tylko jeden
+# klient dostaje blokadę i liczy wynik, pozostali czekają na jego wpis (bez lawiny zapytań
+# do MongoDB). DIARY_CACHE=0 wyłącza odczyt z cache (np. przy debugowaniu zapytań).
+
+ENABLED = os.environ.get("DIARY_CACHE", "1") != "0"
+CACHE_TTL = int(os.environ.get("DIARY_CACHE_TTL", 600))
+# Czas blokady liczenia wyniku; tyle najdłużej czekają pozostali klienci
+LOCK_MS = int(os.environ.get("DIARY_CACHE_LOCK_MS", 3000))
+WAIT_INTERVAL = 0.05
+CACHE_PREFIX = "cache:"
+GENERATION_KEY = "cache:generation"
+STATS_KEY = "cache:stats"  # hash: {nazwa}:hits / {nazwa}:misses / {nazwa}:waits
+
+def version_key(user_id):
+    return f"cache:user:{user_id}:version"
+
+def user_pattern(user_id):
+    """Wzorzec SCAN wszystkich kluczy cache użytkownika"""
+    return f"cache:user:{user_id}:*"
+
+def entry_key(user_id, stamp, name):
+    return f"cache:user:{user_id}:{stamp}:{name}"
+
+# === ODCZYT (JEDEN ROUND TRIP) ===
+# KEYS: wersja użytkownika, generacja, statystyki
+# ARGV: prefiks wpisu ("cache:user:{id}:"), nazwa, czas blokady w ms
+# Zwraca {znacznik wersji, wpis albo '', 1 jeśli ten klient ma liczyć wynik}
+CACHE_LOOKUP_SCRIPT = """
+local stamp = (redis.call('GET', KEYS[2]) or '0') .. '.' .. (redis.call('GET', KEYS[1]) or '0')
+local key = ARGV[1] .. stamp .. ':' .. ARGV[2]
+local value = redis.call('GET', key)
+if value then
+    redis.call('HINCRBY', KEYS[3], ARGV[2] .. ':hits', 1)
+    return {stamp, value, 0}
+end
+redis.call('HINCRBY', KEYS[3], ARGV[2] .. ':misses', 1)
+local locked = redis.call('SET', key .. ':lock', '1', 'NX', 'PX', ARGV[3])
+if not locked then
+    redis.call('HINCRBY', KEYS[3], ARGV[2] .. ':waits', 1)
+end
+return {stamp, '', locked and 1 or 0}
+"""
+
+def lookup_call(name, user_id):
+    user_id = str(user_id)
+    keys = [version_key(user_id), GENERATION_KEY, STATS_KEY]
+    return keys, [f"cache:user:{user_id}:", name, LOCK_MS]
+
+def dumps(value):
+    """JSON rozszerzony BSON - ObjectId i daty wracają jako te same typy"""
+    return json_util.dumps(value)
+
+def loads(value):
+    return json_util.loads(value)
+
+# === STATYSTYKI ===
+def parse_stats(raw):
+    """{nazwa: {hits, misses, waits, hit_ratio}} z hasha cache:stats"""
+    stats = {}
+    for field, count in raw.items():
+        name, counter = field.rsplit(":", 1)
+        stats.setdefault(name, {"hits": 0, "misses": 0, "waits": 0})[counter] = int(count)
+    for row in stats.values():
+        total = row["hits"] + row["misses"]
+        row["hit_ratio"] = row["hits"] / total if total else 0.0
+    return stats
+
+def print_stats(stats):
+    if not stats:
+        print("Brak statystyk cache.")
+        return
+    print(f"{'wynik':<40} {'trafienia':>10} {'chybienia':>10} {'czekania':>10} {'skuteczność':>12}")
+    for name, row in sorted(stats.items()):
+        print(f"{name:<40} {row['hits']:>10} {row['misses']:>10} {row['waits']:>10} {row['hit_ratio']:>11.1%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statystyki i unieważnianie cache analiz użytkownika")
+    parser.add_argument("--reset-stats", action="store_true", help="wyzeruj liczniki trafień")
+    parser.add_argument("--invalidate", action="store_true", help="unieważnij cache wszystkich użytkowników")
+    args = parser.parse_args()
+
+    import training_diary
+    if args.invalidate:
+        training_diary.invalidate_all_caches()
+        print("Cache unieważniony.")
+    if args.reset_stats:
+        training_diary.redis_client.delete(STATS_KEY)
+    print_stats(training_diary.get_cache_stats())
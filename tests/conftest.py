@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Moduły aplikacji są płaskimi plikami w src/ i importują się nawzajem po nazwie
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,50 @@
+import random
+from datetime import date, timedelta
+
+import fakeredis
+from bson import ObjectId
+
+import activity_calendar
+import diary_queries
+
+
+def add(redis_client, user_id, day):
+    keys, args, number = diary_queries.side_effects_call(user_id, {"date": day.isoformat()}, ranked=False)
+    result = redis_client.eval(diary_queries.TRAINING_SIDE_EFFECTS_SCRIPT, len(keys), *keys, *args)
+    return diary_queries.parse_side_effects(result, number)
+
+
+def test_out_of_order_inserts_give_the_same_streaks():
+    redis_client = fakeredis.FakeRedis()
+    user_id = ObjectId()
+    today = date.today()
+    # 70 dni bez przerwy (przez granicę słów 64-bitowych), luka, potem 5 dni do dziś
+    days = [today - timedelta(days=n) for n in range(5)] + [today - timedelta(days=n) for n in range(10, 80)]
+    random.Random(6).shuffle(days)
+    for day in days:
+        effects = add(redis_client, user_id, day)
+
+    assert effects["streak"] == 5
+    assert effects["best"] == 70
+    bits = activity_calendar.bitmap_to_int(redis_client.get(activity_calendar.activity_key(str(user_id))))
+    assert activity_calendar.streak_summary(bits, today) == {"current": 5, "best": 70}
+
+
+def test_back_dated_training_joins_two_runs():
+    redis_client = fakeredis.FakeRedis()
+    user_id = ObjectId()
+    today = date.today()
+    for n in [0, 1, 2, 4, 5]:
+        add(redis_client, user_id, today - timedelta(days=n))
+
+    effects = add(redis_client, user_id, today - timedelta(days=3))
+
+    assert effects["streak"] == 6
+    assert effects["best"] == 6
+    assert effects["new_record"]
+
+
+def test_longest_run_across_words():
+    assert activity_calendar.longest_run(0) == 0
+    assert activity_calendar.longest_run(((1 << 130) - 1) << 60) == 130
+    assert activity_calendar.longest_run(((1 << 3) - 1) | (((1 << 64) - 1) << 200)) == 64
@@ -0,0 +1,46 @@
+import asyncio
+from datetime import date
+
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from bson import ObjectId
+
+import activity_feed
+import diary_service
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(diary_service, "redis_client", client)
+    monkeypatch.setattr(diary_service, "_lua_scripts", {})
+    return client
+
+
+def entry(user_id):
+    training = {"_id": ObjectId(), "user_id": user_id, "date": date.today().isoformat(), "type": "bieganie"}
+    return activity_feed.make_entry(training)
+
+
+def test_backfill_skips_popular_authors(redis_client):
+    reader, popular_author = str(ObjectId()), str(ObjectId())
+
+    async def scenario():
+        await redis_client.rpush(activity_feed.outbox_key(reader), entry(reader))
+        await redis_client.rpush(activity_feed.outbox_key(popular_author), entry(popular_author))
+        await redis_client.sadd(activity_feed.POPULAR_KEY, popular_author)
+        await diary_service.backfill_friend_feeds(reader, popular_author)
+        return (await redis_client.lrange(activity_feed.feed_key(reader), 0, -1),
+                await redis_client.lrange(activity_feed.feed_key(popular_author), 0, -1))
+
+    reader_feed, author_feed = asyncio.run(scenario())
+    # Wpisy popularnego autora są doklejane przy odczycie - nie zajmują miejsca w feedzie czytelnika
+    assert reader_feed == []
+    assert [activity_feed.parse_entry(e)["user_id"] for e in author_feed] == [reader]
+
+
+def test_backfill_calls_without_popular_authors_merge_both_ways():
+    calls = activity_feed.backfill_calls("a", "b")
+    assert [keys for keys, _ in calls] == [[activity_feed.feed_key("a"), activity_feed.outbox_key("b")],
+                                           [activity_feed.feed_key("b"), activity_feed.outbox_key("a")]]
@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+
+import fakeredis
+import mongomock
+import pytest
+from bson import ObjectId
+
+import activity_feed
+import diary_queries
+import training_rollups
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["training_diary"]
+
+
+def batch(user_id, kcal=(300, 200)):
+    today = date.today()
+    return {user_id: [
+        {"dedup_key": f"zegarek-{i}", "date": (today - timedelta(days=i)).isoformat(), "type": "bieganie",
+         "metrics": {"duration_min": 30, "calories_burned": value}}
+        for i, value in enumerate(kcal)
+    ]}
+
+
+def ids_in(collection, docs):
+    return {d["_id"] for d in collection.find({"_id": {"$in": [doc["_id"] for doc in docs]}})}
+
+
+def write_batch(db, docs, timeseries=True):
+    """Transakcja paczki (jak write() w add_trainings_bulk_multi): znaczniki, users.stats i rollupy.
+    Zwraca nowe treningi i treningi do efektów w Redis."""
+    applied = ids_in(db[diary_queries.STATS_APPLIED_COLLECTION], docs)
+    if timeseries:
+        new_docs = diary_queries.pending_stats(docs, ids_in(db["trainings"], docs), applied)
+    else:
+        existing = ids_in(db["trainings"], docs)
+        new_docs = [doc for doc in docs if doc["_id"] not in existing]
+        if new_docs:
+            db["trainings"].insert_many(new_docs)
+    if new_docs:
+        db[diary_queries.STATS_APPLIED_COLLECTION].insert_many(diary_queries.stats_applied_markers(new_docs))
+        db["users"].bulk_write(diary_queries.user_stats_ops(new_docs))
+        db[training_rollups.ROLLUPS_COLLECTION].bulk_write(training_rollups.aggregated_rollup_ops(new_docs))
+    return new_docs, diary_queries.pending_effects(docs, new_docs, applied)
+
+
+def apply_effects(db, redis_client, pending):
+    """Pipeline efektów w Redis po transakcji, potem usunięcie znaczników"""
+    pipe = redis_client.pipeline(transaction=False)
+    plan = diary_queries.queue_bulk_side_effects(pipe, pending)
+    activity_feed.queue_fan_out(pipe, pending)
+    effects = diary_queries.parse_bulk_side_effects(plan, pipe.execute())
+    db[diary_queries.STATS_APPLIED_COLLECTION].delete_many({"_id": {"$in": [doc["_id"] for doc in pending]}})
+    return effects
+
+
+def test_retry_after_failed_timeseries_insert_skips_applied_stats(db):
+    user_id = ObjectId()
+    db["users"].insert_one({"_id": user_id})
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    trainings = batch(user_id)
+
+    # Pierwsza próba: transakcja zatwierdzona, zapis do kolekcji time-series się nie udał
+    first, _ = write_batch(db, diary_queries.prepare_bulk(trainings, True))
+    assert len(first) == 2
+
+    # Ponowienie tej samej paczki: te same _id z dedup_key, statystyki mają znaczniki
+    docs = diary_queries.prepare_bulk(trainings, True)
+    assert [doc["_id"] for doc in docs] == [doc["_id"] for doc in first]
+    new_docs, pending = write_batch(db, docs)
+    assert new_docs == []
+    db["trainings"].insert_many(docs)
+    # Efekty w Redis pierwszej próby nie zostały wykonane - ponowienie je odtwarza
+    effects = apply_effects(db, redis_client, pending)
+
+    stats = db["users"].find_one({"_id": user_id})["stats"]
+    assert stats == {"total_trainings": 2, "total_calories": 500, "total_minutes": 60}
+    assert effects[user_id]["calories"] == 500
+    assert db["trainings"].count_documents({}) == 2
+    assert db[diary_queries.STATS_APPLIED_COLLECTION].count_documents({}) == 0
+    # Kolejne ponowienie: treningi zapisane, znaczników już nie ma - nadal nic do policzenia
+    assert write_batch(db, diary_queries.prepare_bulk(trainings, True)) == ([], [])
+
+
+def test_retry_after_crash_before_redis_replays_effects_once(db):
+    user_id = ObjectId()
+    db["users"].insert_one({"_id": user_id})
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    trainings = batch(user_id)
+
+    # Transakcja zatwierdzona (treningi w zwykłej kolekcji), proces przerwany przed pipeline Redis
+    write_batch(db, diary_queries.prepare_bulk(trainings, False), timeseries=False)
+    assert redis_client.zscore(diary_queries.calories_key(), str(user_id)) is None
+
+    new_docs, pending = write_batch(db, diary_queries.prepare_bulk(trainings, False), timeseries=False)
+    assert new_docs == []
+    effects = apply_effects(db, redis_client, pending)
+
+    assert effects[user_id]["calories"] == 500
+    assert effects[user_id]["streak"] == 2
+    assert db["users"].find_one({"_id": user_id})["stats"]["total_calories"] == 500
+    # Efekty wykonane, znaczniki usunięte - kolejne ponowienie niczego nie powtarza
+    assert write_batch(db, diary_queries.prepare_bulk(trainings, False), timeseries=False) == ([], [])
+
+
+def test_retried_batch_queues_side_effects_only_for_new_trainings(db):
+    user_id = ObjectId()
+    db["users"].insert_one({"_id": user_id})
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    # Wcześniejsza synchronizacja zapisała pierwszy trening, przerwana próba nie zapisała niczego
+    stored = diary_queries.prepare_bulk(batch(user_id, (300,)), True)
+    db["trainings"].insert_many(stored)
+
+    new_docs, pending = write_batch(db, diary_queries.prepare_bulk(batch(user_id), True))
+    assert [doc["dedup_key"] for doc in new_docs] == ["zegarek-1"]
+    assert pending == new_docs
+
+    effects = apply_effects(db, redis_client, pending)
+
+    assert effects[user_id]["position"] == 1
+    assert effects[user_id]["calories"] == 200
+    assert effects[user_id]["streak"] == 1  # wczorajszy trening podtrzymuje serię
+    assert effects[user_id]["best"] == 1
+    summary = diary_queries.bulk_summary(batch(user_id), stored + new_docs, new_docs, effects)
+    assert summary[user_id]["inserted"] == 1
+    assert summary[user_id]["duplicates"] == 1
@@ -0,0 +1,184 @@
+from datetime import date, timedelta
+
+import fakeredis
+import mongomock
+import pytest
+from bson import ObjectId
+
+import deletion_of_data
+import diary_queries
+import training_rollups
+
+
+class FakeSession:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def with_transaction(self, callback):
+        return callback(self)
+
+
+class FakeClient:
+    def __init__(self, version):
+        self.version = version
+
+    def start_session(self):
+        return FakeSession()
+
+    def server_info(self):
+        return {"versionArray": self.version}
+
+
+class RecordingCollection:
+    """Kolekcja zapamiętująca filtry delete_many (time-series przyjmuje tylko metaField przed 7.0)
+    i sortowania find; `fail_deletes` - tyle kolejnych delete_many kończy się błędem"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.deletes = []
+        self.sorts = []
+        self.fail_deletes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def find(self, *args, **kwargs):
+        collection = self
+
+        class Cursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def __getattr__(self, name):
+                return getattr(self.cursor, name)
+
+            def __iter__(self):
+                return iter(self.cursor)
+
+            def sort(self, *sort_args):
+                collection.sorts.append(sort_args[0])
+                return Cursor(self.cursor.sort(*sort_args))
+
+            def limit(self, count):
+                return Cursor(self.cursor.limit(count))
+
+        return Cursor(self.collection.find(*args, **kwargs))
+
+    def delete_many(self, match, *args, **kwargs):
+        if self.fail_deletes:
+            self.fail_deletes -= 1
+            raise ConnectionError("połączenie zerwane")
+        self.deletes.append(match)
+        return self.collection.delete_many(match, *args, **kwargs)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    mongomock.ignore_feature("session")
+    db = mongomock.MongoClient()["training_diary"]
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    trainings = RecordingCollection(db["trainings"])
+    patches = {
+        "client": FakeClient([7, 0, 2, 0]), "db": db, "redis_client": redis_client,
+        "users_col": db["users"], "trainings_col": trainings, "friends_col": db["friends"],
+        "rollups_col": db["training_rollups"], "leaderboard_archive_col": db["leaderboard_archive"],
+        "stats_applied_col": db[diary_queries.STATS_APPLIED_COLLECTION],
+        "pending_deletes_col": db[diary_queries.PENDING_DELETES_COLLECTION],
+        "trainings_layout": lambda: "collection", "revoke_sessions": lambda user_id: 0,
+        "run_lua": lambda source, keys=(), args=(): redis_client.eval(source, len(keys), *keys, *args),
+    }
+    for name, value in patches.items():
+        monkeypatch.setattr(deletion_of_data, name, value)
+    return patches
+
+
+def add(store, user_id, day, kcal):
+    training = {"_id": ObjectId(), "user_id": user_id, "date": day.isoformat(), "type": "bieganie",
+                "metrics": {"duration_min": 30, "calories_burned": kcal}}
+    store["trainings_col"].insert_one(training)
+    store["rollups_col"].bulk_write(training_rollups.rollup_update_ops(training))
+    store["users_col"].update_one({"_id": user_id}, diary_queries.user_stats_increment(training))
+
+
+def test_retention_reverts_stats_and_rollups(store):
+    user_id = ObjectId()
+    store["users_col"].insert_one(diary_queries.new_user_document("a", "a@x", "h", 30, "m") | {"_id": user_id})
+    today = date.today()
+    add(store, user_id, today, 300)
+    add(store, user_id, today - timedelta(days=800), 500)
+    add(store, user_id, today - timedelta(days=790), 100)
+
+    deleted = deletion_of_data.delete_trainings_in_range(None, today - timedelta(days=365), batch_size=1)
+
+    assert deleted == 2
+    assert store["users_col"].find_one({"_id": user_id})["stats"] == {
+        "total_trainings": 1, "total_calories": 300, "total_minutes": 30}
+    rollups = list(store["rollups_col"].find({"user_id": user_id}))
+    assert sorted(r["period"] for r in rollups) == ["all", "month", "week"]
+    assert all(r["count"] == 1 for r in rollups)
+
+
+def test_account_deletion_on_timeseries_filters_by_meta_field(store, monkeypatch):
+    monkeypatch.setattr(deletion_of_data, "trainings_layout", lambda: "timeseries")
+    user_id, other = ObjectId(), ObjectId()
+    for owner in (user_id, other):
+        store["users_col"].insert_one({"_id": owner, "username": str(owner)})
+        add(store, owner, date.today(), 100)
+
+    deletion_of_data.delete_accounts([str(user_id)])
+
+    assert store["trainings_col"].deletes == [{"user_id": user_id}]
+    assert store["trainings_col"].count_documents({}) == 1
+
+
+def test_account_deletion_pages_by_user_id_without_sort(store):
+    user_id, other = ObjectId(), ObjectId()
+    for owner in (user_id, other):
+        store["users_col"].insert_one({"_id": owner, "username": str(owner)})
+        for days in range(3):
+            add(store, owner, date.today() - timedelta(days=days), 100)
+
+    deletion_of_data.delete_accounts([str(user_id)], batch_size=2)
+
+    assert store["trainings_col"].sorts == []
+    assert len(store["trainings_col"].deletes) == 2
+    assert store["trainings_col"].count_documents({}) == 3
+    assert store["rollups_col"].count_documents({"user_id": user_id}) == 0
+
+
+def test_retention_on_timeseries_requires_mongodb_7(store, monkeypatch):
+    monkeypatch.setattr(deletion_of_data, "trainings_layout", lambda: "timeseries")
+    monkeypatch.setattr(deletion_of_data, "client", FakeClient([6, 0, 14, 0]))
+    with pytest.raises(RuntimeError, match="MongoDB 7.0"):
+        deletion_of_data.delete_trainings_in_range(None, date.today())
+    assert store["trainings_col"].deletes == []
+
+
+def test_timeseries_retention_pages_by_date_and_resumes_after_crash(store, monkeypatch):
+    monkeypatch.setattr(deletion_of_data, "trainings_layout", lambda: "timeseries")
+    user_id = ObjectId()
+    store["users_col"].insert_one({"_id": user_id, "username": "a"})
+    today = date.today()
+    add(store, user_id, today, 300)
+    for days in (800, 790, 780):
+        add(store, user_id, today - timedelta(days=days), 100)
+
+    # Przerwanie po transakcji korekty, przed usunięciem treningów time-series
+    store["trainings_col"].fail_deletes = 1
+    with pytest.raises(ConnectionError):
+        deletion_of_data.delete_trainings_in_range(None, today - timedelta(days=365), batch_size=2)
+    assert store["users_col"].find_one({"_id": user_id})["stats"]["total_calories"] == 300 + 100
+    assert store["trainings_col"].count_documents({}) == 4
+
+    deleted = deletion_of_data.delete_trainings_in_range(None, today - timedelta(days=365), batch_size=2)
+
+    assert deleted == 3
+    assert store["users_col"].find_one({"_id": user_id})["stats"] == {
+        "total_trainings": 1, "total_calories": 300, "total_minutes": 30}
+    assert store["trainings_col"].count_documents({}) == 1
+    assert store["pending_deletes_col"].count_documents({}) == 0
+    # Paczki w kolejności pola czasu - bez sortowania po samym _id
+    assert store["trainings_col"].sorts and all(sort[0] == ("date", 1) for sort in store["trainings_col"].sorts)
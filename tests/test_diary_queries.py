@@ -0,0 +1,22 @@
+import mongomock
+from bson import ObjectId
+
+import diary_queries
+
+
+def test_id_batches_continue_after_last_id_across_types():
+    collection = mongomock.MongoClient().db["trainings"]
+    object_ids = sorted(ObjectId() for _ in range(3))
+    collection.insert_many([{"_id": _id, "type": "bieganie"} for _id in object_ids]
+                           + [{"_id": f"uuid-{i}", "type": "bieganie"} for i in range(2)]
+                           + [{"_id": "uuid-x", "type": "siłownia"}])
+    seen = []
+    find = collection.find
+    collection.find = lambda query, *args, **kwargs: seen.append(query) or find(query, *args, **kwargs)
+
+    batches = list(diary_queries.iter_id_batches(collection, {"type": "bieganie"}, 2, hint=[("_id", 1)]))
+
+    # Stringi są przed ObjectId w porządku BSON
+    assert batches == [["uuid-0", "uuid-1"], object_ids[:2], object_ids[2:]]
+    assert {"_id": {"$gt": "uuid-1"}} in seen[1]["$and"]
+    assert {"_id": {"$gt": object_ids[1]}} in seen[3]["$and"]
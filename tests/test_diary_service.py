@@ -0,0 +1,28 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import diary_service
+
+
+def test_run_from_many_threads_uses_one_event_loop(monkeypatch):
+    async def no_redis():
+        return False
+
+    async def current_loop():
+        await asyncio.sleep(0.01)
+        return asyncio.get_running_loop()
+
+    monkeypatch.setattr(diary_service, "check_redis", no_redis)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        loops = set(pool.map(lambda _: diary_service.run(current_loop()), range(16)))
+    assert len(loops) == 1
+
+
+def test_run_inside_event_loop_raises():
+    async def nested():
+        return diary_service.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(nested())
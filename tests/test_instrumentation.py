@@ -0,0 +1,56 @@
+import asyncio
+import types
+
+import pytest
+
+import instrumentation
+
+
+@pytest.fixture
+def service():
+    module = types.ModuleType("fake_service")
+
+    async def side_effects(user_id):
+        instrumentation._count_round_trip("EVALSHA")
+        await asyncio.sleep(0)
+
+    async def add_training(user_id):
+        instrumentation._count_round_trip("HSET")
+        await module.side_effects(user_id)
+
+    async def get_stats(user_id):
+        await asyncio.sleep(0)
+        instrumentation._count_round_trip("GET")
+
+    def run(coro):
+        return asyncio.run(coro)
+
+    for func in (side_effects, add_training, get_stats, run):
+        func.__module__ = module.__name__
+        setattr(module, func.__name__, func)
+    instrumentation.reset()
+    instrumentation.instrument_module(module)
+    yield module
+    instrumentation.reset()
+
+
+def test_coroutines_are_timed_with_nested_round_trips(service):
+    service.run(service.add_training("u1"))
+
+    metrics = instrumentation.snapshot()
+    assert metrics["add_training"]["calls"] == 1
+    assert metrics["add_training"]["redis_round_trips"] == 2
+    assert metrics["side_effects"]["redis_round_trips"] == 1
+    assert "run" not in metrics
+
+
+def test_concurrent_operations_do_not_share_the_stack(service):
+    async def both():
+        await asyncio.gather(service.add_training("u1"), service.get_stats("u2"))
+
+    asyncio.run(both())
+
+    metrics = instrumentation.snapshot()
+    assert metrics["add_training"]["redis_round_trips"] == 2
+    assert metrics["get_stats"]["redis_round_trips"] == 1
+    assert instrumentation._current_calls() == ()
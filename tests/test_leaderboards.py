@@ -0,0 +1,33 @@
+from datetime import date
+
+import pytest
+
+import leaderboards
+
+
+@pytest.mark.parametrize("day, week", [
+    (date(2024, 12, 30), "2025-W01"),
+    (date(2025, 12, 29), "2026-W01"),
+    (date(2021, 1, 1), "2020-W53"),
+    (date(2027, 1, 3), "2026-W53"),
+])
+def test_period_keys_use_the_iso_year_around_new_year(day, week):
+    keys = leaderboards.period_keys(day)
+    assert keys["week"] == week
+    assert keys["month"] == day.strftime("%Y-%m")
+    assert keys["day"] == day.isoformat()
+    first, last = leaderboards.period_bounds("week", week)
+    assert first <= day <= last
+
+
+@pytest.mark.parametrize("period_key, period", [
+    ("2025-06-04", "day"), ("2025-W23", "week"), ("2020-W53", "week"), ("2025-06", "month"), ("all", "all"),
+])
+def test_valid_period_keys(period_key, period):
+    assert leaderboards.validate_period_key(period_key) == period
+
+
+@pytest.mark.parametrize("period_key", ["2025-W60", "2025-13", "2025-02-30", "2025-W5", "2025-W00", "2021-W53", "abc"])
+def test_invalid_period_keys_raise_value_error(period_key):
+    with pytest.raises(ValueError):
+        leaderboards.validate_period_key(period_key)
@@ -0,0 +1,42 @@
+import mongomock
+import pytest
+
+import migrate_training_dates
+
+
+@pytest.fixture
+def source(monkeypatch):
+    db = mongomock.MongoClient()["training_diary"]
+    monkeypatch.setattr(migrate_training_dates, "db", db)
+    monkeypatch.setattr(migrate_training_dates, "trainings_col", db["trainings"])
+    db["trainings"].insert_many([
+        {"_id": f"md5-{i:02d}", "user_id": f"u{i % 3}", "date": f"2025-06-{i + 1:02d}", "type": "bieganie",
+         "metrics": {"duration_min": 30, "distance_km": 6}}
+        for i in range(10)
+    ])
+    db.create_collection("trainings_ts")
+    return db
+
+
+def test_resumed_copy_skips_batch_written_before_checkpoint(source, tmp_path):
+    # Awaria po zapisie pierwszej paczki, a przed zapisem punktu kontrolnego
+    source["trainings_ts"].insert_many(
+        [migrate_training_dates.timeseries_document(d) for d in source["trainings"].find().sort("_id").limit(4)])
+
+    copied = migrate_training_dates.copy_to_timeseries("trainings_ts", 4, str(tmp_path / "checkpoint.json"))
+
+    assert copied == 6
+    assert source["trainings_ts"].count_documents({}) == 10
+    assert source["trainings_ts"].find_one({"_id": "md5-09"})["intensity_description"] == "wysokie tempo"
+
+
+def test_copy_fails_when_trainings_were_added_meanwhile(source, tmp_path):
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text('{"last_id": "md5-04"}', encoding="utf-8")
+    source["trainings_ts"].insert_many(
+        [migrate_training_dates.timeseries_document(d) for d in source["trainings"].find().sort("_id").limit(5)])
+    # Import w trakcie kopii: _id z md5 przed punktem kontrolnym
+    source["trainings"].insert_one({"_id": "md5-00a", "user_id": "u0", "date": "2025-06-20", "type": "yoga"})
+
+    with pytest.raises(RuntimeError, match="nie były wstrzymane"):
+        migrate_training_dates.copy_to_timeseries("trainings_ts", 4, str(checkpoint))
@@ -0,0 +1,154 @@
+import json
+
+import fakeredis
+import pytest
+from bson import ObjectId
+from redis.exceptions import ConnectionError as RedisConnectionError, ResponseError
+
+import training_events
+
+
+class MemoryTokenStore:
+    def __init__(self):
+        self.token = None
+
+    def load(self):
+        return self.token
+
+    def save(self, token):
+        self.token = token
+
+    def clear(self):
+        self.token = None
+
+
+def change(user_id, training_type="bieganie"):
+    return {"fullDocument": {"_id": ObjectId(), "user_id": user_id, "type": training_type, "date": "2025-06-03"}}
+
+
+def consumer(sinks, store=None):
+    return training_events.ChangeStreamConsumer(None, sinks, store or MemoryTokenStore(), retry_delay=0)
+
+
+def test_format_event_stringifies_ids():
+    user_id = ObjectId()
+    event = training_events.format_event(change(user_id))
+    assert event["user_id"] == str(user_id)
+    assert all(isinstance(value, str) for value in event.values())
+
+
+def test_redis_sinks_accept_registered_users():
+    client = fakeredis.FakeRedis(decode_responses=True)
+    pubsub = client.pubsub()
+    pubsub.subscribe("events:trainings")
+    pubsub.get_message(timeout=1)
+    events = [training_events.format_event(change(ObjectId()))]
+    training_events.RedisStreamSink(client).write(events)
+    training_events.RedisPubSubSink(client).write(events)
+    assert client.xlen("events:trainings") == 1
+    message = pubsub.get_message(timeout=1)
+    assert json.loads(message["data"])["user_id"] == events[0]["user_id"]
+
+
+class RejectingSink:
+    """Ujście odrzucające zdarzenia jednego typu (jak DataError/TypeError w Redis)"""
+
+    def __init__(self, rejected_type):
+        self.rejected_type = rejected_type
+        self.written = []
+
+    def write(self, events):
+        if any(event["type"] == self.rejected_type for event in events):
+            raise TypeError("Object of type X is not JSON serializable")
+        self.written.extend(events)
+
+    def close(self):
+        pass
+
+
+def test_rejected_event_is_skipped_and_token_saved():
+    sink = RejectingSink("yoga")
+    store = MemoryTokenStore()
+    events_consumer = consumer([sink], store)
+    events_consumer.buffer = [training_events.format_event(change("u-1", t)) for t in ("bieganie", "yoga", "rower")]
+    events_consumer.pending_token = {"_data": "token-1"}
+    events_consumer.flush()
+    assert [event["type"] for event in sink.written] == ["bieganie", "rower"]
+    assert events_consumer.skipped == 1
+    assert store.token == {"_data": "token-1"}
+
+
+class FlakySink:
+    def __init__(self, failures):
+        self.failures = failures
+        self.written = []
+
+    def write(self, events):
+        if self.failures:
+            self.failures -= 1
+            raise RedisConnectionError("Connection refused")
+        self.written.extend(events)
+
+    def close(self):
+        pass
+
+
+def test_transient_sink_errors_are_retried():
+    sink = FlakySink(failures=2)
+    events_consumer = consumer([sink])
+    events_consumer.buffer = [training_events.format_event(change("u-1"))]
+    events_consumer.flush()
+    assert len(sink.written) == 1
+    assert events_consumer.skipped == 0
+
+
+def test_stopped_consumer_does_not_save_token_on_outage():
+    store = MemoryTokenStore()
+    events_consumer = consumer([FlakySink(failures=10)], store)
+    events_consumer.stop()
+    events_consumer.buffer = [training_events.format_event(change("u-1"))]
+    events_consumer.pending_token = {"_data": "token-2"}
+    with pytest.raises(RedisConnectionError):
+        events_consumer.flush()
+    assert store.token is None
+
+
+class RejectingPipeline:
+    """Pipeline, w którym serwer odrzuca XADD zdarzeń jednego typu, a pozostałe wykonuje"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def xadd(self, key, event, **kwargs):
+        self.commands.append(event)
+
+    def execute(self, raise_on_error=True):
+        results = []
+        for event in self.commands:
+            if event["type"] == self.client.rejected_type:
+                results.append(ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value"))
+            else:
+                self.client.written.append(event)
+                results.append("1-0")
+        if raise_on_error and any(isinstance(result, Exception) for result in results):
+            raise next(result for result in results if isinstance(result, Exception))
+        return results
+
+
+class RejectingClient:
+    def __init__(self, rejected_type):
+        self.rejected_type = rejected_type
+        self.written = []
+
+    def pipeline(self, transaction=True):
+        return RejectingPipeline(self)
+
+
+def test_server_rejected_command_does_not_duplicate_the_rest_of_the_batch():
+    client = RejectingClient("yoga")
+    events_consumer = consumer([training_events.RedisStreamSink(client)])
+    events_consumer.buffer = [training_events.format_event(change("u-1", t)) for t in ("bieganie", "yoga", "rower")]
+    events_consumer.flush()
+    assert [event["type"] for event in client.written] == ["bieganie", "rower"]
+    assert events_consumer.skipped == 1
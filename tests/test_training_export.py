@@ -0,0 +1,95 @@
+from datetime import date, datetime
+
+import mongomock
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from bson import ObjectId
+
+import training_export
+
+
+def training(user_id, day, exercises, training_type="kalistenika"):
+    return {"_id": ObjectId(), "user_id": user_id, "date": day, "type": training_type,
+            "metrics": {"duration_min": 40, "exercises": exercises}}
+
+
+def test_flatten_stringifies_objectid_user():
+    user_id = ObjectId()
+    row, exercises = training_export.flatten_training(
+        training(user_id, "2025-06-03", [{"name": "przysiad", "sets": 3, "reps": 10, "weight": 40}], "siłownia"))
+    assert row["user_id"] == str(user_id)
+    assert exercises[0]["user_id"] == str(user_id)
+    # Wiersze muszą dać się zapisać w kolumnach pa.string()
+    pa.Table.from_pylist([{k: v for k, v in row.items() if k != "week"}], schema=training_export.TRAINING_SCHEMA)
+    pa.Table.from_pylist([{k: v for k, v in e.items() if k != "week"} for e in exercises],
+                         schema=training_export.EXERCISE_SCHEMA)
+
+
+def test_flatten_exercises_as_strings_from_cli():
+    row, exercises = training_export.flatten_training(
+        training(ObjectId(), "2025-06-03", ["pompki", " podciąganie ", "", 7, None]))
+    assert [e["name"] for e in exercises] == ["pompki", "podciąganie"]
+    assert row["exercise_count"] == 2
+    assert row["total_sets"] == 0 and row["volume_kg"] == 0.0
+
+
+def test_flatten_exercises_as_documents():
+    row, exercises = training_export.flatten_training(training("u-1", "2025-06-03", [
+        {"name": "pompki", "sets": 3, "reps": 15},
+        {"name": "dipy", "sets": 2, "reps": 10, "weight": 10},
+    ]))
+    assert row["total_sets"] == 5
+    assert row["total_reps"] == 65
+    assert row["volume_kg"] == 200.0
+    assert exercises[1]["weight"] == 10.0
+
+
+@pytest.fixture
+def trainings(monkeypatch):
+    collection = mongomock.MongoClient()["training_diary"]["trainings"]
+    monkeypatch.setattr(training_export, "trainings_col", collection)
+    return collection
+
+
+def test_export_mixed_documents_and_date_formats(trainings, tmp_path):
+    registered = ObjectId()
+    trainings.insert_many([
+        training(registered, "2025-06-10", ["pompki"]),
+        training("u-1", date(2025, 6, 3).isoformat(), [{"name": "pompki", "sets": 3, "reps": 10}]),
+        {**training(registered, None, []), "date": datetime(2025, 6, 4)},
+        training("u-1", "2025-06-11", [], "bieganie"),
+    ])
+    exported = training_export.export_trainings(str(tmp_path), since="2025-06-02", until="2025-06-15")
+    assert exported["2025-W23"]["trainings"] == 2
+    assert exported["2025-W24"]["trainings"] == 2
+    table = pq.read_table(tmp_path / "trainings" / "week=2025-W24" / "data.parquet")
+    assert str(registered) in table.column("user_id").to_pylist()
+    exercises = pq.read_table(tmp_path / "exercises" / "week=2025-W24" / "data.parquet")
+    assert exercises.column("name").to_pylist() == ["pompki"]
+
+
+def test_export_keeps_one_week_open(trainings, tmp_path, monkeypatch):
+    # Daty w obu formatach i w losowej kolejności wstawiania
+    for day in ["2025-05-20", "2025-06-10", "2025-05-06", "2025-06-03"]:
+        trainings.insert_one(training("u-1", day, []))
+    trainings.insert_one({**training("u-2", None, []), "date": datetime(2025, 5, 13)})
+    open_writers = set()
+    peak = []
+
+    class TrackingWriter(training_export.WeekWriter):
+        def __init__(self, *args):
+            super().__init__(*args)
+            assert self.week not in open_writers and all(week < self.week for week in open_writers | set(peak))
+            open_writers.add(self.week)
+            peak.append(self.week)
+
+        def close(self):
+            open_writers.discard(self.week)
+            return super().close()
+
+    monkeypatch.setattr(training_export, "WeekWriter", TrackingWriter)
+    exported = training_export.export_trainings(str(tmp_path), since="2025-05-05", until="2025-06-15")
+    assert peak == ["2025-W19", "2025-W20", "2025-W21", "2025-W23", "2025-W24"]
+    assert not open_writers
+    assert sum(rows["trainings"] for rows in exported.values()) == 5
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+import mongomock
+from bson import ObjectId
+
+import training_rollups
+
+
+def test_stale_filter_removes_incremental_rollups():
+    rollups = mongomock.MongoClient().db[training_rollups.ROLLUPS_COLLECTION]
+    user_id, other_id = ObjectId(), ObjectId()
+    rebuilt_at = datetime(2026, 5, 4, 12)
+    rollups.insert_many([
+        {"user_id": user_id, "period": "all", "type": "bieg", "rebuilt_at": rebuilt_at},
+        {"user_id": user_id, "period": "all", "type": "rower", "rebuilt_at": rebuilt_at - timedelta(days=1)},
+        # Utworzony przez $inc z upsert po treningu typu, którego już nie ma
+        {"user_id": user_id, "period": "week", "type": "pływanie", "count": 1},
+        {"user_id": other_id, "period": "all", "type": "rower", "count": 2},
+    ])
+
+    rollups.delete_many(training_rollups.stale_rollups_filter(rebuilt_at, {"user_id": user_id}))
+
+    left = sorted((str(d["user_id"]), d["type"]) for d in rollups.find())
+    assert left == sorted([(str(user_id), "bieg"), (str(other_id), "rower")])